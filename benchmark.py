@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Benchmark the report pipeline on synthetic reports
+
+Generates a Markdown report of a chosen shape (headings, tables, code blocks,
+Mermaid diagrams, total size), runs generate_svgs and both PDF converters on
+it, each in a fresh process with the build cache off, and records wall time,
+peak RSS and output size. Results can be saved as a baseline JSON and later
+runs compared against it. Everything runs locally; nothing is downloaded.
+
+--table-scaling times weasyprint's layout of a single table of growing row
+counts, with and without split_blocks chunking, to check that layout time
+per row stays flat.
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from preflight import MissingDependencyError, check_requirements
+
+# Named corpus shapes; any field can be overridden on the command line
+CORPORA = {
+    'small': {'headings': 10, 'tables': 3, 'code_blocks': 3, 'mermaid': 2, 'min_bytes': 0},
+    'medium': {'headings': 60, 'tables': 20, 'code_blocks': 20, 'mermaid': 10, 'min_bytes': 200_000},
+    'large': {'headings': 300, 'tables': 100, 'code_blocks': 100, 'mermaid': 40, 'min_bytes': 2_000_000},
+}
+
+STAGES = ('generate_svgs', 'weasyprint', 'pdfkit')
+
+WORDS = ("developer cost quality review delivery team budget sprint release velocity "
+         "estimate backlog feature defect coverage latency throughput margin hiring "
+         "onboarding contract timeline milestone report analysis").split()
+
+CODE_LANGUAGES = {
+    'python': "def total_cost(hours, rate):\n    return sum(h * rate for h in hours)\n",
+    'javascript': "function totalCost(hours, rate) {\n  return hours.reduce((a, h) => a + h * rate, 0);\n}\n",
+    'bash': "for f in reports/*.md; do\n  python convert_to_pdf_weasyprint.py \"$f\"\ndone\n",
+}
+
+def _sentence(rng, words=12):
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+def _paragraph(rng):
+    return " ".join(_sentence(rng, rng.randint(8, 18)) for _ in range(rng.randint(3, 6)))
+
+def _table(rng, index):
+    columns = rng.randint(3, 6)
+    rows = rng.randint(4, 15)
+    lines = ["| " + " | ".join(f"Column {c + 1}" for c in range(columns)) + " |",
+             "|" + "---|" * columns]
+    for r in range(rows):
+        cells = [f"Item {index}.{r + 1}"] + [f"${rng.randint(100, 99_999):,}" for _ in range(columns - 1)]
+        lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines)
+
+def _code_block(rng, index):
+    language = rng.choice(sorted(CODE_LANGUAGES))
+    body = "".join(CODE_LANGUAGES[language] for _ in range(rng.randint(1, 4)))
+    return f"```{language}\n# example {index}\n{body}```"
+
+def _mermaid_block(rng, index):
+    """A diagram that is not one of the hand-made ones, so it is rendered natively"""
+    kind = index % 3
+    if kind == 0:
+        nodes = rng.randint(3, 8)
+        edges = "\n".join(f"    N{i}[Step {index}.{i}] --> N{i + 1}[Step {index}.{i + 1}]" for i in range(nodes - 1))
+        return f"```mermaid\ngraph LR\n{edges}\n```"
+    if kind == 1:
+        slices = "\n".join(f'    "Share {i}" : {rng.randint(5, 50)}' for i in range(rng.randint(2, 6)))
+        return f'```mermaid\npie title Synthetic split {index}\n{slices}\n```'
+    tasks = "\n".join(f"    Task {i} :t{i}, {'after t' + str(i - 1) if i else '2025-01-01'}, {rng.randint(1, 10)}d"
+                      for i in range(rng.randint(2, 6)))
+    return (f"```mermaid\ngantt\n    title Synthetic plan {index}\n    dateFormat YYYY-MM-DD\n"
+            f"    section Work\n{tasks}\n```")
+
+def generate_report(headings=10, tables=3, code_blocks=3, mermaid=2, min_bytes=0, seed=0):
+    """Return a deterministic synthetic Markdown report of the given shape.
+
+    Tables, code blocks and diagrams are spread across the ## sections;
+    paragraphs are added until the report is at least min_bytes long.
+    """
+    rng = random.Random(seed)
+    headings = max(headings, 1)
+    sections = [[f"## Section {i + 1}: {_sentence(rng, 3)[:-1]}", _paragraph(rng)] for i in range(headings)]
+    for index in range(tables):
+        sections[rng.randrange(headings)].append(_table(rng, index))
+    for index in range(code_blocks):
+        sections[rng.randrange(headings)].append(_code_block(rng, index))
+    for index in range(mermaid):
+        sections[rng.randrange(headings)].append(_mermaid_block(rng, index))
+
+    size = sum(len(block) + 2 for section in sections for block in section)
+    while size < min_bytes:
+        paragraph = _paragraph(rng)
+        sections[rng.randrange(headings)].append(paragraph)
+        size += len(paragraph) + 2
+    body = "\n\n".join("\n\n".join(section) for section in sections)
+    return f"# Synthetic Report\n\n[TOC]\n\n{body}\n"
+
+def generate_table_report(rows, columns=5, seed=0):
+    """Return a report holding one cost table with the given number of body rows"""
+    rng = random.Random(seed)
+    lines = ["# Cost Table", "", _paragraph(rng), "",
+             "| " + " | ".join(f"Column {c + 1}" for c in range(columns)) + " |",
+             "|" + "---|" * columns]
+    for r in range(rows):
+        cells = [f"Item {r + 1}"] + [f"${rng.randint(100, 99_999):,}" for _ in range(columns - 1)]
+        lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines) + "\n"
+
+def _run_layout(rows, split, seed):
+    """Lay out a generated table in this (fresh) process; return (seconds, pages)"""
+    from convert_to_pdf_weasyprint import Converter
+    from split_blocks import DEFAULT_TABLE_ROWS
+
+    converter = Converter(cache=False, table_rows=DEFAULT_TABLE_ROWS if split else 0)
+    html_content = converter.to_html(generate_table_report(rows, seed=seed))
+    start = time.perf_counter()
+    document = converter.render(html_content)
+    return time.perf_counter() - start, len(document.pages)
+
+def run_table_scaling(row_counts, repeat=3, seed=0):
+    """Time table layout for each row count, split and unsplit; return a JSON-serialisable result"""
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    for mode, split in (('split', True), ('unsplit', False)):
+        results[mode] = []
+        for rows in row_counts:
+            runs = []
+            for _ in range(repeat):
+                with context.Pool(1) as pool:
+                    runs.append(pool.apply(_run_layout, (rows, split, seed)))
+            seconds = statistics.median(run[0] for run in runs)
+            results[mode].append({'rows': rows, 'layout_seconds': seconds, 'pages': runs[-1][1]})
+            print(f"  {mode} {rows:>6} rows: {seconds:.3f}s layout, {seconds / rows * 1000:.2f} ms/row, "
+                  f"{runs[-1][1]} pages")
+        # Linear growth keeps the time per row flat from the smallest to the largest table
+        first, last = results[mode][0], results[mode][-1]
+        ratio = (last['layout_seconds'] / last['rows']) / (first['layout_seconds'] / first['rows'])
+        print(f"  {mode}: time per row x{ratio:.2f} from {first['rows']} to {last['rows']} rows")
+    return results
+
+def _output_size(paths):
+    total = 0
+    for path in paths:
+        if os.path.isdir(path):
+            total += sum(os.path.getsize(os.path.join(root, name))
+                         for root, _, files in os.walk(path) for name in files)
+        elif os.path.exists(path):
+            total += os.path.getsize(path)
+    return total
+
+def _run_stage(stage, input_file, work_dir):
+    """Run one stage in this (fresh) process; return (ok, seconds, peak RSS bytes, output bytes)"""
+    base = os.path.join(work_dir, stage)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        if stage == 'generate_svgs':
+            import generate_svgs
+            outputs = [base + '-SVG.md', base + '-svg']
+            generate_svgs.create_markdown_with_svgs(input_file, outputs[0], outputs[1])
+            ok = os.path.exists(outputs[0])
+        elif stage == 'weasyprint':
+            import convert_to_pdf_weasyprint
+            outputs = [base + '.pdf']
+            ok = convert_to_pdf_weasyprint.convert_md_to_pdf(input_file, outputs[0], cache=False)
+        else:
+            import convert_to_pdf
+            outputs = [base + '.pdf']
+            convert_to_pdf.convert_md_to_pdf(input_file, outputs[0], cache=False)
+            ok = os.path.exists(outputs[0])
+        elapsed = time.perf_counter() - start
+    # ru_maxrss is in KiB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return bool(ok), elapsed, peak, _output_size(outputs)
+
+def stage_available(stage):
+    """Return None if the stage can run here, else the reason it cannot"""
+    requirements = {
+        'generate_svgs': [],
+        'weasyprint': ['markdown', 'weasyprint', 'pygments'],
+        'pdfkit': ['markdown', 'pdfkit', 'beautifulsoup4'],
+    }[stage]
+    try:
+        check_requirements(requirements)
+    except MissingDependencyError as e:
+        return str(e).splitlines()[0]
+    if stage == 'pdfkit' and not shutil.which('wkhtmltopdf'):
+        return "wkhtmltopdf is not on PATH"
+    return None
+
+def run_benchmark(corpus, stages=STAGES, repeat=3, seed=0):
+    """Benchmark stages on one synthetic report; return a JSON-serialisable result"""
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='report-bench-') as work_dir:
+        input_file = os.path.join(work_dir, 'report.md')
+        with open(input_file, 'w', encoding='utf-8') as f:
+            f.write(generate_report(seed=seed, **corpus))
+        for stage in stages:
+            reason = stage_available(stage)
+            if reason:
+                print(f"  {stage}: skipped ({reason})")
+                results[stage] = {'skipped': reason}
+                continue
+            runs = []
+            for _ in range(repeat):
+                # A fresh interpreter per run: cold imports and an honest peak RSS
+                with context.Pool(1) as pool:
+                    runs.append(pool.apply(_run_stage, (stage, input_file, work_dir)))
+            if not all(ok for ok, _, _, _ in runs):
+                print(f"  {stage}: FAILED")
+                results[stage] = {'failed': True}
+                continue
+            results[stage] = {
+                'wall_seconds': statistics.median(run[1] for run in runs),
+                'wall_seconds_min': min(run[1] for run in runs),
+                'peak_rss_bytes': max(run[2] for run in runs),
+                'output_bytes': runs[-1][3],
+            }
+            r = results[stage]
+            print(f"  {stage}: {r['wall_seconds']:.3f}s median, {r['peak_rss_bytes'] / 2**20:.1f} MiB peak RSS, "
+                  f"{r['output_bytes']:,} bytes out")
+        input_bytes = os.path.getsize(input_file)
+    return {'corpus': corpus, 'input_bytes': input_bytes, 'repeat': repeat, 'stages': results}
+
+def compare(results, baseline, tolerance):
+    """Return regression messages for metrics more than tolerance worse than the baseline"""
+    regressions = []
+    for corpus_name, current in results['corpora'].items():
+        previous = baseline.get('corpora', {}).get(corpus_name)
+        if not previous:
+            continue
+        for stage, metrics in current['stages'].items():
+            old = previous['stages'].get(stage, {})
+            for metric in ('wall_seconds', 'peak_rss_bytes', 'output_bytes'):
+                if metric in metrics and old.get(metric):
+                    change = metrics[metric] / old[metric] - 1
+                    if change > tolerance:
+                        regressions.append(f"{corpus_name}/{stage} {metric}: {old[metric]:.4g} -> "
+                                           f"{metrics[metric]:.4g} (+{change:.0%})")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the report pipeline on synthetic reports")
+    parser.add_argument('--corpus', action='append', choices=sorted(CORPORA),
+                        help="corpus shape to run (repeatable; default: small and medium)")
+    parser.add_argument('--stage', action='append', choices=STAGES, help="stage to run (repeatable; default: all)")
+    for field in ('headings', 'tables', 'code_blocks', 'mermaid', 'min_bytes'):
+        parser.add_argument(f"--{field.replace('_', '-')}", type=int, dest=field,
+                            help=f"override the corpus {field.replace('_', ' ')}")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per stage; the median is reported")
+    parser.add_argument('--seed', type=int, default=0, help="seed for the report generator")
+    parser.add_argument('--output', help="write the results JSON here")
+    parser.add_argument('--baseline', help="compare against this results JSON and fail on regressions")
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help="allowed slowdown/growth against the baseline (default: 0.15)")
+    parser.add_argument('--table-scaling', nargs='?', const='250,500,1000,2000', metavar='ROWS',
+                        help="only time weasyprint table layout at these comma-separated row counts "
+                             "(default when given: 250,500,1000,2000)")
+    args = parser.parse_args()
+
+    if args.table_scaling:
+        reason = stage_available('weasyprint')
+        if reason:
+            print(f"Table scaling skipped ({reason})")
+            sys.exit(1)
+        row_counts = [int(rows) for rows in args.table_scaling.split(',')]
+        print(f"Table layout scaling: {row_counts}")
+        results = run_table_scaling(row_counts, args.repeat, args.seed)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump({'table_scaling': results}, f, indent=2)
+            print(f"Results saved: {args.output}")
+        sys.exit(0)
+
+    results = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'corpora': {},
+    }
+    for name in args.corpus or ['small', 'medium']:
+        corpus = dict(CORPORA[name])
+        for field in corpus:
+            if getattr(args, field) is not None:
+                corpus[field] = getattr(args, field)
+        print(f"Corpus {name}: {corpus}")
+        results['corpora'][name] = run_benchmark(corpus, args.stage or STAGES, args.repeat, args.seed)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved: {args.output}")
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Build a multi-report project as a dependency graph
+
+A project file (report-project.json) lists the reports and what they share:
+
+    {
+        "reports": ["reports/*.md"],
+        "output_dir": "build",
+        "stylesheet": "report.css",
+        "diagrams": "svg-diagrams",
+        "svg_markdown": true,
+        "optimize": false
+    }
+
+Paths are relative to the project file. Every report becomes two nodes:
+
+    <stem>-SVG.md   generate_svgs: Mermaid blocks replaced by SVG, the SVGs
+                    written to <stem>-svg-diagrams/ (svg_markdown)
+    <stem>.pdf      convert_to_pdf_weasyprint: PDF plus the standalone HTML,
+                    drawing its diagrams from <stem>-svg-diagrams/
+
+so each PDF depends on its -SVG.md node and the PDF and the Markdown always
+show the same pictures (without svg_markdown the PDF reads the shared
+diagrams directly). The -SVG.md node's inputs are the report and the diagrams
+it embeds: diagrams/<name>.svg for each of its Mermaid blocks and any .svg
+file it links to; the PDF's are the report and the stylesheet. Touching one
+shared diagram therefore rebuilds only the reports that embed it, and
+touching the stylesheet only the PDFs. Rendered diagrams are named after a
+hash of their Mermaid source (see generate_svgs.mermaid_diagram_name), so
+editing the text around a block keeps its name, and reports with the same
+block share one diagrams/ file. SVGs of blocks a report no longer has are
+deleted from <stem>-svg-diagrams/.
+
+A node's signature hashes its inputs' contents, its options (paths relative
+to the project), the signatures of the nodes it depends on and the source of
+the modules its step imports; nodes whose signature matches the last build
+(kept in <output_dir>/.build-state.json) and whose outputs exist are skipped.
+The rest run in worker processes as soon as their dependencies are done.
+"""
+import argparse
+import ast
+import glob
+import hashlib
+import importlib.metadata
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from build_cache import BuildCache, cache_key
+from convert_to_pdf_weasyprint import REQUIRED_PACKAGES, STYLESHEET, Converter, write_pdf_and_html
+from fonts import font_fingerprint, fonts_dir
+from generate_svgs import (create_markdown_with_svgs, load_svg_overrides, mermaid_diagram_name, scan_mermaid_blocks,
+                           svg_diagrams)
+from md_backends import backend_label
+from output_files import add_counts, counts as output_counts, report_outputs, reset_counts, write_output
+from preflight import MissingDependencyError, check_requirements
+
+PROJECT_FILE = 'report-project.json'
+STATE_FILE = '.build-state.json'
+
+# Bump when the meaning of a signature changes
+BUILD_FORMAT_VERSION = "1"
+
+PROJECT_DEFAULTS = {
+    'reports': ['*.md'],
+    'output_dir': 'build',
+    'stylesheet': None,
+    'diagrams': None,
+    'svg_markdown': True,
+    'optimize': False,
+}
+
+# ![alt](path.svg), <img src="path.svg">, <object data="path.svg">
+SVG_REFERENCE = re.compile(r'''(?:\]\(\s*<?|\b(?:src|data|href)=["'])([^)"'\s>]+\.svg)\b''', re.I)
+
+class Node:
+    """One build step: run action(*args) whenever the inputs' signature changes"""
+
+    def __init__(self, name, action, args, inputs, outputs, deps=()):
+        self.name = name
+        self.action = action
+        self.args = args
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.deps = list(deps)
+
+def load_project(path):
+    """Read a project file; return its settings with defaults filled in and paths made absolute"""
+    with open(path, 'r', encoding='utf-8') as f:
+        settings = json.load(f)
+    unknown = set(settings) - set(PROJECT_DEFAULTS)
+    if unknown:
+        raise ValueError(f"{path}: unknown project settings: {', '.join(sorted(unknown))}")
+    project = dict(PROJECT_DEFAULTS, **settings)
+    root = project['root'] = os.path.dirname(os.path.abspath(path))
+    if isinstance(project['reports'], str):
+        project['reports'] = [project['reports']]
+    for name in ('output_dir', 'stylesheet', 'diagrams'):
+        if project[name]:
+            project[name] = os.path.join(root, project[name])
+    reports = set()
+    for pattern in project['reports']:
+        for report in glob.glob(os.path.join(root, pattern)):
+            # Generated -SVG.md files are outputs, not reports
+            if os.path.isfile(report) and not report.endswith('-SVG.md'):
+                reports.add(os.path.abspath(report))
+    if not reports:
+        raise ValueError(f"{path}: no reports match {project['reports']}")
+    project['reports'] = sorted(reports)
+    return project
+
+def embedded_diagrams(report, diagrams_dir=None):
+    """Return the diagram files a report embeds: overridden Mermaid diagrams and linked .svg files"""
+    with open(report, 'r', encoding='utf-8') as f:
+        content = f.read()
+    files = set()
+    if diagrams_dir:
+        for _, _, _, source in scan_mermaid_blocks(content):
+            files.add(os.path.join(diagrams_dir, mermaid_diagram_name(source) + '.svg'))
+    for reference in SVG_REFERENCE.findall(content):
+        if '://' not in reference and not reference.startswith('data:'):
+            files.add(os.path.normpath(os.path.join(os.path.dirname(report), reference)))
+    return sorted(files)
+
+def plan(project):
+    """Return {name: Node} for every output of the project"""
+    nodes = {}
+    output_dir = project['output_dir']
+    for report in project['reports']:
+        stem = os.path.splitext(os.path.basename(report))[0]
+        diagrams = embedded_diagrams(report, project['diagrams'])
+        stylesheet = [project['stylesheet']] if project['stylesheet'] else []
+        pdf = os.path.join(output_dir, f"{stem}.pdf")
+        pdf_outputs = [pdf, os.path.splitext(pdf)[0] + '.html']
+        if project['svg_markdown']:
+            output_md = os.path.join(output_dir, f"{stem}-SVG.md")
+            svg_dir = os.path.join(output_dir, f"{stem}-svg-diagrams")
+            nodes[f"{stem}-SVG.md"] = Node(f"{stem}-SVG.md", _build_svg_markdown,
+                                           (report, output_md, svg_dir, project['diagrams']),
+                                           [report] + diagrams, [output_md, svg_dir])
+            # The PDF draws the diagrams the -SVG.md node wrote
+            nodes[f"{stem}.pdf"] = Node(f"{stem}.pdf", _build_pdf,
+                                        (report, pdf, project['stylesheet'], svg_dir, project['optimize']),
+                                        [report] + stylesheet, pdf_outputs, deps=[f"{stem}-SVG.md"])
+        else:
+            nodes[f"{stem}.pdf"] = Node(f"{stem}.pdf", _build_pdf,
+                                        (report, pdf, project['stylesheet'], project['diagrams'], project['optimize']),
+                                        [report] + diagrams + stylesheet, pdf_outputs)
+    # Two reports with the same file name would write the same outputs
+    if len(nodes) != len(project['reports']) * (2 if project['svg_markdown'] else 1):
+        raise ValueError("report file names must be unique across the project")
+    return nodes
+
+def topological_order(nodes):
+    """Return node names with every node after its dependencies; raises ValueError on a cycle"""
+    order = []
+    state = {}
+
+    def visit(name, path):
+        if state.get(name) == 'done':
+            return
+        if state.get(name) == 'visiting':
+            raise ValueError(f"dependency cycle: {' -> '.join(path + [name])}")
+        if name not in nodes:
+            raise ValueError(f"{path[-1]} depends on unknown node {name}")
+        state[name] = 'visiting'
+        for dep in nodes[name].deps:
+            visit(dep, path + [name])
+        state[name] = 'done'
+        order.append(name)
+
+    for name in sorted(nodes):
+        visit(name, [])
+    return order
+
+def _file_digest(path):
+    if os.path.isdir(path):
+        return 'directory'
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return 'missing'
+
+def _imported_modules(path):
+    """Names of the modules a script imports anywhere except its __main__ block"""
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read(), path)
+    names = set()
+    for statement in tree.body:
+        if isinstance(statement, ast.If) and '__main__' in ast.dump(statement.test):
+            continue
+        for node in ast.walk(statement):
+            if isinstance(node, ast.Import):
+                names.update(alias.name.split('.')[0] for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names.add(node.module.split('.')[0])
+    return names
+
+def code_fingerprint(modules):
+    """Hash of the given scripts, the scripts they import in turn and the versions that shape their output"""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    seen = set()
+    pending = list(modules)
+    while pending:
+        name = pending.pop()
+        path = os.path.join(directory, name + '.py')
+        if name in seen or not os.path.isfile(path):
+            continue
+        seen.add(name)
+        pending.extend(_imported_modules(path))
+    digest = hashlib.sha256(BUILD_FORMAT_VERSION.encode())
+    for name in sorted(seen):
+        digest.update(f"{name}\0{_file_digest(os.path.join(directory, name + '.py'))}\0".encode())
+    for distribution in ('weasyprint', 'markdown', 'pygments'):
+        try:
+            digest.update(f"{distribution}-{importlib.metadata.version(distribution)}\0".encode())
+        except importlib.metadata.PackageNotFoundError:
+            pass
+    digest.update(f"{backend_label()}\0{font_fingerprint(fonts_dir())}".encode())
+    return digest.hexdigest()
+
+def _relative(value, root):
+    if isinstance(value, str) and os.path.isabs(value):
+        return os.path.relpath(value, root)
+    return value
+
+def signature(node, dep_signatures, code, root):
+    """Hash everything that decides a node's outputs; paths count relative to the project root"""
+    return cache_key(node.action.__name__, repr([_relative(arg, root) for arg in node.args]), code,
+                     [f"{_relative(path, root)}={_file_digest(path)}" for path in node.inputs],
+                     [dep_signatures[dep] for dep in node.deps])
+
+def load_state(output_dir):
+    try:
+        with open(os.path.join(output_dir, STATE_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_state(output_dir, state):
+    write_output(os.path.join(output_dir, STATE_FILE), json.dumps(state, indent=1, sort_keys=True) + "\n")
+
+_converters = {}
+
+def _converter(stylesheet_file, diagrams_dir, cache):
+    """Return this worker's Converter for a stylesheet and diagram directory, creating it once"""
+    key = (stylesheet_file, diagrams_dir)
+    if key not in _converters:
+        stylesheet = STYLESHEET
+        if stylesheet_file:
+            with open(stylesheet_file, 'r', encoding='utf-8') as f:
+                stylesheet = f.read()
+        _converters[key] = Converter(stylesheet=stylesheet, cache=cache)
+        _converters[key].svg_overrides = load_svg_overrides(diagrams_dir)
+    return _converters[key]
+
+def _remove_stale_svgs(svg_dir, names):
+    """Delete the <name>.svg files in svg_dir that are not in names: diagrams the report no longer has"""
+    for file_name in sorted(os.listdir(svg_dir)) if os.path.isdir(svg_dir) else []:
+        if file_name.endswith('.svg') and file_name[:-4] not in names:
+            os.remove(os.path.join(svg_dir, file_name))
+            print(f"Removed: {os.path.join(svg_dir, file_name)}")
+
+def _build_svg_markdown(cache, report, output_md, svg_dir, diagrams_dir):
+    unmatched = create_markdown_with_svgs(report, output_md, svg_dir, overrides=load_svg_overrides(diagrams_dir))
+    if unmatched:
+        print(f"Warning: {len(unmatched)} Mermaid blocks in {report} were left as-is")
+    # The hand-made diagrams are always written, rendered ones only while the report has them
+    with open(report, 'r', encoding='utf-8') as f:
+        blocks = scan_mermaid_blocks(f.read())
+    _remove_stale_svgs(svg_dir, set(svg_diagrams) | {mermaid_diagram_name(source) for _, _, _, source in blocks})
+
+def _build_pdf(cache, report, pdf, stylesheet_file, diagrams_dir, optimize):
+    converter = _converter(stylesheet_file, diagrams_dir, cache)
+    with open(report, 'r', encoding='utf-8') as f:
+        html_content = converter.to_html(f.read())
+    write_pdf_and_html(converter, html_content, pdf, os.path.splitext(pdf)[0] + '.html', optimize)
+
+# Modules whose source decides each step's output (their own imports are followed)
+ACTION_MODULES = {
+    _build_svg_markdown: ['generate_svgs'],
+    _build_pdf: ['convert_to_pdf_weasyprint', 'generate_svgs'],
+}
+
+def _run_node(action, cache, args):
+    """Run one node inside a worker; return (seconds, output counts)"""
+    started = time.perf_counter()
+    reset_counts()
+    action(cache, *args)
+    return time.perf_counter() - started, dict(output_counts)
+
+def build(project, workers=None, cache=None, force=False, dry_run=False):
+    """Build the project's out-of-date nodes in parallel; return True if every node is up to date afterwards
+
+    cache is a BuildCache (default: the shared one) or False. force rebuilds
+    every node; dry_run only lists the nodes that would be built.
+    """
+    if cache is None:
+        cache = BuildCache()
+    nodes = plan(project)
+    order = topological_order(nodes)
+    output_dir = project['output_dir']
+    os.makedirs(output_dir, exist_ok=True)
+    previous = load_state(output_dir)
+    state = {name: previous[name] for name in nodes if name in previous}
+    code = {action: code_fingerprint(modules) for action, modules in ACTION_MODULES.items()}
+    signatures = {}
+    changed = set()
+    failed = set()
+    up_to_date = 0
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        running = {}
+        remaining = list(order)
+        while remaining or running:
+            for name in list(remaining):
+                node = nodes[name]
+                if any(dep in remaining or dep in running.values() for dep in node.deps):
+                    continue
+                remaining.remove(name)
+                if any(dep in failed for dep in node.deps):
+                    failed.add(name)
+                    print(f"skipped {name} (a dependency failed)")
+                    continue
+                signatures[name] = signature(node, signatures, code[node.action], project['root'])
+                outputs_exist = all(os.path.exists(path) for path in node.outputs)
+                if not force and state.get(name) == signatures[name] and outputs_exist:
+                    up_to_date += 1
+                    continue
+                changed.add(name)
+                if dry_run:
+                    print(f"would build {name}")
+                    continue
+                running[pool.submit(_run_node, node.action, cache, node.args)] = name
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    seconds, counts = future.result()
+                except Exception as e:
+                    failed.add(name)
+                    state.pop(name, None)
+                    print(f"FAILED  {name}: {e}")
+                    continue
+                add_counts(counts)
+                state[name] = signatures[name]
+                print(f"built   {name} ({seconds:.2f}s)")
+            if not dry_run:
+                # Saved as nodes finish, so an interrupted build keeps its progress
+                save_state(output_dir, state)
+
+    built = len(changed) - len(failed & changed)
+    print(f"\n{len(nodes)} nodes: {built} {'to build' if dry_run else 'built'}, {up_to_date} up to date, "
+          f"{len(failed)} failed")
+    return not failed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build every report of a project, rebuilding only what changed")
+    parser.add_argument('project', nargs='?', default=PROJECT_FILE,
+                        help=f"project file (default: {PROJECT_FILE})")
+    parser.add_argument('--workers', type=int, help="worker processes (default: all cores)")
+    parser.add_argument('--cache-dir', help="shared build cache directory (default: $REPORT_BUILD_CACHE)")
+    parser.add_argument('--no-cache', action='store_true', help="always re-render, ignoring the build cache")
+    parser.add_argument('--force', action='store_true', help="rebuild every node")
+    parser.add_argument('--dry-run', action='store_true', help="list the nodes that would be built")
+    args = parser.parse_args()
+
+    try:
+        project = load_project(args.project)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    try:
+        check_requirements(REQUIRED_PACKAGES)
+    except MissingDependencyError as e:
+        print(e)
+        sys.exit(1)
+
+    cache = False if args.no_cache else BuildCache(args.cache_dir)
+    ok = build(project, args.workers, cache, args.force, args.dry_run)
+    if not args.dry_run:
+        report_outputs()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache for rendered report artifacts
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import tempfile
+
+from output_files import copy_output
+
+# Bump when the conversion pipeline changes in a way the key does not capture
+CACHE_FORMAT_VERSION = "1"
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'REPORT_BUILD_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'ai-report-build'))
+DEFAULT_MAX_BYTES = int(os.environ.get('REPORT_BUILD_CACHE_MAX_MB', '512')) * 1024 * 1024
+
+def cache_key(*parts):
+    """Hash the given parts (str, bytes or lists of them) into a hex cache key"""
+    digest = hashlib.sha256(CACHE_FORMAT_VERSION.encode())
+    for part in parts:
+        if isinstance(part, (list, tuple)):
+            part = "\0".join(str(p) for p in part)
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        # Length-prefix every part so ("ab", "c") and ("a", "bc") differ
+        digest.update(str(len(part)).encode() + b":")
+        digest.update(part)
+    return digest.hexdigest()
+
+# Entries live under <cache_dir>/objects; other state in the cache directory
+# (preflight markers, fontconfig setup) is never evicted
+OBJECTS_DIR = 'objects'
+
+# Re-scan the directory after this many puts even below the limit, to notice
+# what other processes sharing the cache have added
+RESCAN_INTERVAL = 256
+
+# Eviction frees down to this fraction of max_bytes, so a full cache is not
+# re-scanned on every following put
+EVICT_TO = 0.9
+
+class BuildCache:
+    """Directory of artifacts addressed by cache key, evicted oldest-first by size.
+
+    Entries are written to a temporary file and renamed into place, so the
+    directory can be shared between concurrent processes and CI runners.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.max_bytes = DEFAULT_MAX_BYTES if max_bytes is None else max_bytes
+        self.objects_dir = os.path.join(self.cache_dir, OBJECTS_DIR)
+        # Running size of the cache, from the last scan plus this process's puts
+        self._total = None
+        self._puts_since_scan = 0
+
+    def __getstate__(self):
+        # Worker processes start their own running total
+        state = dict(self.__dict__)
+        state.update(_total=None, _puts_since_scan=0)
+        return state
+
+    def path(self, key, suffix):
+        """Return the on-disk location of an entry"""
+        return os.path.join(self.objects_dir, key[:2], key + suffix)
+
+    def get(self, key, suffix):
+        """Return the path of a cached entry, or None on a miss"""
+        path = self.path(key, suffix)
+        try:
+            # Refresh mtime so eviction drops least recently used entries first
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except PermissionError:
+            # Written by another user of a shared cache: still readable, just not touchable
+            if not os.path.isfile(path):
+                return None
+        except OSError:
+            return None
+        return path
+
+    def restore(self, key, suffix, dest):
+        """Copy a cached entry to dest (left untouched if identical); return False on a miss"""
+        path = self.get(key, suffix)
+        if path is None:
+            return False
+        copy_output(path, dest)
+        return True
+
+    def put(self, key, suffix, data=None, source=None):
+        """Store bytes (data) or a copy of a file (source) under key"""
+        path = self.path(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            # mkstemp creates 0600 files; other runners sharing the cache must read them
+            os.chmod(tmp_path, 0o644)
+            with os.fdopen(fd, 'wb') as f:
+                if source is not None:
+                    with open(source, 'rb') as src:
+                        shutil.copyfileobj(src, f)
+                else:
+                    f.write(data)
+                size = f.tell()
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._puts_since_scan += 1
+        if self._total is None or self._puts_since_scan >= RESCAN_INTERVAL:
+            self.evict()
+        else:
+            self._total += size - replaced
+            if self._total > self.max_bytes:
+                self.evict()
+        return path
+
+    def entries(self):
+        """List (mtime, size, path) for every entry in the cache"""
+        entries = []
+        for root, _, files in os.walk(self.objects_dir):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    # Removed by another process sharing the directory
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        """Scan the cache; if it exceeds max_bytes, remove least recently used entries down to EVICT_TO of it"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * EVICT_TO if total > self.max_bytes else total
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+            removed += 1
+        self._total = total
+        self._puts_since_scan = 0
+        return removed
+
+    def clear(self):
+        """Remove every entry"""
+        shutil.rmtree(self.objects_dir, ignore_errors=True)
+        self._total = 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or prune the report build cache")
+    parser.add_argument('--cache-dir', help=f"cache directory (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument('--clear', action='store_true', help="remove every cached artifact")
+    args = parser.parse_args()
+
+    cache = BuildCache(args.cache_dir)
+    if args.clear:
+        cache.clear()
+        print(f"Cleared: {cache.cache_dir}")
+    else:
+        entries = cache.entries()
+        total = sum(size for _, size, _ in entries)
+        print(f"{cache.cache_dir}: {len(entries)} entries, {total / 1024 / 1024:.1f} MB "
+              f"(limit {cache.max_bytes / 1024 / 1024:.0f} MB)")
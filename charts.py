@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+Data-driven bar, pie, gantt and line charts rendered to SVG with NumPy
+
+Unlike the hand-made diagrams in generate_svgs.svg_diagrams, every scale,
+arc and position here is computed from the data with vectorized NumPy
+operations, and each series is emitted as one compact <path> rather than an
+element per point or bar. Line series are decimated to the plot's pixel
+resolution (first, min, max and last point of every pixel column), so a
+100k-point series draws the same picture from a few thousand points.
+
+Data can be lists, NumPy arrays or CSV (read_csv). Styling follows the
+Mermaid default theme of mermaid_svg so charts sit well next to diagrams.
+
+    python charts.py line costs.csv --title "Monthly cost" > costs.svg
+"""
+import argparse
+import csv
+import io
+import math
+import os
+import sys
+from datetime import datetime, timezone
+
+from mermaid_svg import PIE_COLORS, THEMES, TICK_STEPS, fmt, svg_open, svg_text, text_width
+from output_files import write_output
+from preflight import MissingDependencyError, check_requirements
+
+REQUIRED_PACKAGES = ['numpy']
+
+CHART_KINDS = ('bar', 'pie', 'gantt', 'line')
+
+MARGIN = 20
+
+def read_csv(source):
+    """Read CSV (a path, file object or CSV text) into (header, [column array, ...]).
+
+    Columns become float arrays when every cell is a number, datetime64 arrays
+    when every cell is an ISO date/time, and string arrays otherwise.
+    """
+    import numpy as np
+
+    if hasattr(source, 'read'):
+        text = source.read()
+    elif '\n' not in source and os.path.exists(source):
+        with open(source, 'r', encoding='utf-8', newline='') as f:
+            text = f.read()
+    else:
+        text = source
+    rows = [row for row in csv.reader(io.StringIO(text)) if row]
+    if len(rows) < 2:
+        raise ValueError("CSV needs a header row and at least one data row")
+    header, rows = rows[0], rows[1:]
+    columns = []
+    for cells in zip(*rows):
+        cells = [_number_text(cell) or cell.strip() for cell in cells]
+        for dtype in (float, 'datetime64[s]'):
+            try:
+                columns.append(np.array(cells, dtype=dtype))
+                break
+            except ValueError:
+                continue
+        else:
+            columns.append(np.array(cells, dtype=str))
+    return header, columns
+
+def _number_text(cell):
+    # '$1,250' -> '1250'; None if the cell is not a number
+    text = cell.strip().replace(',', '').lstrip('$')
+    try:
+        float(text)
+        return text
+    except ValueError:
+        return None
+
+def _numeric(values):
+    """Return (float array, is_time) with datetimes as seconds since the epoch"""
+    import numpy as np
+
+    array = np.asarray(values)
+    if np.issubdtype(array.dtype, np.datetime64) or (array.dtype == object and array.size
+                                                      and isinstance(array.flat[0], datetime)):
+        return array.astype('datetime64[s]').astype(np.int64).astype(float), True
+    return array.astype(float), False
+
+def scale(values, domain, output):
+    """Map values linearly from domain (lo, hi) onto output (lo, hi)"""
+    import numpy as np
+
+    (d0, d1), (r0, r1) = domain, output
+    span = (d1 - d0) or 1.0
+    return r0 + (np.asarray(values, dtype=float) - d0) * ((r1 - r0) / span)
+
+def nice_ticks(lo, hi, count=5):
+    """Round tick positions (steps of 1, 2 or 5 x 10^n) covering lo..hi"""
+    import numpy as np
+
+    if hi <= lo:
+        hi = lo + 1
+    raw = (hi - lo) / count
+    magnitude = 10 ** math.floor(math.log10(raw))
+    step = magnitude * min((1, 2, 5, 10), key=lambda m: abs(m * magnitude - raw))
+    return np.arange(math.floor(lo / step) * step, hi + step * 0.5, step)
+
+def time_ticks(lo, hi, count=8):
+    """Tick positions (epoch seconds) at a calendar-friendly step covering lo..hi"""
+    import numpy as np
+
+    span = max(hi - lo, 1)
+    step = next((s for s in TICK_STEPS if span / s <= count), TICK_STEPS[-1])
+    return np.arange(math.ceil(lo / step) * step, hi + 1, step)
+
+def _time_label(seconds, span):
+    moment = datetime.fromtimestamp(float(seconds), timezone.utc)
+    if span < 2 * 86400:
+        return moment.strftime('%H:%M')
+    return moment.strftime('%Y-%m-%d') if span < 2 * 31536000 else moment.strftime('%Y')
+
+def _number_label(value):
+    if abs(value) >= 1e6:
+        return f"{value / 1e6:g}M"
+    if abs(value) >= 1e4:
+        return f"{value / 1e3:g}k"
+    return f"{value:g}"
+
+def _coords(values):
+    import numpy as np
+
+    return [fmt(v) for v in np.round(values, 1).tolist()]
+
+def polyline_path(xs, ys):
+    """'M x y L x y ...' for a series, coordinates rounded to 0.1 px"""
+    xs, ys = _coords(xs), _coords(ys)
+    if not xs:
+        return ''
+    return f"M{xs[0]} {ys[0]}L" + " ".join(f"{x} {y}" for x, y in zip(xs[1:], ys[1:]))
+
+def rects_path(xs, ys, widths, heights):
+    """One path drawing many rectangles (top-left corners xs, ys)"""
+    return "".join(f"M{x} {y}h{w}v{h}h-{w}z" for x, y, w, h in
+                   zip(_coords(xs), _coords(ys), _coords(widths), _coords(heights)))
+
+def decimate(x, y, buckets):
+    """Keep the first, lowest, highest and last point of each of buckets equal x ranges.
+
+    At one bucket per pixel column the drawn line looks the same, whatever the
+    input size. x must be sorted; non-finite points are dropped.
+    """
+    import numpy as np
+
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    finite = np.isfinite(x) & np.isfinite(y)
+    x, y = x[finite], y[finite]
+    if len(x) <= 4 * buckets:
+        return x, y
+    bucket = np.minimum(((x - x[0]) / ((x[-1] - x[0]) or 1) * buckets).astype(np.int64), buckets - 1)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(x)] - 1
+    # Sorted by bucket, then value: each bucket's first entry is its minimum, its last the maximum
+    by_value = np.lexsort((y, bucket))
+    keep = np.unique(np.concatenate([starts, ends, by_value[starts], by_value[ends]]))
+    return x[keep], y[keep]
+
+def _colors(count, theme):
+    return [theme.get(f'pie{i + 1}', PIE_COLORS[i % len(PIE_COLORS)]) for i in range(count)]
+
+def _header(width, height, theme, title):
+    out = [svg_open(width, height, theme)]
+    if title:
+        out.append(svg_text(width / 2, MARGIN + theme['fontSize'], [title], theme['textColor'],
+                            theme['fontSize'] * 1.3, weight='bold', sized=True))
+    return out, (theme['fontSize'] * 1.6 + MARGIN if title else 0)
+
+def _legend(out, x, y, names, colors, theme):
+    for i, (name, color) in enumerate(zip(names, colors)):
+        out.append(f'<rect x="{fmt(x)}" y="{fmt(y + i * 24)}" width="16" height="16" fill="{color}"/>')
+        out.append(svg_text(x + 24, y + i * 24 + 8, [name], theme['textColor'], theme['fontSize'], anchor='start'))
+
+def _value_axis(out, ticks, y_of, left, right, theme):
+    """Horizontal grid lines (one path) with labels left of the plot"""
+    ys = y_of(ticks)
+    out.append(f'<path d="{"".join(f"M{fmt(left)} {y}H{fmt(right)}" for y in _coords(ys))}" '
+               f'stroke="{theme["gridColor"]}" fill="none"/>')
+    for tick, y in zip(ticks.tolist(), ys.tolist()):
+        out.append(svg_text(left - 6, y, [_number_label(tick)], theme['textColor'], theme['fontSize'] * 0.85,
+                            anchor='end', sized=True))
+
+def bar_chart(labels, values, series=None, title='', width=640, height=360, theme=None):
+    """Vertical bars; values is one value per label or a (labels x series) array for grouped bars"""
+    import numpy as np
+
+    theme = theme or THEMES['default']
+    values = np.asarray(values, dtype=float)
+    values = values.reshape(len(labels), -1)
+    count, groups = values.shape
+    series = list(series or [f"Series {i + 1}" for i in range(groups)])
+    colors = _colors(groups, theme)
+    out, title_room = _header(width, height, theme, title)
+    legend_w = max(text_width(name, theme['fontSize']) for name in series) + 40 if groups > 1 else 0
+    left = MARGIN + text_width(_number_label(values.max()), theme['fontSize']) + 10
+    right = width - MARGIN - legend_w
+    top, bottom = MARGIN + title_room, height - MARGIN - theme['fontSize'] * 1.5
+
+    ticks = nice_ticks(min(values.min(), 0), max(values.max(), 0))
+    def y_of(v):
+        return scale(v, (ticks[0], ticks[-1]), (bottom, top))
+    _value_axis(out, ticks, y_of, left, right, theme)
+
+    band = (right - left) / count
+    bar_w = band * 0.8 / groups
+    # x of every bar: category offset + series offset, by broadcasting
+    xs = left + band * 0.1 + np.arange(count)[:, None] * band + np.arange(groups)[None, :] * bar_w
+    zero = y_of(0.0)
+    tops = np.minimum(y_of(values), zero)
+    heights = np.abs(y_of(values) - zero)
+    for g in range(groups):
+        out.append(f'<path d="{rects_path(xs[:, g], tops[:, g], np.full(count, bar_w), heights[:, g])}" '
+                   f'fill="{colors[g]}"/>')
+    label_size = theme['fontSize'] * 0.85
+    for label, x in zip(labels, (left + band * (np.arange(count) + 0.5)).tolist()):
+        out.append(svg_text(x, bottom + label_size, [str(label)], theme['textColor'], label_size, sized=True))
+    if groups > 1:
+        _legend(out, right + 20, top, series, colors, theme)
+    out.append('</svg>')
+    return '\n'.join(out)
+
+def pie_chart(labels, values, title='', radius=120, theme=None):
+    """Pie with percentage labels on slices of 5% or more and a legend"""
+    import numpy as np
+
+    theme = theme or THEMES['default']
+    values = np.asarray(values, dtype=float)
+    if values.size == 0 or values.sum() <= 0 or (values < 0).any():
+        raise ValueError("pie chart needs non-negative values with a positive total")
+    shares = values / values.sum()
+    legend = [f"{label} ({share:.0%})" for label, share in zip(labels, shares.tolist())]
+    font_size = theme['fontSize']
+    legend_w = max(text_width(text, font_size) for text in legend) + 24
+    title_w = text_width(title, font_size * 1.3) + 2 * MARGIN if title else 0
+    width = max(MARGIN + 2 * radius + 40 + legend_w + MARGIN, title_w)
+    title_room = font_size * 1.6 + MARGIN if title else 0
+    height = max(title_room + 2 * radius + 2 * MARGIN, title_room + len(values) * 24 + 2 * MARGIN)
+    out, title_room = _header(width, height, theme, title)
+    cx, cy = MARGIN + radius, MARGIN + title_room + radius
+
+    # Slice boundaries from 12 o'clock, clockwise
+    bounds = -np.pi / 2 + 2 * np.pi * np.r_[0, np.cumsum(shares)]
+    ends_x, ends_y = cx + radius * np.cos(bounds), cy + radius * np.sin(bounds)
+    mids = (bounds[:-1] + bounds[1:]) / 2
+    colors = _colors(len(values), theme)
+    x, y = _coords(ends_x), _coords(ends_y)
+    for i, share in enumerate(shares.tolist()):
+        if share >= 1 - 1e-9:
+            out.append(f'<circle cx="{fmt(cx)}" cy="{fmt(cy)}" r="{radius}" fill="{colors[i]}"/>')
+        elif share > 0:
+            out.append(f'<path d="M{fmt(cx)} {fmt(cy)}L{x[i]} {y[i]}A{radius} {radius} 0 {int(share > 0.5)} 1 '
+                       f'{x[i + 1]} {y[i + 1]}z" fill="{colors[i]}" stroke="#ffffff" stroke-width="2"/>')
+    label_x, label_y = cx + radius * 0.6 * np.cos(mids), cy + radius * 0.6 * np.sin(mids)
+    for share, lx, ly in zip(shares.tolist(), label_x.tolist(), label_y.tolist()):
+        if share >= 0.05:
+            out.append(svg_text(lx, ly, [f"{share:.0%}"], '#ffffff', font_size, weight='bold'))
+    _legend(out, cx + radius + 40, cy - len(values) * 12, legend, colors, theme)
+    out.append('</svg>')
+    return '\n'.join(out)
+
+def gantt_chart(names, starts, ends, sections=None, title='', chart_width=600, theme=None):
+    """Horizontal task bars on a time axis; starts/ends are datetimes, datetime64 or numbers"""
+    import numpy as np
+
+    theme = theme or THEMES['default']
+    (start, start_is_time), (end, _) = _numeric(starts), _numeric(ends)
+    font_size = theme['fontSize']
+    bar_h, row_h = 22, 30
+    label_w = max(text_width(str(name), font_size) for name in names) + 20
+    title_room = font_size * 1.6 + MARGIN if title else 0
+    left = MARGIN + label_w
+    width = left + chart_width + MARGIN
+    height = MARGIN + title_room + len(names) * row_h + font_size * 2 + MARGIN
+    out, title_room = _header(width, height, theme, title)
+    top = MARGIN + title_room
+    axis_y = top + len(names) * row_h
+
+    lo, hi = float(start.min()), float(end.max())
+    def x_of(v):
+        return scale(v, (lo, hi), (left, left + chart_width))
+    ticks = time_ticks(lo, hi) if start_is_time else nice_ticks(lo, hi, 8)
+    ticks = ticks[(ticks >= lo) & (ticks <= hi)]
+    out.append(f'<path d="{"".join(f"M{x} {fmt(top)}V{fmt(axis_y)}" for x in _coords(x_of(ticks)))}" '
+               f'stroke="{theme["gridColor"]}" fill="none"/>')
+    for tick, x in zip(ticks.tolist(), x_of(ticks).tolist()):
+        label = _time_label(tick, hi - lo) if start_is_time else _number_label(tick)
+        out.append(svg_text(x, axis_y + font_size, [label], theme['textColor'], font_size * 0.85, sized=True))
+
+    rows = np.arange(len(names))
+    xs = x_of(start)
+    widths = np.maximum(x_of(end) - xs, 2)
+    ys = top + rows * row_h + (row_h - bar_h) / 2
+    section_index = np.unique(np.asarray(sections if sections is not None else [''] * len(names)),
+                              return_inverse=True)[1]
+    # One path per section colour instead of one rect per task
+    for s in np.unique(section_index):
+        mask = section_index == s
+        fill = theme['taskBkgColor'] if s % 2 == 0 else theme['activeTaskBkgColor']
+        out.append(f'<path d="{rects_path(xs[mask], ys[mask], widths[mask], np.full(mask.sum(), bar_h))}" '
+                   f'fill="{fill}" stroke="{theme["taskBorderColor"]}"/>')
+    for name, y in zip(names, (ys + bar_h / 2).tolist()):
+        out.append(svg_text(left - 10, y, [str(name)], theme['textColor'], font_size, anchor='end'))
+    out.append('</svg>')
+    return '\n'.join(out)
+
+def line_chart(x, ys, series=None, title='', width=640, height=360, theme=None):
+    """Line chart of one or more series over x (numbers or datetimes), decimated to the plot width"""
+    import numpy as np
+
+    theme = theme or THEMES['default']
+    x, x_is_time = _numeric(x)
+    ys = np.asarray(ys, dtype=float)
+    ys = ys.reshape(1, -1) if ys.ndim == 1 else ys
+    if ys.shape[1] != len(x):
+        raise ValueError(f"{ys.shape[1]} y values for {len(x)} x values")
+    order = np.argsort(x, kind='stable')
+    x, ys = x[order], ys[:, order]
+    series = list(series or [f"Series {i + 1}" for i in range(len(ys))])
+    for name, values in zip(series, ys):
+        if not np.isfinite(values).any():
+            raise ValueError(f"series {name!r} has no finite y values")
+    colors = _colors(len(ys), theme)
+    out, title_room = _header(width, height, theme, title)
+    legend_w = max(text_width(name, theme['fontSize']) for name in series) + 40 if len(ys) > 1 else 0
+    finite = ys[np.isfinite(ys)]
+    ticks = nice_ticks(float(finite.min()), float(finite.max()))
+    left = MARGIN + max(text_width(_number_label(t), theme['fontSize'] * 0.85) for t in ticks.tolist()) + 10
+    right = width - MARGIN - legend_w
+    top, bottom = MARGIN + title_room, height - MARGIN - theme['fontSize'] * 1.5
+
+    def y_of(v):
+        return scale(v, (ticks[0], ticks[-1]), (bottom, top))
+    def x_of(v):
+        return scale(v, (x[0], x[-1]), (left, right))
+    _value_axis(out, ticks, y_of, left, right, theme)
+    x_ticks = time_ticks(x[0], x[-1]) if x_is_time else nice_ticks(x[0], x[-1], 8)
+    x_ticks = x_ticks[(x_ticks >= x[0]) & (x_ticks <= x[-1])]
+    for tick, px in zip(x_ticks.tolist(), x_of(x_ticks).tolist()):
+        label = _time_label(tick, x[-1] - x[0]) if x_is_time else _number_label(tick)
+        out.append(svg_text(px, bottom + theme['fontSize'], [label], theme['textColor'], theme['fontSize'] * 0.85,
+                            sized=True))
+
+    # One bucket per output pixel column
+    buckets = max(int(right - left), 1)
+    for values, color in zip(ys, colors):
+        px, py = decimate(x, values, buckets)
+        out.append(f'<path d="{polyline_path(x_of(px), y_of(py))}" fill="none" stroke="{color}" '
+                   f'stroke-width="1.5" stroke-linejoin="round"/>')
+    if len(ys) > 1:
+        _legend(out, right + 20, top, series, colors, theme)
+    out.append('</svg>')
+    return '\n'.join(out)
+
+def chart_from_csv(kind, source, title=''):
+    """Render a chart from CSV columns.
+
+    bar/pie: label column, then value column(s); line: x column, then series;
+    gantt: name, start, end and optionally section.
+    """
+    import numpy as np
+
+    header, columns = read_csv(source)
+    if kind == 'bar':
+        return bar_chart(columns[0].tolist(), np.column_stack(columns[1:]), header[1:], title)
+    if kind == 'pie':
+        return pie_chart(columns[0].tolist(), columns[1], title)
+    if kind == 'line':
+        return line_chart(columns[0], np.vstack(columns[1:]), header[1:], title)
+    if kind == 'gantt':
+        return gantt_chart(columns[0].tolist(), columns[1], columns[2],
+                           columns[3].tolist() if len(columns) > 3 else None, title)
+    raise ValueError(f"unknown chart kind {kind!r} (choose from: {', '.join(CHART_KINDS)})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render a bar, pie, gantt or line chart from CSV to SVG")
+    parser.add_argument('kind', choices=CHART_KINDS)
+    parser.add_argument('csv', help="CSV file with a header row ('-' for stdin)")
+    parser.add_argument('--title', default='')
+    parser.add_argument('--output', '-o', help="SVG file to write (default: stdout)")
+    args = parser.parse_args()
+
+    try:
+        check_requirements(REQUIRED_PACKAGES)
+    except MissingDependencyError as e:
+        print(e)
+        sys.exit(1)
+    try:
+        svg = chart_from_csv(args.kind, sys.stdin if args.csv == '-' else args.csv, args.title)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    if args.output:
+        written = write_output(args.output, svg)
+        print(f"Chart {'saved' if written else 'unchanged'}: {args.output} ({len(svg):,} bytes)")
+    else:
+        print(svg)
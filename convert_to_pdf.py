@@ -2,143 +2,239 @@
 """
 Convert Markdown report to PDF using Python libraries
 """
-import subprocess
+import argparse
 import sys
 import os
 
-def check_and_install_requirements():
-    """Check and install required packages"""
-    required_packages = ['markdown', 'pdfkit', 'beautifulsoup4']
-    
-    for package in required_packages:
-        try:
-            __import__(package)
-        except ImportError:
-            print(f"Installing {package}...")
-            subprocess.check_call([sys.executable, "-m", "pip", "install", package])
+from build_cache import BuildCache, cache_key
+from fonts import (add_font_arguments, apply_font_arguments, configure_fontconfig, font_face_css, font_fingerprint,
+                   fonts_dir)
+from instrument import add_instrument_arguments, log_to, profiled, stage
+from md_backends import (BACKEND_PACKAGES, add_backend_argument, backend_label, backend_name, create_backend,
+                         select_backend)
+from output_files import atomic_output, report_outputs, write_output
+from preflight import MissingDependencyError, check_requirements
+from svg_raster import DEFAULT_DPI, collect_diagrams, rasterize_diagrams, replace_blocks_with_pngs
+
+REQUIRED_PACKAGES = ['markdown', 'pdfkit', 'beautifulsoup4']
+
+MARKDOWN_EXTENSIONS = ['extra', 'codehilite', 'toc']
+
+STYLESHEET = """
+    body {
+        font-family: 'Report Sans', -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
+        line-height: 1.6;
+        color: #1f2937;
+        max-width: 900px;
+        margin: 0 auto;
+        padding: 20px;
+    }
+    h1, h2, h3 {
+        color: #111827;
+        margin-top: 24px;
+    }
+    h1 { font-size: 2.5em; text-align: center; }
+    h2 { font-size: 1.8em; border-bottom: 2px solid #e5e7eb; padding-bottom: 8px; }
+    h3 { font-size: 1.4em; }
+    table {
+        border-collapse: collapse;
+        width: 100%;
+        margin: 20px 0;
+    }
+    th, td {
+        border: 1px solid #e5e7eb;
+        padding: 12px;
+        text-align: left;
+    }
+    th {
+        background-color: #f9fafb;
+        font-weight: bold;
+    }
+    tr:nth-child(even) {
+        background-color: #f9fafb;
+    }
+    code {
+        background-color: #f3f4f6;
+        padding: 2px 4px;
+        border-radius: 3px;
+        font-family: 'Report Mono', 'Courier New', monospace;
+    }
+    pre {
+        background-color: #f3f4f6;
+        padding: 16px;
+        border-radius: 8px;
+        overflow-x: auto;
+    }
+    blockquote {
+        border-left: 4px solid #3b82f6;
+        margin-left: 0;
+        padding-left: 16px;
+        color: #4b5563;
+    }
+    .mermaid {
+        text-align: center;
+        margin: 20px 0;
+    }
+    strong {
+        color: #111827;
+    }
+    div[align="center"] {
+        text-align: center;
+        margin: 20px 0;
+    }
+"""
+
+PDF_OPTIONS = {
+    'page-size': 'A4',
+    'margin-top': '0.75in',
+    'margin-right': '0.75in',
+    'margin-bottom': '0.75in',
+    'margin-left': '0.75in',
+    'encoding': "UTF-8",
+    'no-outline': None,
+    'enable-local-file-access': None
+}
+
+def check_requirements_or_exit(extra=()):
+    """Check required packages, exiting with install instructions if any are missing"""
+    try:
+        check_requirements(REQUIRED_PACKAGES + list(extra))
+    except MissingDependencyError as e:
+        print(e)
+        sys.exit(1)
 
-def convert_md_to_pdf(input_file, output_file):
-    """Convert markdown to PDF"""
+_markdown = {}
+
+def _markdown_converter(cache=None, backend=None):
+    """Return this process's Markdown converter for a backend (see md_backends), creating it once"""
+    backend = backend_name(backend)
+    if backend not in _markdown:
+        _markdown[backend] = create_backend(backend, MARKDOWN_EXTENSIONS)
+    # Converted sections and highlighted code go to this run's build cache
+    _markdown[backend].cache = cache
+    if _markdown[backend].highlights:
+        _markdown[backend].highlights.cache = cache
+    return _markdown[backend]
+
+def convert_md_to_pdf(input_file, output_file, cache=None, png_dpi=None, workers=None, markdown_backend=None):
+    """Convert markdown to PDF
+
+    cache is a BuildCache (default: the shared one) or False to always re-render.
+    With png_dpi, Mermaid diagrams are rasterized (see svg_raster) into a
+    png-diagrams directory next to the PDF and the HTML references the PNGs.
+    markdown_backend is one of md_backends.BACKEND_PACKAGES (default:
+    $REPORT_MARKDOWN_BACKEND or python-markdown).
+    """
+    # Set once the page is built; the HTML fallback needs it
+    styled_html = None
     try:
-        import markdown
-        import pdfkit
-        from bs4 import BeautifulSoup
+        with stage('convert', document=input_file, converter='pdfkit'):
+            import pdfkit
+            from bs4 import BeautifulSoup
+        
+            # Read markdown file
+            with stage('read'):
+                with open(input_file, 'r', encoding='utf-8') as f:
+                    md_content = f.read()
         
-        # Read markdown file
-        with open(input_file, 'r', encoding='utf-8') as f:
-            md_content = f.read()
+            blocks, diagrams = [], {}
+            if png_dpi:
+                with stage('mermaid'):
+                    blocks, diagrams = collect_diagrams(md_content)
         
-        # Convert markdown to HTML
-        html_content = markdown.markdown(md_content, extensions=['extra', 'codehilite', 'toc'])
+            if cache is None:
+                cache = BuildCache()
+            # wkhtmltopdf inherits the bundled-font fontconfig setup (see fonts.py)
+            fonts = fonts_dir()
+            configure_fontconfig(fonts, cache.cache_dir if cache else None)
+            if cache:
+                with stage('cache_lookup'):
+                    key = cache_key(md_content, STYLESHEET, font_fingerprint(fonts), MARKDOWN_EXTENSIONS,
+                                    sorted(f"{k}={v}" for k, v in PDF_OPTIONS.items()),
+                                    f"pdfkit-{pdfkit.__version__}", backend_label(markdown_backend),
+                                    f"png-dpi={png_dpi}", sorted(diagrams.values()))
+                    hit = cache.restore(key, '.pdf', output_file)
+                if hit:
+                    print(f"PDF restored from cache: {output_file}")
+                    return
         
-        # Add CSS styling for better PDF output
-        styled_html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <style>
-                body {{
-                    font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-                    line-height: 1.6;
-                    color: #1f2937;
-                    max-width: 900px;
-                    margin: 0 auto;
-                    padding: 20px;
-                }}
-                h1, h2, h3 {{
-                    color: #111827;
-                    margin-top: 24px;
-                }}
-                h1 {{ font-size: 2.5em; text-align: center; }}
-                h2 {{ font-size: 1.8em; border-bottom: 2px solid #e5e7eb; padding-bottom: 8px; }}
-                h3 {{ font-size: 1.4em; }}
-                table {{
-                    border-collapse: collapse;
-                    width: 100%;
-                    margin: 20px 0;
-                }}
-                th, td {{
-                    border: 1px solid #e5e7eb;
-                    padding: 12px;
-                    text-align: left;
-                }}
-                th {{
-                    background-color: #f9fafb;
-                    font-weight: bold;
-                }}
-                tr:nth-child(even) {{
-                    background-color: #f9fafb;
-                }}
-                code {{
-                    background-color: #f3f4f6;
-                    padding: 2px 4px;
-                    border-radius: 3px;
-                    font-family: 'Courier New', monospace;
-                }}
-                pre {{
-                    background-color: #f3f4f6;
-                    padding: 16px;
-                    border-radius: 8px;
-                    overflow-x: auto;
-                }}
-                blockquote {{
-                    border-left: 4px solid #3b82f6;
-                    margin-left: 0;
-                    padding-left: 16px;
-                    color: #4b5563;
-                }}
-                .mermaid {{
-                    text-align: center;
-                    margin: 20px 0;
-                }}
-                strong {{
-                    color: #111827;
-                }}
-                div[align="center"] {{
-                    text-align: center;
-                    margin: 20px 0;
-                }}
-            </style>
-        </head>
-        <body>
-            {html_content}
-        </body>
-        </html>
-        """
+            images = {}
+            if blocks:
+                png_dir = os.path.join(os.path.dirname(os.path.abspath(output_file)), 'png-diagrams')
+                with stage('rasterize'):
+                    paths = rasterize_diagrams(diagrams, png_dir, png_dpi, workers, cache)
+                    md_content, images = replace_blocks_with_pngs(md_content, blocks, diagrams, paths)
         
-        # Convert HTML to PDF
-        options = {
-            'page-size': 'A4',
-            'margin-top': '0.75in',
-            'margin-right': '0.75in',
-            'margin-bottom': '0.75in',
-            'margin-left': '0.75in',
-            'encoding': "UTF-8",
-            'no-outline': None,
-            'enable-local-file-access': None
-        }
+            # Convert markdown to HTML
+            with stage('markdown'):
+                html_content = _markdown_converter(cache, markdown_backend).convert(md_content)
+                for placeholder, img in images.items():
+                    html_content = html_content.replace(placeholder, img)
         
-        pdfkit.from_string(styled_html, output_file, options=options)
-        print(f"PDF successfully created: {output_file}")
+            # Add CSS styling for better PDF output
+            with stage('template'):
+                styled_html = f"""
+            <!DOCTYPE html>
+            <html>
+            <head>
+                <meta charset="UTF-8">
+                <style>{font_face_css(fonts)}{STYLESHEET}</style>
+            </head>
+            <body>
+                {html_content}
+            </body>
+            </html>
+            """
+        
+            # Convert HTML to PDF
+            with stage('pdfkit'):
+                with atomic_output(output_file) as pdf_file:
+                    pdfkit.from_string(styled_html, pdf_file, options=PDF_OPTIONS)
+            print(f"PDF successfully created: {output_file}")
+        
+            if cache:
+                with stage('cache_store'):
+                    cache.put(key, '.pdf', source=output_file)
         
     except Exception as e:
         print(f"Error creating PDF: {e}")
+        if styled_html is None:
+            # Failed before the HTML was built (missing input, import error): nothing to fall back to
+            return
         print("\nAlternative: Creating HTML file instead...")
         
         # Create HTML as fallback
         html_file = output_file.replace('.pdf', '.html')
-        with open(html_file, 'w', encoding='utf-8') as f:
-            f.write(styled_html)
+        write_output(html_file, styled_html)
         print(f"HTML file created: {html_file}")
         print("You can open this in a browser and use 'Print to PDF' feature")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the report to PDF with pdfkit")
+    parser.add_argument('--png-dpi', type=int, nargs='?', const=DEFAULT_DPI,
+                        help=f"rasterize diagrams to PNG at this resolution first (default when given: {DEFAULT_DPI})")
+    parser.add_argument('--workers', type=int, help="rasterizer processes (default: all cores)")
+    parser.add_argument('--cache-dir', help="shared build cache directory (default: $REPORT_BUILD_CACHE)")
+    parser.add_argument('--no-cache', action='store_true', help="always re-render, ignoring the build cache")
+    add_font_arguments(parser)
+    add_backend_argument(parser)
+    add_instrument_arguments(parser)
+    args = parser.parse_args()
+    if args.timings:
+        log_to(args.timings)
+    if args.markdown_backend:
+        select_backend(args.markdown_backend)
+    apply_font_arguments(args)
+
+    cache = False if args.no_cache else BuildCache(args.cache_dir)
+
     input_md = "/Users/alexanderfedin/Projects/demo/AI-Developer-ROI-Report-2025.md"
     output_pdf = "/Users/alexanderfedin/Projects/demo/AI-Developer-ROI-Report-2025.pdf"
     
     print("Checking requirements...")
-    check_and_install_requirements()
+    check_requirements_or_exit(BACKEND_PACKAGES[backend_name()] + (['cairosvg'] if args.png_dpi else []))
     
     print(f"Converting {input_md} to PDF...")
-    convert_md_to_pdf(input_md, output_pdf)
\ No newline at end of file
+    with profiled(args.profile):
+        convert_md_to_pdf(input_md, output_pdf, cache, png_dpi=args.png_dpi, workers=args.workers)
+    report_outputs()
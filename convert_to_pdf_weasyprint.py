@@ -2,184 +2,495 @@
 """
 Convert Markdown report to PDF using weasyprint
 """
-import subprocess
+import argparse
+import functools
+import glob
+import hashlib
 import sys
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-def install_weasyprint():
-    """Install weasyprint"""
-    print("Installing weasyprint...")
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "weasyprint", "markdown", "pygments"])
+from build_cache import BuildCache, cache_key
+from fonts import (add_font_arguments, apply_font_arguments, configure_fontconfig, font_face_css, font_fingerprint,
+                   fonts_dir, shared_font_configuration)
+from generate_svgs import resolved_svg_digest, scan_mermaid_blocks, svg_for_mermaid
+from instrument import add_instrument_arguments, log_to, profiled, stage, worker_profiled
+from md_backends import (BACKEND_PACKAGES, add_backend_argument, backend_label, backend_name, create_backend,
+                         select_backend)
+from mermaid_svg import RENDERER_VERSION, MermaidError
+from output_files import (add_counts, atomic_output, counts as output_counts, report_outputs, reset_counts,
+                          write_output)
+from pdf_optimize import WEASYPRINT_OPTIONS, optimize_pdf, report_savings
+from preflight import MissingDependencyError, check_requirements
+from split_blocks import DEFAULT_CODE_LINES, DEFAULT_TABLE_ROWS, split_large_blocks
+from svg_embed import SHARED_DEFS_ID
 
-def convert_md_to_pdf(input_file, output_file):
-    """Convert markdown to PDF using weasyprint"""
-    try:
-        import markdown
-        from weasyprint import HTML, CSS
-        
-        # Read markdown file
-        with open(input_file, 'r', encoding='utf-8') as f:
-            md_content = f.read()
-        
-        # Remove mermaid blocks since they won't render in PDF
-        md_content = re.sub(r'```mermaid.*?```', '[Diagram - See HTML version]', md_content, flags=re.DOTALL)
-        
-        # Convert markdown to HTML
-        md = markdown.Markdown(extensions=['extra', 'codehilite', 'tables', 'toc'])
-        html_content = md.convert(md_content)
-        
-        # Create styled HTML
-        styled_html = f"""
+REQUIRED_PACKAGES = ['markdown', 'weasyprint', 'pygments']
+
+MERMAID_PLACEHOLDER = re.compile(r'<p>MERMAIDSVGPLACEHOLDER[0-9a-f]+</p>')
+
+MARKDOWN_EXTENSIONS = ['extra', 'codehilite', 'tables', 'toc']
+
+STYLESHEET = """
+    @page {
+        size: A4;
+        margin: 2cm;
+    }
+    body {
+        font-family: 'Report Sans', 'Helvetica Neue', Arial, sans-serif;
+        line-height: 1.6;
+        color: #1f2937;
+        font-size: 11pt;
+    }
+    h1 {
+        font-size: 24pt;
+        color: #111827;
+        text-align: center;
+        margin: 40px 0 20px 0;
+        page-break-after: avoid;
+    }
+    h2 {
+        font-size: 18pt;
+        color: #1f2937;
+        margin-top: 30px;
+        margin-bottom: 15px;
+        border-bottom: 2px solid #e5e7eb;
+        padding-bottom: 8px;
+        page-break-after: avoid;
+    }
+    h3 {
+        font-size: 14pt;
+        color: #374151;
+        margin-top: 20px;
+        margin-bottom: 10px;
+        page-break-after: avoid;
+    }
+    h4 {
+        font-size: 12pt;
+        color: #4b5563;
+        margin-top: 15px;
+        margin-bottom: 8px;
+    }
+    p {
+        margin: 10px 0;
+        text-align: justify;
+    }
+    table {
+        border-collapse: collapse;
+        width: 100%;
+        margin: 20px 0;
+        font-size: 10pt;
+        page-break-inside: avoid;
+    }
+    th, td {
+        border: 1px solid #d1d5db;
+        padding: 8px 12px;
+        text-align: left;
+    }
+    th {
+        background-color: #f3f4f6;
+        font-weight: bold;
+        color: #111827;
+    }
+    tr:nth-child(even) {
+        background-color: #f9fafb;
+    }
+    code {
+        background-color: #f3f4f6;
+        padding: 2px 4px;
+        border-radius: 3px;
+        font-family: 'Report Mono', 'Courier New', monospace;
+        font-size: 9pt;
+    }
+    pre {
+        background-color: #f3f4f6;
+        padding: 12px;
+        border-radius: 6px;
+        overflow-x: auto;
+        font-size: 9pt;
+        line-height: 1.4;
+        page-break-inside: avoid;
+    }
+    blockquote {
+        border-left: 4px solid #3b82f6;
+        margin: 20px 0;
+        padding-left: 16px;
+        color: #4b5563;
+        font-style: italic;
+    }
+    ul, ol {
+        margin: 10px 0;
+        padding-left: 30px;
+    }
+    li {
+        margin: 5px 0;
+    }
+    strong {
+        color: #111827;
+        font-weight: bold;
+    }
+    em {
+        font-style: italic;
+    }
+    hr {
+        border: none;
+        border-top: 1px solid #e5e7eb;
+        margin: 30px 0;
+    }
+    div[align="center"] {
+        text-align: center;
+        margin: 20px 0;
+    }
+    .mermaid {
+        text-align: center;
+        margin: 20px 0;
+        page-break-inside: avoid;
+    }
+    .mermaid svg {
+        max-width: 100%;
+        height: auto;
+    }
+    .split-block {
+        margin: 20px 0;
+    }
+    .split-block table, .split-block pre {
+        margin: 0;
+    }
+    .split-block pre {
+        border-radius: 0;
+    }
+    .page-break {
+        page-break-after: always;
+    }
+    .no-break {
+        page-break-inside: avoid;
+    }
+"""
+
+def inline_mermaid_svgs(md_content, cache=None, overrides=None):
+    """Swap Mermaid blocks for placeholders; return (markdown, {placeholder: svg html})
+
+    Placeholders survive Markdown conversion as their own paragraph and are
+    replaced afterwards, so the SVG markup never goes through the Markdown parser.
+    They are named after a hash of the diagram, so adding or removing one diagram
+    leaves the text of every other section, and its section cache entry, alone.
+    overrides maps diagram names to SVG markup used instead of the built-in one.
+    """
+    parts = []
+    svgs = {}
+    pos = 0
+    for start, end, line, source in scan_mermaid_blocks(md_content):
+        try:
+            name, svg = svg_for_mermaid(source, cache=cache)
+            if overrides and name in overrides:
+                svg = overrides[name]
+            html = f'<div class="mermaid">{svg}</div>'
+        except MermaidError as e:
+            print(f"Warning: Mermaid block at line {line} not rendered: {e}")
+            html = '<p>[Diagram - See HTML version]</p>'
+        placeholder = f"MERMAIDSVGPLACEHOLDER{hashlib.sha256(source.encode('utf-8')).hexdigest()[:16]}"
+        svgs[f"<p>{placeholder}</p>"] = html
+        parts.append(md_content[pos:start])
+        parts.append(f"\n{placeholder}\n")
+        pos = end
+    parts.append(md_content[pos:])
+    return ''.join(parts), svgs
+
+# Converters share a parsed stylesheet; watch mode re-creates them on every stylesheet edit,
+# so only the last few versions are kept
+@functools.lru_cache(maxsize=4)
+def _parsed_stylesheet(stylesheet, font_config):
+    """Parse a stylesheet once per process; its @font-face rules are loaded into font_config then"""
+    from weasyprint import CSS
+
+    return CSS(string=stylesheet, font_config=font_config)
+
+class Converter:
+    """Markdown-to-PDF converter that sets up Markdown, CSS and fonts once.
+
+    Keep one instance around to convert many documents: the Markdown instance
+    is reset between documents, and the parsed stylesheet and font
+    configuration are shared. Instances are not thread-safe.
+    """
+
+    def __init__(self, stylesheet=STYLESHEET, extensions=MARKDOWN_EXTENSIONS, cache=None, backend=None,
+                 table_rows=DEFAULT_TABLE_ROWS, code_lines=DEFAULT_CODE_LINES, fonts=None):
+        with stage('setup'):
+            # Mermaid diagrams and Markdown sections are cached here; False disables it
+            self.cache = BuildCache() if cache is None else cache
+            # Bundled fonts (see fonts.py); fontconfig must be set up before weasyprint loads
+            self.fonts_dir = fonts_dir(fonts)
+            configure_fontconfig(self.fonts_dir, self.cache.cache_dir if self.cache else None)
+            self.stylesheet = font_face_css(self.fonts_dir) + stylesheet
+            self.extensions = list(extensions)
+            self.font_config = shared_font_configuration()
+            self.css = _parsed_stylesheet(self.stylesheet, self.font_config)
+            # See md_backends; python-markdown re-converts only the sections that changed
+            self.backend = backend_name(backend)
+            self.md = create_backend(self.backend, self.extensions, self.cache)
+            # Longer tables and code blocks are split into page-sized chunks (0: never)
+            self.table_rows = table_rows
+            self.code_lines = code_lines
+            # {diagram name: svg} replacing generate_svgs output, e.g. edited svg-diagrams/ files
+            self.svg_overrides = {}
+
+    def to_html(self, text):
+        """Convert Markdown text to an HTML fragment with Mermaid blocks as inline SVG"""
+        if f'id="{SHARED_DEFS_ID}"' in text:
+            # Diagrams would point at markers in another <svg>, which WeasyPrint leaves unresolved
+            raise ValueError("this Markdown was generated with --embed inline, whose diagrams share "
+                             "<defs> across <svg> elements; WeasyPrint does not resolve url(#...) "
+                             "between them, so regenerate it with --embed raw")
+        with stage('mermaid'):
+            md_content, svgs = inline_mermaid_svgs(text, self.cache, self.svg_overrides)
+        with stage('markdown'):
+            html_content = self.md.convert(md_content)
+        with stage('split'):
+            html_content = split_large_blocks(html_content, self.table_rows, self.code_lines)
+        return MERMAID_PLACEHOLDER.sub(lambda m: svgs[m.group(0)], html_content)
+
+    def html_document(self, html_content):
+        """Wrap an HTML fragment in a standalone page with the stylesheet embedded"""
+        return f"""
         <!DOCTYPE html>
         <html>
         <head>
             <meta charset="UTF-8">
-            <style>
-                @page {{
-                    size: A4;
-                    margin: 2cm;
-                }}
-                body {{
-                    font-family: 'Helvetica Neue', Arial, sans-serif;
-                    line-height: 1.6;
-                    color: #1f2937;
-                    font-size: 11pt;
-                }}
-                h1 {{
-                    font-size: 24pt;
-                    color: #111827;
-                    text-align: center;
-                    margin: 40px 0 20px 0;
-                    page-break-after: avoid;
-                }}
-                h2 {{
-                    font-size: 18pt;
-                    color: #1f2937;
-                    margin-top: 30px;
-                    margin-bottom: 15px;
-                    border-bottom: 2px solid #e5e7eb;
-                    padding-bottom: 8px;
-                    page-break-after: avoid;
-                }}
-                h3 {{
-                    font-size: 14pt;
-                    color: #374151;
-                    margin-top: 20px;
-                    margin-bottom: 10px;
-                    page-break-after: avoid;
-                }}
-                h4 {{
-                    font-size: 12pt;
-                    color: #4b5563;
-                    margin-top: 15px;
-                    margin-bottom: 8px;
-                }}
-                p {{
-                    margin: 10px 0;
-                    text-align: justify;
-                }}
-                table {{
-                    border-collapse: collapse;
-                    width: 100%;
-                    margin: 20px 0;
-                    font-size: 10pt;
-                    page-break-inside: avoid;
-                }}
-                th, td {{
-                    border: 1px solid #d1d5db;
-                    padding: 8px 12px;
-                    text-align: left;
-                }}
-                th {{
-                    background-color: #f3f4f6;
-                    font-weight: bold;
-                    color: #111827;
-                }}
-                tr:nth-child(even) {{
-                    background-color: #f9fafb;
-                }}
-                code {{
-                    background-color: #f3f4f6;
-                    padding: 2px 4px;
-                    border-radius: 3px;
-                    font-family: 'Courier New', monospace;
-                    font-size: 9pt;
-                }}
-                pre {{
-                    background-color: #f3f4f6;
-                    padding: 12px;
-                    border-radius: 6px;
-                    overflow-x: auto;
-                    font-size: 9pt;
-                    line-height: 1.4;
-                    page-break-inside: avoid;
-                }}
-                blockquote {{
-                    border-left: 4px solid #3b82f6;
-                    margin: 20px 0;
-                    padding-left: 16px;
-                    color: #4b5563;
-                    font-style: italic;
-                }}
-                ul, ol {{
-                    margin: 10px 0;
-                    padding-left: 30px;
-                }}
-                li {{
-                    margin: 5px 0;
-                }}
-                strong {{
-                    color: #111827;
-                    font-weight: bold;
-                }}
-                em {{
-                    font-style: italic;
-                }}
-                hr {{
-                    border: none;
-                    border-top: 1px solid #e5e7eb;
-                    margin: 30px 0;
-                }}
-                div[align="center"] {{
-                    text-align: center;
-                    margin: 20px 0;
-                }}
-                .page-break {{
-                    page-break-after: always;
-                }}
-                .no-break {{
-                    page-break-inside: avoid;
-                }}
-            </style>
+            <style>{self.stylesheet}</style>
         </head>
         <body>
             {html_content}
         </body>
         </html>
         """
-        
-        # Generate PDF
-        HTML(string=styled_html).write_pdf(output_file)
-        print(f"PDF successfully created: {output_file}")
-        
-        # Also save the HTML version
-        html_file = output_file.replace('.pdf', '.html')
-        with open(html_file, 'w', encoding='utf-8') as f:
-            f.write(styled_html)
-        print(f"HTML version also saved: {html_file}")
-        
-    except ImportError:
-        print("WeasyPrint not found. Installing...")
-        install_weasyprint()
-        # Try again after installation
-        convert_md_to_pdf(input_file, output_file)
+
+    def render(self, html_content, extra_stylesheets=(), **options):
+        """Lay out an HTML fragment with the pre-parsed stylesheet; return the weasyprint Document
+
+        extra_stylesheets are CSS strings applied after the main stylesheet.
+        Extra keyword options are passed to weasyprint's render.
+        """
+        from weasyprint import CSS, HTML
+        with stage('layout'):
+            stylesheets = [self.css] + [CSS(string=css, font_config=self.font_config) for css in extra_stylesheets]
+            page = f'<!DOCTYPE html><html><head><meta charset="UTF-8"></head><body>{html_content}</body></html>'
+            return HTML(string=page).render(font_config=self.font_config, stylesheets=stylesheets, **options)
+
+    def write_pdf(self, html_content, target=None, extra_stylesheets=(), **options):
+        """Lay out an HTML fragment and write it as PDF; returns bytes if target is None"""
+        # render + write_pdf is what HTML.write_pdf does, split so each half is timed
+        document = self.render(html_content, extra_stylesheets, **options)
+        with stage('write_pdf'):
+            return document.write_pdf(target, **options)
+
+    def convert(self, text):
+        """Convert Markdown text to PDF bytes"""
+        return self.write_pdf(self.to_html(text))
+
+    def convert_file(self, src, dst):
+        """Convert a Markdown file to a PDF file and return the standalone HTML"""
+        with open(src, 'r', encoding='utf-8') as f:
+            html_content = self.to_html(f.read())
+        with atomic_output(dst) as pdf_file:
+            self.write_pdf(html_content, pdf_file)
+        return self.html_document(html_content)
+
+_shared_converters = {}
+
+def _shared_converter(cache=None, backend=None):
+    """Return this process's Converter for the default stylesheet, creating it once"""
+    if cache is None:
+        cache = BuildCache()
+    key = (cache.cache_dir if cache else False, backend_name(backend), fonts_dir())
+    if key not in _shared_converters:
+        _shared_converters[key] = Converter(cache=cache, backend=backend)
+    return _shared_converters[key]
+
+def convert_md_to_pdf(input_file, output_file, cache=None, optimize=False, markdown_backend=None):
+    """Convert markdown to PDF using weasyprint
+
+    cache is a BuildCache (default: the shared one) or False to always re-render.
+    optimize recompresses images, deduplicates and recompresses objects and
+    linearizes the PDF (needs pikepdf). markdown_backend is one of md_backends.BACKEND_PACKAGES
+    (default: $REPORT_MARKDOWN_BACKEND or python-markdown).
+    """
+    try:
+        with stage('convert', document=input_file, converter='weasyprint'):
+            return _convert_md_to_pdf(input_file, output_file, cache, optimize, markdown_backend)
+    except ImportError as e:
+        print(f"Error: {e}")
+        print(f"Install the converter dependencies with: {sys.executable} -m pip install "
+              + " ".join(REQUIRED_PACKAGES))
+        return False
     except Exception as e:
         print(f"Error: {e}")
         print("\nTip: Open the HTML file in Chrome/Safari and use Print > Save as PDF")
+        return False
+
+def write_pdf_and_html(converter, html_content, output_file, html_file, optimize=False):
+    """Write the PDF (optionally optimized) and the standalone HTML, each only if its content changed"""
+    # The PDF replaces output_file only once it is complete
+    with atomic_output(output_file) as pdf_file:
+        converter.write_pdf(html_content, pdf_file, **(WEASYPRINT_OPTIONS if optimize else {}))
+        if optimize:
+            try:
+                with stage('optimize'):
+                    report_savings(output_file, *optimize_pdf(pdf_file))
+            except ImportError:
+                print("Warning: pikepdf is not installed, skipping PDF optimization")
+    print(f"PDF successfully created: {output_file}")
+    
+    # Also save the HTML version
+    with stage('write_html'):
+        write_output(html_file, converter.html_document(html_content))
+    print(f"HTML version also saved: {html_file}")
+
+def _convert_md_to_pdf(input_file, output_file, cache, optimize, markdown_backend):
+    if cache is None:
+        cache = BuildCache()
+    # Bundled fonts must be configured before weasyprint loads fontconfig
+    configure_fontconfig(None, cache.cache_dir if cache else None)
+    import weasyprint
+    
+    # Read markdown file
+    with stage('read'):
+        with open(input_file, 'r', encoding='utf-8') as f:
+            md_content = f.read()
+    
+    html_file = output_file.replace('.pdf', '.html')
+    if cache:
+        with stage('cache_lookup'):
+            key = cache_key(md_content, STYLESHEET, MARKDOWN_EXTENSIONS, f"mermaid-svg-{RENDERER_VERSION}",
+                            f"weasyprint-{weasyprint.__version__}", backend_label(markdown_backend),
+                            f"split={DEFAULT_TABLE_ROWS},{DEFAULT_CODE_LINES}", font_fingerprint(fonts_dir()),
+                            f"optimize={optimize}", f"svgs={resolved_svg_digest(md_content)}")
+            hit = cache.restore(key, '.pdf', output_file) and cache.restore(key, '.html', html_file)
+        if hit:
+            print(f"PDF restored from cache: {output_file}")
+            return True
+    
+    # Convert markdown to HTML, with mermaid blocks as inline SVG
+    converter = _shared_converter(cache, markdown_backend)
+    html_content = converter.to_html(md_content)
+    write_pdf_and_html(converter, html_content, output_file, html_file, optimize)
+    
+    if cache:
+        with stage('cache_store'):
+            cache.put(key, '.html', source=html_file)
+            cache.put(key, '.pdf', source=output_file)
+    return True
+
+def collect_markdown_files(source):
+    """Expand a directory or glob pattern into a sorted list of Markdown files"""
+    if os.path.isdir(source):
+        source = os.path.join(source, '*.md')
+    return sorted(path for path in glob.glob(source) if os.path.isfile(path))
+
+def _init_worker(cache=None):
+    """Set up the rendering stack once per worker process"""
+    _shared_converter(cache)
+
+def _convert_worker(input_file, output_file, cache, optimize):
+    """Convert one file inside a worker and return (input_file, output_file, ok, output counts)"""
+    reset_counts()
+    with worker_profiled():
+        ok = convert_md_to_pdf(input_file, output_file, cache, optimize)
+    return input_file, output_file, ok, dict(output_counts)
+
+def convert_batch(source, output_dir=None, workers=None, cache=None, optimize=False):
+    """Convert every Markdown file matched by source in parallel worker processes"""
+    input_files = collect_markdown_files(source)
+    if not input_files:
+        print(f"No Markdown files found for: {source}")
+        return []
+
+    # Check once in the parent instead of failing in every worker
+    try:
+        check_requirements(REQUIRED_PACKAGES)
+    except MissingDependencyError as e:
+        print(e)
+        return []
+
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    jobs = []
+    for input_file in input_files:
+        pdf_name = os.path.splitext(os.path.basename(input_file))[0] + '.pdf'
+        target_dir = output_dir or os.path.dirname(input_file)
+        jobs.append((input_file, os.path.join(target_dir, pdf_name), cache, optimize))
+
+    workers = workers or os.cpu_count() or 1
+    print(f"Converting {len(jobs)} files with {workers} workers...")
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(cache,)) as pool:
+        futures = {pool.submit(_convert_worker, *job): job for job in jobs}
+        for future in as_completed(futures):
+            input_file, output_file, _, _ = futures[future]
+            try:
+                input_file, output_file, ok, counts = future.result()
+                add_counts(counts)
+                results.append((input_file, output_file, ok))
+            except Exception as e:
+                # A crashed worker only fails its own document
+                print(f"Error: {input_file}: {e}")
+                results.append((input_file, output_file, False))
+
+    results.sort()
+    failed = [input_file for input_file, _, ok in results if not ok]
+    for input_file, output_file, ok in results:
+        print(f"{'OK    ' if ok else 'FAILED'} {input_file}")
+    print(f"\n{len(results) - len(failed)} succeeded, {len(failed)} failed")
+    report_outputs()
+    return results
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert Markdown reports to PDF using weasyprint")
+    parser.add_argument('--batch', metavar='DIR_OR_GLOB',
+                        help="convert every Markdown file in a directory or matching a glob")
+    parser.add_argument('--output-dir', help="directory for batch output (default: next to each input)")
+    parser.add_argument('--workers', type=int, help="worker processes for batch mode (default: all cores)")
+    parser.add_argument('--cache-dir', help="shared build cache directory (default: $REPORT_BUILD_CACHE)")
+    parser.add_argument('--no-cache', action='store_true', help="always re-render, ignoring the build cache")
+    parser.add_argument('--optimize', action='store_true',
+                        help="recompress images, deduplicate and recompress objects and linearize the PDF")
+    parser.add_argument('--sections', action='store_true',
+                        help="lay out each # and ## section in parallel, each starting on a new page, "
+                             "and merge the PDFs (needs pikepdf)")
+    add_font_arguments(parser)
+    add_backend_argument(parser)
+    add_instrument_arguments(parser)
+    args = parser.parse_args()
+
+    if args.timings:
+        log_to(args.timings)
+    if args.markdown_backend:
+        select_backend(args.markdown_backend)
+    apply_font_arguments(args)
+
+    cache = False if args.no_cache else BuildCache(args.cache_dir)
+
+    if args.batch:
+        with profiled(args.profile):
+            results = convert_batch(args.batch, args.output_dir, args.workers, cache, args.optimize)
+        sys.exit(0 if results and all(ok for _, _, ok in results) else 1)
+
     input_md = "/Users/alexanderfedin/Projects/demo/AI-Developer-ROI-Report-2025.md"
     output_pdf = "/Users/alexanderfedin/Projects/demo/AI-Developer-ROI-Report-2025.pdf"
     
-    convert_md_to_pdf(input_md, output_pdf)
\ No newline at end of file
+    try:
+        check_requirements(REQUIRED_PACKAGES + BACKEND_PACKAGES[backend_name()])
+    except MissingDependencyError as e:
+        print(e)
+        sys.exit(1)
+    
+    with profiled(args.profile):
+        if args.sections:
+            from section_render import convert_md_to_pdf_sections
+            convert_md_to_pdf_sections(input_md, output_pdf, args.workers, cache)
+        else:
+            convert_md_to_pdf(input_md, output_pdf, cache, args.optimize)
+    report_outputs()
\ No newline at end of file
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Write every output format of a report from a single weasyprint layout
+
+The Markdown is converted and laid out once; the resulting Document is kept
+and written as the PDF, the standalone HTML, page-range extracts (copies of
+the laid-out pages, no new layout) and per-page PNG thumbnails. Thumbnails are
+rasterized from the PDF bytes already in memory with pypdfium2 (optional).
+"""
+import argparse
+import io
+import os
+import re
+import sys
+
+from convert_to_pdf_weasyprint import REQUIRED_PACKAGES, _shared_converter
+from instrument import stage
+from output_files import report_outputs, write_output
+from pdf_optimize import WEASYPRINT_OPTIONS
+from preflight import MissingDependencyError, check_requirements
+
+PAGE_RANGE = re.compile(r'^\s*(\d*)\s*(?:(-)\s*(\d*))?\s*$')
+
+# Thumbnail resolution: 36 dpi makes an A4 page about 300 pixels tall
+DEFAULT_THUMBNAIL_DPI = 36
+
+def parse_page_range(spec, page_count):
+    """Turn '3', '2-5', '-4' or '7-' (1-based, inclusive) into a list of 0-based page indexes"""
+    match = PAGE_RANGE.match(spec)
+    if not match or not (match.group(1) or match.group(3)):
+        raise ValueError(f"invalid page range {spec!r}")
+    first = int(match.group(1) or 1)
+    last = int(match.group(3) or page_count) if match.group(2) else first
+    if not 1 <= first <= last <= page_count:
+        raise ValueError(f"page range {spec!r} is outside pages 1-{page_count}")
+    return list(range(first - 1, last))
+
+def write_thumbnails(pdf_bytes, output_dir, dpi=DEFAULT_THUMBNAIL_DPI):
+    """Rasterize every page of a PDF to output_dir/page-NNN.png; return the paths"""
+    import pypdfium2
+
+    os.makedirs(output_dir, exist_ok=True)
+    pdf = pypdfium2.PdfDocument(pdf_bytes)
+    paths = []
+    try:
+        for index in range(len(pdf)):
+            page = pdf[index]
+            # PDF units are 1/72 inch
+            image = page.render(scale=dpi / 72).to_pil()
+            path = os.path.join(output_dir, f"page-{index + 1:03d}.png")
+            png = io.BytesIO()
+            image.save(png, format='PNG', optimize=True)
+            write_output(path, png.getvalue())
+            paths.append(path)
+            page.close()
+    finally:
+        pdf.close()
+    return paths
+
+def render_outputs(input_file, output_file, thumbnail_dpi=None, page_ranges=(), cache=None, optimize=False):
+    """Lay the report out once and write PDF, HTML, extracts and thumbnails.
+
+    Returns {'pdf': path, 'html': path, 'extracts': [paths], 'thumbnails': [paths]}.
+    Thumbnails are skipped with a warning when pypdfium2 is not installed.
+    """
+    stem = os.path.splitext(output_file)[0]
+    options = WEASYPRINT_OPTIONS if optimize else {}
+    outputs = {'pdf': output_file, 'html': stem + '.html', 'extracts': [], 'thumbnails': []}
+    with stage('fanout', document=input_file):
+        converter = _shared_converter(cache)
+        with stage('read'):
+            with open(input_file, 'r', encoding='utf-8') as f:
+                md_content = f.read()
+        html_content = converter.to_html(md_content)
+        document = converter.render(html_content, **options)
+
+        with stage('write_pdf'):
+            pdf_bytes = document.write_pdf(**options)
+            write_output(output_file, pdf_bytes)
+        print(f"PDF successfully created: {output_file} ({len(document.pages)} pages)")
+
+        with stage('write_html'):
+            write_output(outputs['html'], converter.html_document(html_content))
+        print(f"HTML version also saved: {outputs['html']}")
+
+        with stage('extracts'):
+            for spec in page_ranges:
+                indexes = parse_page_range(spec, len(document.pages))
+                label = str(indexes[0] + 1) if len(indexes) == 1 else f"{indexes[0] + 1}-{indexes[-1] + 1}"
+                path = f"{stem}.pages-{label}.pdf"
+                write_output(path, document.copy([document.pages[i] for i in indexes]).write_pdf(**options))
+                outputs['extracts'].append(path)
+                print(f"Pages {label} saved: {path}")
+
+        if thumbnail_dpi:
+            try:
+                with stage('thumbnails'):
+                    outputs['thumbnails'] = write_thumbnails(pdf_bytes, stem + '-thumbnails', thumbnail_dpi)
+                print(f"{len(outputs['thumbnails'])} thumbnails saved: {stem}-thumbnails/")
+            except ImportError:
+                print("Warning: pypdfium2 is not installed, skipping thumbnails")
+    return outputs
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write PDF, HTML, page extracts and thumbnails from one layout")
+    parser.add_argument('input')
+    parser.add_argument('output', nargs='?')
+    parser.add_argument('--thumbnails', type=int, nargs='?', const=DEFAULT_THUMBNAIL_DPI, metavar='DPI',
+                        help=f"write per-page PNG thumbnails (default when given: {DEFAULT_THUMBNAIL_DPI} dpi)")
+    parser.add_argument('--pages', action='append', default=[], metavar='RANGE',
+                        help="also write these pages as a separate PDF, e.g. 1-3 or 5- (repeatable)")
+    parser.add_argument('--optimize', action='store_true', help="recompress images")
+    args = parser.parse_args()
+
+    try:
+        check_requirements(REQUIRED_PACKAGES)
+    except MissingDependencyError as e:
+        print(e)
+        sys.exit(1)
+    output = args.output or os.path.splitext(args.input)[0] + '.pdf'
+    try:
+        render_outputs(args.input, output, args.thumbnails, args.pages, optimize=args.optimize)
+        report_outputs()
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Bundled report fonts and a reusable fontconfig setup
+
+The stylesheets name fonts (Helvetica Neue, Segoe UI, ...) that Linux render
+hosts do not have, so every render falls back through fontconfig and the
+result depends on the host. A font set can be bundled instead: a directory
+with one subdirectory per role, e.g.
+
+    fonts/sans/Inter-Regular.ttf, fonts/sans/Inter-Bold.ttf, fonts/sans/Inter-Italic.ttf
+    fonts/mono/JetBrainsMono-Regular.ttf
+
+(the fonts/ directory next to these scripts, $REPORT_FONTS_DIR or --fonts-dir).
+Each role becomes an @font-face family ('Report Sans', 'Report Mono', ...)
+that the stylesheets list first; weight and style come from the file name.
+
+configure_fontconfig() points fontconfig at a generated fonts.conf that
+loads the bundled fonts and keeps fontconfig's scan cache in the build cache
+directory, so a new process does not rescan them. The host's fonts stay
+available as a fallback for glyphs the bundle lacks (emoji, a missing mono
+role); --no-system-fonts or $REPORT_SYSTEM_FONTS=0 leaves them out, so every
+host resolves the same files. It must run before weasyprint is imported; the
+converters call it first thing.
+"""
+import argparse
+import hashlib
+import os
+import re
+import sys
+from html import escape
+from pathlib import Path
+
+from build_cache import DEFAULT_CACHE_DIR
+
+FONTS_ENV = 'REPORT_FONTS_DIR'
+SYSTEM_FONTS_ENV = 'REPORT_SYSTEM_FONTS'
+DEFAULT_FONTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts')
+
+FONT_EXTENSIONS = ('.ttf', '.otf', '.woff', '.woff2')
+
+# Subdirectory name -> family name used in the stylesheets
+FAMILY_NAMES = {
+    'sans': 'Report Sans',
+    'serif': 'Report Serif',
+    'mono': 'Report Mono',
+}
+
+# Checked in order, so SemiBold wins over Bold and ExtraLight over Light
+WEIGHTS = [
+    ('thin', 100), ('extralight', 200), ('ultralight', 200), ('light', 300), ('medium', 500),
+    ('semibold', 600), ('demibold', 600), ('extrabold', 800), ('ultrabold', 800), ('bold', 700),
+    ('black', 900), ('heavy', 900),
+]
+ITALIC = re.compile(r'italic|oblique', re.I)
+
+_configured = None
+
+def fonts_dir(path=None):
+    """Return the bundled font directory (path, $REPORT_FONTS_DIR or ./fonts), or None if there is none"""
+    path = path or os.environ.get(FONTS_ENV) or DEFAULT_FONTS_DIR
+    return os.path.abspath(path) if os.path.isdir(path) else None
+
+def use_fonts_dir(path):
+    """Make path the font directory for this process and the worker processes it starts"""
+    if not os.path.isdir(path):
+        raise ValueError(f"font directory not found: {path}")
+    os.environ[FONTS_ENV] = os.path.abspath(path)
+
+def system_fonts_enabled():
+    """Whether the host's fonts back up the bundled ones ($REPORT_SYSTEM_FONTS, default on)"""
+    return os.environ.get(SYSTEM_FONTS_ENV, '1').lower() not in ('0', 'no', 'false', 'off')
+
+def use_system_fonts(enabled):
+    """Turn the system font fallback on or off for this process and the worker processes it starts"""
+    os.environ[SYSTEM_FONTS_ENV] = '1' if enabled else '0'
+
+def add_font_arguments(parser):
+    """Add the --fonts-dir and --no-system-fonts options to an argparse parser"""
+    parser.add_argument('--fonts-dir', help=f"bundled font directory (default: ${FONTS_ENV} or ./fonts)")
+    parser.add_argument('--no-system-fonts', action='store_true',
+                        help="use only the bundled fonts, without the host's fonts as a fallback")
+
+def apply_font_arguments(args):
+    """Apply the options added by add_font_arguments"""
+    if args.fonts_dir:
+        use_fonts_dir(args.fonts_dir)
+    if args.no_system_fonts:
+        use_system_fonts(False)
+
+def scan_fonts(directory):
+    """List (family, weight, style, path) for every font file under directory"""
+    fonts = []
+    for path in sorted(Path(directory).rglob('*')):
+        if path.suffix.lower() not in FONT_EXTENSIONS:
+            continue
+        # Files directly in the directory are sans
+        parts = path.relative_to(directory).parts
+        role = parts[0] if len(parts) > 1 else 'sans'
+        family = FAMILY_NAMES.get(role.lower(), f"Report {role.title()}")
+        # 'Inter-SemiBoldItalic' -> 'semibolditalic'
+        style_name = re.sub(r'[^a-z]', '', path.stem.rsplit('-', 1)[1].lower()) if '-' in path.stem else ''
+        weight = next((value for name, value in WEIGHTS if name in style_name), 400)
+        style = 'italic' if ITALIC.search(style_name) else 'normal'
+        fonts.append((family, weight, style, str(path)))
+    return fonts
+
+def font_face_css(directory):
+    """@font-face rules for the bundled fonts ('' without a font directory)"""
+    if not directory:
+        return ''
+    rules = []
+    for family, weight, style, path in scan_fonts(directory):
+        rules.append(f"@font-face {{ font-family: '{family}'; src: url('{Path(path).as_uri()}'); "
+                     f"font-weight: {weight}; font-style: {style}; }}")
+    return "\n".join(rules) + "\n"
+
+_font_digests = {}
+
+def _font_digest(path):
+    # Content hash, remembered per (path, size, mtime) so unchanged files are read once per process
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    if key not in _font_digests:
+        with open(path, 'rb') as f:
+            _font_digests[key] = hashlib.sha256(f.read()).hexdigest()
+    return _font_digests[key]
+
+def font_fingerprint(directory):
+    """Hash of the bundled font files (relative names and contents) and the fallback setting, for cache keys
+
+    Contents rather than mtimes: a fresh checkout on another runner hits the same cache entries.
+    """
+    if not directory:
+        return 'fonts-none'
+    digest = hashlib.sha256(f"system={system_fonts_enabled()}\0".encode())
+    for _, _, _, path in scan_fonts(directory):
+        digest.update(f"{os.path.relpath(path, directory)}\0{_font_digest(path)}\0".encode())
+    return f"fonts-{digest.hexdigest()[:16]}"
+
+def configure_fontconfig(directory=None, cache_dir=None, include_system=None):
+    """Point fontconfig at the bundled fonts through a generated, cached fonts.conf.
+
+    include_system (default: system_fonts_enabled()) also loads the host's
+    fonts as a fallback for glyphs the bundle lacks, such as emoji. Does
+    nothing without a font directory or when $FONTCONFIG_FILE is already set
+    by the caller; returns the fonts.conf path in use, or None.
+    """
+    global _configured
+    if include_system is None:
+        include_system = system_fonts_enabled()
+    directory = fonts_dir(directory)
+    if not directory:
+        return None
+    if _configured:
+        return _configured
+    if os.environ.get('FONTCONFIG_FILE'):
+        return None
+    config_dir = os.path.join(cache_dir or DEFAULT_CACHE_DIR, 'fontconfig',
+                              hashlib.sha256(f"{directory}\0{include_system}".encode()).hexdigest()[:16])
+    os.makedirs(config_dir, exist_ok=True)
+    config = ['<?xml version="1.0"?>', '<!DOCTYPE fontconfig SYSTEM "urn:fontconfig:fonts.dtd">', '<fontconfig>',
+              f"  <dir>{escape(directory)}</dir>",
+              f"  <cachedir>{escape(os.path.join(config_dir, 'cache'))}</cachedir>"]
+    if include_system:
+        config.append('  <include ignore_missing="yes">/etc/fonts/fonts.conf</include>')
+    config.append('</fontconfig>')
+    path = os.path.join(config_dir, 'fonts.conf')
+    content = "\n".join(config) + "\n"
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            current = f.read()
+    except OSError:
+        current = None
+    if current != content:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+    os.environ['FONTCONFIG_FILE'] = _configured = path
+    return path
+
+_font_configurations = {}
+
+def shared_font_configuration():
+    """Return this process's weasyprint FontConfiguration, creating it once.
+
+    Building one loads the fontconfig configuration and, per @font-face,
+    copies the font into a private fontconfig setup; sharing it means that
+    happens once per process instead of once per converter.
+    """
+    from weasyprint.text.fonts import FontConfiguration
+
+    key = os.environ.get('FONTCONFIG_FILE')
+    if key not in _font_configurations:
+        _font_configurations[key] = FontConfiguration()
+    return _font_configurations[key]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the bundled font set and write its fontconfig configuration")
+    add_font_arguments(parser)
+    parser.add_argument('--cache-dir', help="build cache directory for the fontconfig cache")
+    args = parser.parse_args()
+    apply_font_arguments(args)
+
+    directory = fonts_dir(args.fonts_dir)
+    if not directory:
+        print("No bundled fonts: the stylesheets fall back to the host's fonts")
+        sys.exit(1)
+    for family, weight, style, path in scan_fonts(directory):
+        print(f"{family:<14} {weight} {style:<7} {os.path.relpath(path, directory)}")
+    print(f"fontconfig: {configure_fontconfig(directory, args.cache_dir)}")
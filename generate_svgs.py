@@ -2,9 +2,18 @@
 """
 Generate SVG files from Mermaid diagrams
 """
+import argparse
+import hashlib
 import os
 import re
 
+from build_cache import cache_key
+from instrument import add_instrument_arguments, log_to, profiled, stage
+from mermaid_svg import RENDERER_VERSION, MermaidError, render_mermaid
+from output_files import report_outputs, write_output
+from svg_embed import EMBED_MODES, SHARED_DEFS_ID, data_uri_reference, external_reference, inline_with_shared_defs
+from svg_optimize import optimize_svg, report_reduction
+
 # Define all SVG diagrams
 svg_diagrams = {
     "diagram1_key_findings": '''<svg width="600" height="200" xmlns="http://www.w3.org/2000/svg">
@@ -460,65 +469,258 @@ svg_diagrams = {
 </svg>'''
 }
 
-def create_markdown_with_svgs():
-    """Replace Mermaid diagrams with SVG in the markdown file"""
+# Mermaid fences are located by plain substring search, so the document is scanned once
+MERMAID_OPEN = '```mermaid\n'
+MERMAID_CLOSE = '\n```'
+
+# (diagram type, title) -> key in svg_diagrams
+DIAGRAM_LOOKUP = {
+    ('graph', 'AI Developer'): "diagram1_key_findings",
+    ('graph', 'Annual Cost Comparison (USD)'): "diagram2_annual_cost",
+    ('pie', 'Startup Cost Savings with AI Developer'): "diagram3_startup_savings",
+    ('graph', 'Monthly Cost for 40 hours'): "diagram4_monthly_cost",
+    ('gantt', 'AI Developer Task Completion Timeline'): "diagram5_timeline",
+    ('graph', 'Annual Salaries in India (USD)'): "diagram6_india_salaries",
+    ('graph', 'Cost for 10 User Stories'): "diagram7_cost_10_stories",
+    ('pie', 'Cost Distribution: Enterprise Development'): "diagram8_enterprise_cost",
+    ('graph', 'Documentation Quality Score (out of 10)'): "diagram9_doc_quality",
+    ('graph', 'Annual Availability (Hours)'): "diagram10_availability",
+    ('graph', 'Code Quality Over Time'): "diagram11_quality_time",
+    ('graph', '5-Year TCO Comparison'): "diagram12_5year_tco",
+    ('graph', 'Software Development Evolution'): "diagram13_evolution",
+}
+
+GRAPH_NODE_LABEL = re.compile(r'^\s*\w+\["?(.*?)"?\]')
+
+def scan_mermaid_blocks(content):
+    """Yield (start, end, line, source) for every ```mermaid block in a single pass"""
+    pos = 0
+    line = 1
+    while True:
+        start = content.find(MERMAID_OPEN, pos)
+        if start == -1:
+            return
+        if start > 0 and content[start - 1] != '\n':
+            # Not at the beginning of a line, so not a fence
+            line += content.count('\n', pos, start + 1)
+            pos = start + 1
+            continue
+        body_start = start + len(MERMAID_OPEN)
+        close = content.find(MERMAID_CLOSE, body_start - 1)
+        if close == -1:
+            return
+        end = close + len(MERMAID_CLOSE)
+        line += content.count('\n', pos, start)
+        yield start, end, line, content[body_start:close + 1]
+        line += content.count('\n', start, end)
+        pos = end
+
+def classify_mermaid(source):
+    """Return (diagram type, title) for a Mermaid block.
+
+    The title is the first subgraph title for graphs (or the first node label
+    when there is no subgraph), the pie title, or the gantt title.
+    """
+    kind = None
+    for raw in source.splitlines():
+        stripped = raw.strip()
+        if not stripped or stripped.startswith('%%'):
+            continue
+        if kind is None:
+            kind = stripped.split()[0]
+            if kind == 'pie' and ' title ' in f" {stripped} ":
+                return kind, stripped.split('title', 1)[1].strip().strip('"')
+            continue
+        if kind == 'graph':
+            if stripped.startswith('subgraph '):
+                return kind, stripped[len('subgraph '):].strip().strip('"')
+            match = GRAPH_NODE_LABEL.match(stripped)
+            if match:
+                return kind, match.group(1)
+        elif kind == 'gantt' and stripped.startswith('title '):
+            return kind, stripped[len('title '):].strip()
+    return kind, None
+
+def mermaid_diagram_name(source):
+    """Name of the diagram a Mermaid block becomes (its svg-diagrams/<name>.svg)
+
+    Blocks without a hand-made diagram are named after a hash of their source,
+    so editing text around a block keeps its name, ids and cache entry.
+    """
+    return (DIAGRAM_LOOKUP.get(classify_mermaid(source))
+            or f"diagram_{hashlib.sha256(source.encode('utf-8')).hexdigest()[:10]}")
+
+def resolved_svg_digest(content, overrides=None):
+    """Hash of the hand-made (or overriding) SVGs the Mermaid blocks in content resolve to
+
+    Natively rendered blocks add nothing: their SVG follows from the block
+    source and RENDERER_VERSION, which cache keys include anyway.
+    """
+    digest = hashlib.sha256()
+    for _, _, _, source in scan_mermaid_blocks(content):
+        name = mermaid_diagram_name(source)
+        svg = (overrides or {}).get(name, svg_diagrams.get(name))
+        if svg is not None:
+            digest.update(f"{name}\0{svg}\0".encode('utf-8'))
+    return digest.hexdigest()
+
+def load_svg_overrides(svg_dir):
+    """Return {name: svg} for the <name>.svg files in svg_dir, which replace the built-in diagrams"""
+    if not svg_dir or not os.path.isdir(svg_dir):
+        return {}
+    overrides = {}
+    for name in sorted(os.listdir(svg_dir)):
+        if name.endswith('.svg'):
+            with open(os.path.join(svg_dir, name), 'r', encoding='utf-8') as f:
+                overrides[name[:-4]] = f.read()
+    return overrides
+
+def svg_for_mermaid(source, native=False, cache=None):
+    """Return (name, svg) for one Mermaid block; raises MermaidError if it cannot be drawn.
+
+    The hand-made SVG is used when the block is in DIAGRAM_LOOKUP, unless native
+    is set. Native renders are stored in cache (a BuildCache) when one is given.
+    """
+    name = DIAGRAM_LOOKUP.get(classify_mermaid(source))
+    if name and not native:
+        return name, svg_diagrams[name]
+    name = name or mermaid_diagram_name(source)
+    if not cache:
+        return name, render_mermaid(source, diagram_id=name)
+    key = cache_key(source, name, f"mermaid-svg-{RENDERER_VERSION}")
+    path = cache.get(key, '.svg')
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            return name, f.read()
+    svg = render_mermaid(source, diagram_id=name)
+    cache.put(key, '.svg', data=svg.encode('utf-8'))
+    return name, svg
+
+def create_markdown_with_svgs(input_file='/Users/alexanderfedin/Projects/demo/AI-Developer-ROI-Report-2025.md',
+                              output_file='/Users/alexanderfedin/Projects/demo/AI-Developer-ROI-Report-2025-SVG.md',
+                              svg_dir='/Users/alexanderfedin/Projects/demo/svg-diagrams',
+                              native=False, optimize=False, embed='raw', overrides=None):
+    """Replace Mermaid diagrams with SVG in the markdown file
+
+    Blocks without a hand-made entry in svg_diagrams are rendered from their
+    Mermaid source; with native=True every block is. With optimize=True every
+    SVG goes through svg_optimize before it is written or inlined. embed is
+    one of svg_embed.EMBED_MODES and decides how diagrams appear in the markdown.
+    overrides maps diagram names to SVG markup used instead of the built-in one.
+    """
+    if embed not in EMBED_MODES:
+        raise ValueError(f"embed must be one of {', '.join(EMBED_MODES)}, not {embed!r}")
+    with stage('generate_svgs', document=input_file):
+        return _create_markdown_with_svgs(input_file, output_file, svg_dir, native, optimize, embed,
+                                          overrides or {})
+
+def _create_markdown_with_svgs(input_file, output_file, svg_dir, native, optimize, embed, overrides):
     # Read the original file
-    with open('/Users/alexanderfedin/Projects/demo/AI-Developer-ROI-Report-2025.md', 'r') as f:
-        content = f.read()
+    with stage('read'):
+        with open(input_file, 'r') as f:
+            content = f.read()
     
     # Replace each Mermaid block with corresponding SVG
-    replacements = [
-        # Diagram 1
-        (r'```mermaid\ngraph LR\n    A\[AI Developer\].*?```', svg_diagrams["diagram1_key_findings"]),
-        # Diagram 2
-        (r'```mermaid\n%%{init:.*?graph TD\n    subgraph "Annual Cost Comparison \(USD\)".*?```', svg_diagrams["diagram2_annual_cost"]),
-        # Diagram 3
-        (r'```mermaid\npie title "Startup Cost Savings with AI Developer".*?```', svg_diagrams["diagram3_startup_savings"]),
-        # Diagram 4
-        (r'```mermaid\n%%{init:.*?graph LR\n    subgraph "Monthly Cost for 40 hours".*?```', svg_diagrams["diagram4_monthly_cost"]),
-        # Diagram 5
-        (r'```mermaid\ngantt.*?```', svg_diagrams["diagram5_timeline"]),
-        # Diagram 6
-        (r'```mermaid\n%%{init:.*?graph TD\n    subgraph "Annual Salaries in India \(USD\)".*?```', svg_diagrams["diagram6_india_salaries"]),
-        # Diagram 7
-        (r'```mermaid\n%%{init:.*?graph TD\n    subgraph "Cost for 10 User Stories".*?```', svg_diagrams["diagram7_cost_10_stories"]),
-        # Diagram 8
-        (r'```mermaid\npie title "Cost Distribution: Enterprise Development".*?```', svg_diagrams["diagram8_enterprise_cost"]),
-        # Diagram 9
-        (r'```mermaid\n%%{init:.*?graph TD\n    subgraph "Documentation Quality Score \(out of 10\)".*?```', svg_diagrams["diagram9_doc_quality"]),
-        # Diagram 10
-        (r'```mermaid\n%%{init:.*?graph LR\n    subgraph "Annual Availability \(Hours\)".*?```', svg_diagrams["diagram10_availability"]),
-        # Diagram 11
-        (r'```mermaid\n%%{init:.*?graph LR\n    subgraph "Code Quality Over Time".*?```', svg_diagrams["diagram11_quality_time"]),
-        # Diagram 12
-        (r'```mermaid\n%%{init:.*?graph TD\n    subgraph "5-Year TCO Comparison".*?```', svg_diagrams["diagram12_5year_tco"]),
-        # Diagram 13
-        (r'```mermaid\n%%{init:.*?graph TD\n    subgraph "Software Development Evolution".*?```', svg_diagrams["diagram13_evolution"])
-    ]
-    
-    # Apply replacements
-    for pattern, svg in replacements:
-        content = re.sub(pattern, svg, content, flags=re.DOTALL)
+    diagrams = {} if native else {name: overrides.get(name, svg) for name, svg in svg_diagrams.items()}
+    titles = {}
+    parts = []
+    unmatched = []
+    pos = 0
+    with stage('mermaid'):
+        for start, end, line, source in scan_mermaid_blocks(content):
+            try:
+                name, svg = svg_for_mermaid(source, native)
+            except MermaidError as e:
+                kind, title = classify_mermaid(source)
+                print(f"Warning: cannot render Mermaid block at line {line} ({kind}: {title!r}): {e}; left as-is")
+                unmatched.append((line, kind, title))
+                continue
+            if name in overrides:
+                svg = overrides[name]
+            elif not native and name not in svg_diagrams:
+                print(f"Rendered Mermaid block at line {line} natively as {name}")
+            diagrams[name] = svg
+            titles.setdefault(name, classify_mermaid(source)[1] or name)
+            parts.append((content[pos:start], name))
+            pos = end
+
+    # The markup placed in the markdown for each diagram
+    embedded = {}
+    shared_defs = ''
+    if embed == 'inline':
+        with stage('embed'):
+            embedded, shared_defs = inline_with_shared_defs(diagrams)
+            if optimize:
+                embedded = {name: optimize_svg(svg, scope=name) for name, svg in embedded.items()}
+                shared_defs = shared_defs and optimize_svg(shared_defs, scope=SHARED_DEFS_ID)
+
+    if optimize:
+        print("Optimizing SVG diagrams:")
+        before_total = after_total = 0
+        with stage('optimize'):
+            for name, svg in diagrams.items():
+                diagrams[name] = optimize_svg(svg, scope=name)
+                before, after = len(svg.encode('utf-8')), len(diagrams[name].encode('utf-8'))
+                report_reduction(name, before, after)
+                before_total += before
+                after_total += after
+        report_reduction("total", before_total, after_total)
+
+    if embed != 'inline':
+        with stage('embed'):
+            for name in titles:
+                if embed == 'raw':
+                    embedded[name] = diagrams[name]
+                elif embed == 'data-uri':
+                    embedded[name] = data_uri_reference(diagrams[name], titles[name])
+                else:
+                    href = os.path.relpath(os.path.join(svg_dir, f"{name}.svg"),
+                                           os.path.dirname(os.path.abspath(output_file)))
+                    embedded[name] = external_reference(diagrams[name], href.replace(os.sep, '/'),
+                                                        titles[name], embed)
+
+    body = []
+    for text, name in parts:
+        body.append(text)
+        if shared_defs:
+            # Hoisted markers go in once, ahead of the first diagram that uses them
+            body.append(shared_defs)
+            shared_defs = ''
+        body.append(embedded[name])
+    content = ''.join(body) + content[pos:]
     
     # Save as new file
-    output_file = '/Users/alexanderfedin/Projects/demo/AI-Developer-ROI-Report-2025-SVG.md'
-    with open(output_file, 'w') as f:
-        f.write(content)
+    with stage('write_markdown'):
+        written = write_output(output_file, content)
     
-    print(f"Created: {output_file}")
+    print(f"{'Created' if written else 'Unchanged'}: {output_file}")
     
     # Also save individual SVG files
-    svg_dir = '/Users/alexanderfedin/Projects/demo/svg-diagrams'
-    os.makedirs(svg_dir, exist_ok=True)
+    with stage('write_svgs'):
+        for name, svg_content in diagrams.items():
+            svg_file = os.path.join(svg_dir, f"{name}.svg")
+            written = write_output(svg_file, svg_content)
+            print(f"{'Created' if written else 'Unchanged'}: {svg_file}")
     
-    for name, svg_content in svg_diagrams.items():
-        svg_file = os.path.join(svg_dir, f"{name}.svg")
-        with open(svg_file, 'w') as f:
-            f.write(svg_content)
-        print(f"Created: {svg_file}")
+    return unmatched
 
 if __name__ == "__main__":
-    create_markdown_with_svgs()
+    parser = argparse.ArgumentParser(description="Generate SVG files from Mermaid diagrams")
+    parser.add_argument('--native', action='store_true',
+                        help="render every diagram from its Mermaid source instead of the hand-made SVGs")
+    parser.add_argument('--optimize', action='store_true',
+                        help="minify the SVGs and report the size saved per diagram")
+    parser.add_argument('--embed', choices=EMBED_MODES, default='raw',
+                        help="how diagrams appear in the markdown (default: raw, the SVGs as they are; "
+                             "inline is for browsers, the PDF converters reject it)")
+    add_instrument_arguments(parser)
+    args = parser.parse_args()
+    if args.timings:
+        log_to(args.timings)
+
+    with profiled(args.profile):
+        create_markdown_with_svgs(native=args.native, optimize=args.optimize, embed=args.embed)
+    report_outputs()
     print("\nAll SVG diagrams have been created!")
     print("- Markdown with embedded SVGs: AI-Developer-ROI-Report-2025-SVG.md")
     print("- Individual SVG files: svg-diagrams/")
\ No newline at end of file
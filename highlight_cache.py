@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Persistent cache for codehilite's syntax highlighting
+
+HighlightCacheExtension is a python-markdown extension that makes the
+converter it is loaded into (after extra/fenced_code and codehilite) highlight
+through a HighlightCache. It replaces codehilite's treeprocessor with
+CachedHiliteTreeprocessor, a subclass building CachedCodeHilite blocks. The
+fenced_code preprocessor has no such hook (its run() creates CodeHilite by
+module-level name), so on the python-markdown versions in
+SUPPORTED_MARKDOWN_VERSIONS that run() is re-created with CachedCodeHilite
+bound instead. On other versions, or if the name is no longer looked up there,
+fenced blocks are highlighted uncached and a warning says so. Other
+converters, and python-markdown itself, are left alone.
+
+CachedCodeHilite looks the highlighted HTML of each block up by (language,
+code, formatter options incl. style, pygments version) before running
+pygments. Hits come from memory first (least recently used entries dropped
+past MAX_MEMORY_ENTRIES) and then from the HighlightCache's build cache, whose
+own eviction is least recently used too. Lexer and formatter objects are
+created once per process and option set instead of once per block.
+"""
+import functools
+import sys
+import types
+from collections import OrderedDict
+
+from build_cache import cache_key
+
+# Bump when the highlighting setup changes in a way the key does not capture
+HIGHLIGHT_FORMAT_VERSION = "1"
+
+MAX_MEMORY_ENTRIES = 4096
+
+# python-markdown releases whose fenced_code and CodeHilite.hilite the rebinding below was checked against
+SUPPORTED_MARKDOWN_VERSIONS = ((3, 4), (3, 5), (3, 6), (3, 7), (3, 8), (3, 9), (3, 10), (3, 11))
+
+_lexers = {}
+_formatters = {}
+
+def _options_key(options):
+    return repr(sorted(options.items()))
+
+def _shared(objects, factory, name, options):
+    # Unknown names are remembered too: looking one up scans every pygments plugin
+    key = (name, _options_key(options))
+    if key not in objects:
+        try:
+            objects[key] = factory(name, **options)
+        except ValueError as e:
+            objects[key] = e
+    if isinstance(objects[key], Exception):
+        raise objects[key]
+    return objects[key]
+
+def get_lexer_by_name(name, **options):
+    """pygments.lexers.get_lexer_by_name, returning one shared lexer per name and options"""
+    from pygments import lexers
+
+    return _shared(_lexers, lexers.get_lexer_by_name, name, options)
+
+def get_formatter_by_name(name, **options):
+    """pygments.formatters.get_formatter_by_name, returning one shared formatter per name and options"""
+    from pygments import formatters
+
+    return _shared(_formatters, formatters.get_formatter_by_name, name, options)
+
+def _with_globals(function, **names):
+    """A copy of function that sees names in place of its module's globals of the same name.
+
+    Returns None (after a warning) when the installed python-markdown is not
+    one this was checked against or function does not look all names up as
+    globals: the caller then keeps the original, uncached behaviour.
+    """
+    import markdown
+
+    version = tuple(markdown.__version_info__[:2])
+    unused = [name for name in names if name not in function.__code__.co_names]
+    if version not in SUPPORTED_MARKDOWN_VERSIONS or unused:
+        reason = (f"python-markdown {markdown.__version__} is not a supported version"
+                  if version not in SUPPORTED_MARKDOWN_VERSIONS else f"it no longer uses {', '.join(unused)}")
+        print(f"Warning: highlight cache bypassed for {function.__qualname__}: {reason}", file=sys.stderr)
+        return None
+    return types.FunctionType(function.__code__, dict(function.__globals__, **names), function.__name__,
+                              function.__defaults__, function.__closure__)
+
+class HighlightCache:
+    """Highlighted HTML kept in memory and, when cache is a BuildCache, on disk"""
+
+    def __init__(self, cache=None, max_entries=MAX_MEMORY_ENTRIES):
+        # A BuildCache, or None/False for memory only; may be swapped between documents
+        self.cache = cache
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def lookup(self, key):
+        """Return cached HTML for key, or None"""
+        html = self.memory.pop(key, None)
+        if html is None and self.cache:
+            path = self.cache.get(key, '.hl.html')
+            if path:
+                with open(path, 'r', encoding='utf-8') as f:
+                    html = f.read()
+        if html is not None:
+            self._remember(key, html)
+        return html
+
+    def store(self, key, html):
+        self._remember(key, html)
+        if self.cache:
+            self.cache.put(key, '.hl.html', data=html.encode('utf-8'))
+
+    def _remember(self, key, html):
+        self.memory[key] = html
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def highlighter(self, src, **options):
+        """Drop-in for CodeHilite(src, **options) that highlights through this cache"""
+        block = cached_codehilite_class()(src, **options)
+        block.highlights = self
+        return block
+
+def _make_cached_class():
+    import markdown
+    import pygments
+    from markdown.extensions.codehilite import CodeHilite
+
+    # CodeHilite.hilite with the shared lexers and formatters
+    hilite = _with_globals(CodeHilite.hilite, get_lexer_by_name=get_lexer_by_name,
+                           get_formatter_by_name=get_formatter_by_name) or CodeHilite.hilite
+
+    class CachedCodeHilite(CodeHilite):
+        """CodeHilite whose hilite() output is cached by source, language and options"""
+
+        highlights = None
+
+        def hilite(self, shebang=True):
+            if self.highlights is None:
+                return hilite(self, shebang)
+            formatter = self.pygments_formatter
+            key = cache_key(self.lang or '', self.src.strip('\n'), _options_key(self.options),
+                            formatter if isinstance(formatter, str) else f"{formatter.__module__}.{formatter.__name__}",
+                            f"shebang={shebang}", f"pygments={self.use_pygments}", self.lang_prefix,
+                            f"pygments-{pygments.__version__}", f"markdown-{markdown.__version__}",
+                            f"highlight-{HIGHLIGHT_FORMAT_VERSION}")
+            html = self.highlights.lookup(key)
+            if html is None:
+                self.highlights.stats['misses'] += 1
+                html = hilite(self, shebang)
+                self.highlights.store(key, html)
+            else:
+                self.highlights.stats['hits'] += 1
+            return html
+
+    return CachedCodeHilite
+
+@functools.lru_cache(maxsize=None)
+def cached_codehilite_class():
+    """Return the CachedCodeHilite class (needs markdown and pygments)"""
+    return _make_cached_class()
+
+@functools.lru_cache(maxsize=None)
+def _extension_class():
+    from markdown.extensions import Extension
+    from markdown.extensions.codehilite import HiliteTreeprocessor
+
+    class CachedHiliteTreeprocessor(HiliteTreeprocessor):
+        """codehilite's treeprocessor, highlighting indented code blocks through a HighlightCache"""
+
+        def __init__(self, md, config, highlights):
+            super().__init__(md)
+            self.config = config
+            self.highlights = highlights
+
+        def run(self, root):
+            for block in root.iter('pre'):
+                if len(block) == 1 and block[0].tag == 'code' and block[0].text is not None:
+                    local_config = self.config.copy()
+                    code = self.highlights.highlighter(self.code_unescape(block[0].text),
+                                                       tab_length=self.md.tab_length,
+                                                       style=local_config.pop('pygments_style', 'default'),
+                                                       **local_config)
+                    placeholder = self.md.htmlStash.store(code.hilite())
+                    # Like codehilite: a paragraph holding the placeholder, swapped for the HTML later
+                    block.clear()
+                    block.tag = 'p'
+                    block.text = placeholder
+
+    class HighlightCacheExtension(Extension):
+        """Route this converter's fenced_code and codehilite highlighting through a HighlightCache"""
+
+        def __init__(self, cache=None, **kwargs):
+            super().__init__(**kwargs)
+            self.highlights = HighlightCache(cache)
+
+        def extendMarkdown(self, md):
+            # Load after extra/fenced_code and codehilite, whose processors are replaced here
+            if 'hilite' in md.treeprocessors:
+                config = md.treeprocessors['hilite'].config
+                md.treeprocessors.register(CachedHiliteTreeprocessor(md, config, self.highlights), 'hilite', 30)
+            if 'fenced_code_block' in md.preprocessors:
+                processor = md.preprocessors['fenced_code_block']
+                run = _with_globals(type(processor).run, CodeHilite=self.highlights.highlighter)
+                if run:
+                    processor.run = types.MethodType(run, processor)
+            md.registerExtension(self)
+
+    return HighlightCacheExtension
+
+def highlight_cache_extension(cache=None):
+    """Return a HighlightCacheExtension for a BuildCache (or None/False: memory only); needs markdown"""
+    return _extension_class()(cache)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Per-stage timings, memory high-water marks and profiling for the report pipeline
+
+The converters wrap each step in stage(); every finished stage produces a
+record such as
+
+    {"stage": "markdown", "seconds": 0.0412, "process_peak_rss_bytes": 81264640,
+     "pid": 4242, "document": "report.md", "parent": "convert"}
+
+which is passed to every registered hook. Services forward records into
+their own metrics with add_hook(); log_to() writes them as JSON lines. With
+no hook registered, stage() costs next to nothing.
+
+process_peak_rss_bytes is the process's resident-set high-water mark when the
+stage ended (ru_maxrss), not the memory the stage itself used: it never goes
+down, so a stage only shows up when it raises the peak.
+
+profiled() also covers worker processes: pool workers wrap their jobs in
+worker_profiled(), and their profiles are merged into the run's pstats file.
+"""
+import contextlib
+import contextvars
+import cProfile
+import glob
+import json
+import os
+import pstats
+import resource
+import sys
+import time
+
+# Set to a file path (or '-' for stderr) to log JSON lines, including from worker processes
+TIMINGS_ENV = 'REPORT_TIMINGS'
+# The profiled() run's pstats path, for worker processes
+PROFILE_ENV = 'REPORT_PROFILE'
+
+_hooks = []
+_fields = contextvars.ContextVar('instrument_fields', default={})
+
+# The profiled() run in this process (inherited by forked workers) and the worker's own profile
+_profiler = None
+_profiler_pid = None
+_worker_profiler = None
+
+def add_hook(hook):
+    """Call hook(record) for every finished stage"""
+    _hooks.append(hook)
+    return hook
+
+def remove_hook(hook):
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+def _peak_rss():
+    """The process's peak resident set size so far, in bytes"""
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+@contextlib.contextmanager
+def stage(name, **fields):
+    """Time the enclosed block as one stage.
+
+    fields (e.g. document=path) are added to this record and to the records
+    of stages nested inside it, which also get this stage as their parent.
+    """
+    if not _hooks:
+        yield
+        return
+    inherited = _fields.get()
+    context = {**inherited, **fields, 'parent': name}
+    token = _fields.set(context)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        _fields.reset(token)
+        record = {'stage': name, 'seconds': round(seconds, 6), 'process_peak_rss_bytes': _peak_rss(),
+                  'pid': os.getpid(), **inherited, **fields}
+        for hook in list(_hooks):
+            try:
+                hook(record)
+            except Exception as e:
+                # A broken metrics sink must not fail the render
+                print(f"Warning: timing hook {hook!r} failed: {e}", file=sys.stderr)
+
+class JsonLinesHook:
+    """Hook writing one JSON object per line to a text stream"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def __call__(self, record):
+        self.stream.write(json.dumps(record) + "\n")
+        self.stream.flush()
+
+def log_to(path):
+    """Log stage records as JSON lines to path ('-' for stderr); return the hook.
+
+    The path is also exported in the environment so worker processes log too.
+    """
+    os.environ[TIMINGS_ENV] = path
+    stream = sys.stderr if path == '-' else open(path, 'a', encoding='utf-8', buffering=1)
+    return add_hook(JsonLinesHook(stream))
+
+def _worker_profile_paths(path):
+    return glob.glob(glob.escape(path) + '.worker-*')
+
+@contextlib.contextmanager
+def profiled(path):
+    """Profile the enclosed block with cProfile and dump pstats data to path (None: no-op)
+
+    Jobs that worker processes run inside worker_profiled() are added to the same file.
+    """
+    global _profiler, _profiler_pid
+    if not path:
+        yield
+        return
+    for stale in _worker_profile_paths(path):
+        os.remove(stale)
+    os.environ[PROFILE_ENV] = path
+    profiler = _profiler = cProfile.Profile()
+    _profiler_pid = os.getpid()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        _profiler = _profiler_pid = None
+        del os.environ[PROFILE_ENV]
+        stats = pstats.Stats(profiler)
+        workers = _worker_profile_paths(path)
+        for worker in workers:
+            stats.add(worker)
+            os.remove(worker)
+        stats.dump_stats(path)
+        including = f", {len(workers)} worker processes included" if workers else ""
+        print(f"Profile saved: {path}{including} (inspect with: {sys.executable} -m pstats {path})")
+
+@contextlib.contextmanager
+def worker_profiled():
+    """In a worker process of a profiled() run, add the enclosed block to the run's profile"""
+    global _worker_profiler
+    path = os.environ.get(PROFILE_ENV)
+    if not path or os.getpid() == _profiler_pid:
+        # Not profiling, or running in the profiled process itself
+        yield
+        return
+    if _worker_profiler is None:
+        if _profiler is not None:
+            # A forked worker inherits the parent's active profiler
+            _profiler.disable()
+        _worker_profiler = cProfile.Profile()
+    _worker_profiler.enable()
+    try:
+        yield
+    finally:
+        _worker_profiler.disable()
+        # Cumulative, so the last job's dump holds the whole worker
+        _worker_profiler.dump_stats(f"{path}.worker-{os.getpid()}")
+
+def add_instrument_arguments(parser):
+    """Add the --timings and --profile options to an argparse parser"""
+    parser.add_argument('--timings', metavar='PATH',
+                        help="log per-stage timings and process peak memory as JSON lines ('-' for stderr)")
+    parser.add_argument('--profile', metavar='PATH',
+                        help="write cProfile/pstats data for the run, worker processes included")
+
+# Worker processes started with spawn pick the setting up from the environment
+if os.environ.get(TIMINGS_ENV) and not _hooks:
+    log_to(os.environ[TIMINGS_ENV])
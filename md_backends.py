@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Interchangeable Markdown-to-HTML backends
+
+    python-markdown  the markdown package (default), converted per section (md_sections)
+    markdown-it      markdown-it-py, a faster CommonMark parser
+    mistune          mistune 3, the fastest of the three
+
+The fast backends are post-processed to produce the HTML our reports rely on
+from python-markdown: raw HTML blocks are passed through untouched (Markdown
+inside <div align="center"> stays literal), fenced code is highlighted with
+codehilite's own markup, table alignment uses the same style attributes, and
+headings get toc's ids with a [TOC] marker replaced by the table of contents.
+Other python-markdown extensions (footnotes, abbr, attr_list, def_list) are
+not emulated. md_conformance.py checks that all backends agree.
+
+The backend is chosen with the markdown_backend argument of the converters,
+their --markdown-backend option or $REPORT_MARKDOWN_BACKEND.
+"""
+import html
+import importlib.metadata
+import os
+import re
+
+from highlight_cache import HighlightCache, highlight_cache_extension
+
+# Worker processes pick the backend up from here too
+BACKEND_ENV = 'REPORT_MARKDOWN_BACKEND'
+DEFAULT_BACKEND = 'python-markdown'
+
+# Distributions each backend needs (the fast ones reuse python-markdown's toc and codehilite helpers)
+BACKEND_PACKAGES = {
+    'python-markdown': ['markdown'],
+    'markdown-it': ['markdown-it-py', 'markdown', 'pygments'],
+    'mistune': ['mistune', 'markdown', 'pygments'],
+}
+
+# Tags python-markdown treats as the start of a raw HTML block
+BLOCK_TAGS = ('address|article|aside|blockquote|center|details|dialog|div|dl|fieldset|figcaption|figure|'
+              'footer|form|h[1-6]|header|hr|main|nav|ol|p|pre|section|summary|table|ul')
+HTML_BLOCK_START = re.compile(rf'^<({BLOCK_TAGS})\b[^>]*>', re.I)
+FENCE = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+LIST_ITEM = re.compile(r'^( {0,3})([-*+]|\d+)([.]?[ \t])')
+ATX_HEADING = re.compile(r'^ {0,3}#{1,6}(?:[ \t]|$)')
+RAW_PLACEHOLDER = re.compile(r'<p>RAWHTMLBLOCKPLACEHOLDER(\d+)</p>')
+CODE_BLOCK = re.compile(r'<pre><code(?: class="language-([^"]+)")?>(.*?)</code></pre>', re.S)
+ALIGN_STYLE = re.compile(r'<(th|td)(?: align="(left|right|center)"| style="text-align:\s*(left|right|center);?")>')
+HEADING = re.compile(r'<h([1-6])>(.*?)</h\1>', re.S)
+TAG = re.compile(r'<[^>]*>')
+
+def backend_name(name=None):
+    """Resolve the backend: name, else $REPORT_MARKDOWN_BACKEND, else python-markdown"""
+    name = name or os.environ.get(BACKEND_ENV) or DEFAULT_BACKEND
+    if name not in BACKEND_PACKAGES:
+        raise ValueError(f"unknown Markdown backend {name!r} (choose from: {', '.join(BACKEND_PACKAGES)})")
+    return name
+
+def backend_label(name=None):
+    """'name-version' of the backend's parser, for cache keys"""
+    name = backend_name(name)
+    return f"{name}-{importlib.metadata.version(BACKEND_PACKAGES[name][0])}"
+
+def select_backend(name):
+    """Make name the default backend for this process and the worker processes it starts"""
+    os.environ[BACKEND_ENV] = backend_name(name)
+
+def add_backend_argument(parser):
+    """Add the --markdown-backend option to an argparse parser"""
+    parser.add_argument('--markdown-backend', choices=sorted(BACKEND_PACKAGES),
+                        help=f"Markdown parser (default: ${BACKEND_ENV} or {DEFAULT_BACKEND})")
+
+def create_backend(name=None, extensions=('extra', 'codehilite', 'toc'), cache=None):
+    """Return an object whose convert(text) turns Markdown into an HTML fragment
+
+    cache (a BuildCache, or None/False) keeps converted sections and highlighted code.
+    The object's highlights attribute is its HighlightCache (None without
+    codehilite); set highlights.cache to switch build caches.
+    """
+    name = backend_name(name)
+    extensions = list(extensions)
+    if name == 'python-markdown':
+        import markdown
+        from md_sections import SectionedMarkdown
+
+        key_parts = [list(extensions), backend_label(name)]
+        highlights = None
+        if 'codehilite' in extensions:
+            key_parts.append(f"pygments-{importlib.metadata.version('pygments')}")
+            # Highlighted blocks are cached in memory and in cache (see highlight_cache)
+            extension = highlight_cache_extension(cache)
+            extensions.append(extension)
+            highlights = extension.highlights
+        backend = SectionedMarkdown(markdown.Markdown(extensions=extensions), key_parts, cache)
+        backend.highlights = highlights
+        return backend
+    if name == 'markdown-it':
+        return MarkdownItBackend(extensions, cache)
+    return MistuneBackend(extensions, cache)
+
+def stash_html_blocks(text):
+    """Replace raw HTML blocks with placeholder paragraphs; return (text, [blocks])
+
+    Like python-markdown, a block starts with a block-level tag at the start of
+    a line after a blank line and runs to the line closing that tag, blank
+    lines and Markdown-looking lines included.
+    """
+    lines = text.split('\n')
+    out = []
+    blocks = []
+    fence = None
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if fence:
+            if line.strip().startswith(fence):
+                fence = None
+        elif FENCE.match(line):
+            fence = FENCE.match(line).group(1)
+        elif (not out or not out[-1].strip()) and HTML_BLOCK_START.match(line):
+            tag = HTML_BLOCK_START.match(line).group(1).lower()
+            opening = re.compile(rf'<{tag}\b[^>]*?(?<!/)>', re.I)
+            closing = re.compile(rf'</{tag}\s*>', re.I)
+            depth = 0
+            end = i
+            for end in range(i, len(lines)):
+                depth += len(opening.findall(lines[end])) - len(closing.findall(lines[end]))
+                if depth <= 0:
+                    break
+            out.append(f"RAWHTMLBLOCKPLACEHOLDER{len(blocks)}")
+            blocks.append('\n'.join(lines[i:end + 1]))
+            i = end + 1
+            # The block ends its paragraph
+            if i < len(lines) and lines[i].strip():
+                out.append('')
+            continue
+        out.append(line)
+        i += 1
+    return '\n'.join(out), blocks
+
+def escape_paragraph_lists(text):
+    """Escape list markers on lines continuing a paragraph
+
+    In python-markdown a list cannot interrupt a paragraph: "**Label**:" followed
+    directly by "- item" lines is one paragraph. CommonMark parsers would start
+    a list, so the markers are escaped to keep the text literal.
+    """
+    out = []
+    fence = None
+    state = None  # None (between blocks), 'paragraph' or 'list'
+    for line in text.split('\n'):
+        if fence:
+            if line.strip().startswith(fence):
+                fence = None
+        elif FENCE.match(line):
+            fence = FENCE.match(line).group(1)
+            state = None
+        elif not line.strip() or ATX_HEADING.match(line):
+            state = None
+        elif LIST_ITEM.match(line) and (LIST_ITEM.match(line).group(3) != ' ' or
+                                        LIST_ITEM.match(line).group(2) in '-*+'):
+            if state == 'paragraph':
+                line = LIST_ITEM.sub(r'\1\\\2\3', line, count=1)
+            else:
+                state = 'list'
+        elif state is None:
+            state = 'paragraph'
+        out.append(line)
+    return '\n'.join(out)
+
+class CompatBackend:
+    """Base for the fast backends: parse with _render(), then match python-markdown's HTML"""
+
+    def __init__(self, extensions, cache=None):
+        self.extensions = list(extensions)
+        self.highlight = 'codehilite' in self.extensions
+        self.toc = 'toc' in self.extensions
+        self.highlights = None
+        if self.highlight:
+            from markdown.extensions.codehilite import CodeHiliteExtension
+
+            self.codehilite_config = CodeHiliteExtension().getConfigs()
+            self.highlights = HighlightCache(cache)
+
+    def reset(self):
+        return self
+
+    def _render(self, text):
+        raise NotImplementedError
+
+    def convert(self, text):
+        # python-markdown's NormalizeWhitespace: blank lines inside code blocks lose their spaces
+        text = re.sub(r'(?<=\n) +\n', '\n', text.replace('\r\n', '\n').replace('\r', '\n').expandtabs(4))
+        text, blocks = stash_html_blocks(text)
+        result = self._render(escape_paragraph_lists(text)).strip('\n')
+        result = CODE_BLOCK.sub(self._code_block, result)
+        result = RAW_PLACEHOLDER.sub(lambda m: blocks[int(m.group(1))], result)
+        result = ALIGN_STYLE.sub(lambda m: f'<{m.group(1)} style="text-align: {m.group(2) or m.group(3)};">', result)
+        if self.toc:
+            result = self._headings(result)
+        return result
+
+    def _code_block(self, match):
+        language, code = match.group(1), html.unescape(match.group(2))
+        if not self.highlight:
+            return match.group(0)
+        # The options fenced_code passes when codehilite is enabled
+        config = dict(self.codehilite_config)
+        style = config.pop('pygments_style', 'default')
+        block = self.highlights.highlighter(code, lang=language, style=style, **config)
+        return block.hilite(shebang=False).strip('\n') + '\n'
+
+    def _headings(self, result):
+        """Give headings toc's ids and replace a [TOC] paragraph with the table of contents"""
+        from markdown.extensions.toc import nest_toc_tokens, slugify, unique
+
+        used_ids = set(re.findall(r'\bid="([^"]*)"', result))
+        tokens = []
+
+        def add_id(match):
+            level, inner = int(match.group(1)), match.group(2)
+            name = TAG.sub('', inner)
+            id = unique(slugify(html.unescape(name), '-'), used_ids)
+            tokens.append({'level': level, 'id': id, 'name': name, 'children': []})
+            return f'<h{level} id="{id}">{inner}</h{level}>'
+        result = HEADING.sub(add_id, result)
+        if '<p>[TOC]</p>' in result:
+            result = result.replace('<p>[TOC]</p>', self._toc_div(nest_toc_tokens(tokens)))
+        return result
+
+    def _toc_div(self, tokens):
+        def items(tokens):
+            lines = ['<ul>']
+            for token in tokens:
+                children = items(token['children']) + '\n' if token['children'] else ''
+                lines.append(f'<li><a href="#{token["id"]}">{token["name"]}</a>{children}</li>')
+            lines.append('</ul>')
+            return '\n'.join(lines)
+        return f'<div class="toc">\n{items(tokens)}\n</div>'
+
+class MarkdownItBackend(CompatBackend):
+    """markdown-it-py in CommonMark mode with tables and strikethrough"""
+
+    def __init__(self, extensions, cache=None):
+        from markdown_it import MarkdownIt
+
+        super().__init__(extensions, cache)
+        self.parser = MarkdownIt('commonmark', {'html': True}).enable(['table', 'strikethrough'])
+
+    def _render(self, text):
+        return self.parser.render(text)
+
+class MistuneBackend(CompatBackend):
+    """mistune 3 with tables and strikethrough; HTML is passed through unescaped"""
+
+    def __init__(self, extensions, cache=None):
+        import mistune
+
+        super().__init__(extensions, cache)
+        self.parser = mistune.create_markdown(escape=False, plugins=['table', 'strikethrough'])
+
+    def _render(self, text):
+        return self.parser(text)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Conformance check for the Markdown backends
+
+Converts a corpus of snippets with every installed backend (see md_backends)
+and compares the HTML against python-markdown, the reference. The snippets
+are the constructs AI-Developer-ROI-Report-2025.md relies on: tables with
+alignment and bold cells, fenced code with and without a language, [TOC] and
+heading anchors, <div align="center"> with Markdown inside, lists right after
+a bold label line, horizontal rules. Whole documents can be compared too.
+
+HTML is compared after normalising what does not change rendering: attribute
+order, character references, self-closing syntax and whitespace between tags
+(whitespace inside <pre> is compared exactly).
+
+    python md_conformance.py                        # corpus + the report
+    python md_conformance.py --backend mistune      # one backend only
+    python md_conformance.py --document other.md    # add documents to compare
+
+Exits with status 1 when any backend differs, printing the first difference.
+"""
+import argparse
+import difflib
+import os
+import sys
+from html.parser import HTMLParser
+
+from md_backends import BACKEND_PACKAGES, DEFAULT_BACKEND, create_backend
+from preflight import MissingDependencyError, check_requirements
+
+REPORT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'AI-Developer-ROI-Report-2025.md')
+
+# Extensions convert_to_pdf_weasyprint uses; the pdfkit converter's are a subset
+EXTENSIONS = ['extra', 'codehilite', 'tables', 'toc']
+
+CORPUS = {
+    'headings': """# The AI Developer Revolution: ROI Analysis & Cost Comparison Report 2025
+
+## 📊 Executive Summary
+
+### Key Findings at a Glance
+
+#### 1. **Cost Efficiency** (`$36,500`/year)
+""",
+    'toc anchors': """[TOC]
+
+## 🌍 Global Salary Overview (2025)
+
+### Average Annual Salaries by Region
+
+## Appendix
+
+### Average Annual Salaries by Region
+
+## Appendix
+""",
+    'center div': """# Title
+
+<div align="center">
+
+## 🚀 Transforming Software Development Economics
+
+*A comprehensive analysis of AI developer productivity*
+
+**June 2025**
+
+</div>
+
+---
+
+Text after the div.
+""",
+    'tables': """| Region | Average Salary (USD) | Range (USD) | Key Markets |
+|--------|---------------------|-------------|-------------|
+| **United States** | $125,000 | $88K - $235K | SF Bay Area, NYC, Seattle |
+| **AI Developer** | $36,500 | Fixed | Global (24/7) |
+
+| Metric | Human | AI |
+|:-------|------:|:--:|
+| Bugs per KLOC | 15-50 | *2-5* |
+| Test coverage | 60% | 95% & up |
+""",
+    'fenced code': """**AI Developer (Actual Code)**:
+```python
+# Comprehensive error handling with context
+class VoiceTranscriptionError(Exception):
+    def __init__(self, message: str, context: Optional[ErrorContext] = None):
+        super().__init__(message)
+        self.context = context or ErrorContext()
+```
+
+```
+plain <text> & "quotes"
+```
+
+```mermaid
+graph LR
+    A[Start] --> B{Decision}
+```
+""",
+    'lists': """**AI Developer Solution**:
+- **Cost**: $100/day (pay only for what you use)
+- **Speed**: 24/7 development = 3x faster time to market
+
+### For Startups
+1. **Start Small**: Use AI for MVP development
+2. **Scale Smart**: Add human developers for specialized needs
+
+Projected adoption:
+
+- **2025**: 15% of startups using AI developers
+- **2026**: 40% adoption in SMBs
+""",
+    'inline': """The emergence of AI developers delivers **8-23x better ROI** compared to *traditional*
+developers, see [the methodology](#methodology) and `convert_to_pdf.py` -- "quoted" & <b>raw</b>.
+
+---
+
+> **Note**: figures are in USD.
+""",
+}
+
+class _Normalizer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tokens = []
+        self.pre = 0
+
+    def handle_starttag(self, tag, attrs):
+        self.tokens.append(f"<{tag}{''.join(f' {k}={v!r}' for k, v in sorted(attrs))}>")
+        self.pre += tag == 'pre'
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        self.pre -= tag == 'pre'
+
+    def handle_endtag(self, tag):
+        self.tokens.append(f"</{tag}>")
+        self.pre -= tag == 'pre'
+
+    def handle_data(self, data):
+        text = data if self.pre else ' '.join(data.split())
+        if text:
+            self.tokens.append(text)
+
+def normalize_html(html):
+    """Return the HTML as a list of comparable tokens, one per tag or text run"""
+    parser = _Normalizer()
+    parser.feed(html)
+    parser.close()
+    return parser.tokens
+
+def compare(reference, candidate):
+    """Return a short unified diff of the normalised HTML, or '' when equivalent"""
+    expected, actual = normalize_html(reference), normalize_html(candidate)
+    if expected == actual:
+        return ''
+    diff = difflib.unified_diff(expected, actual, 'python-markdown', 'backend', n=2, lineterm='')
+    return '\n'.join(list(diff)[:40])
+
+def available_backends(names):
+    """Yield the backends in names whose packages are installed, warning about the rest"""
+    for name in names:
+        try:
+            check_requirements(BACKEND_PACKAGES[name])
+        except MissingDependencyError as e:
+            print(f"Warning: skipping {name}: {str(e).splitlines()[0]}")
+            continue
+        yield name
+
+def run(cases, backends):
+    """Compare every backend against python-markdown on cases ({name: markdown}); return failures"""
+    reference = create_backend(DEFAULT_BACKEND, EXTENSIONS, cache=False)
+    expected = {name: reference.convert(text) for name, text in cases.items()}
+    failures = 0
+    for backend in backends:
+        converter = create_backend(backend, EXTENSIONS)
+        for name, text in cases.items():
+            diff = compare(expected[name], converter.convert(text))
+            print(f"{'FAIL' if diff else 'ok  '} {backend}: {name}")
+            if diff:
+                failures += 1
+                print(diff)
+    return failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that every Markdown backend produces equivalent HTML")
+    parser.add_argument('--backend', action='append', choices=sorted(BACKEND_PACKAGES),
+                        help="backend to check (repeatable; default: all installed)")
+    parser.add_argument('--document', action='append', default=[], metavar='PATH',
+                        help="also compare this Markdown file (repeatable)")
+    parser.add_argument('--no-report', action='store_true', help="do not compare the bundled report")
+    args = parser.parse_args()
+
+    try:
+        check_requirements(BACKEND_PACKAGES[DEFAULT_BACKEND])
+    except MissingDependencyError as e:
+        print(e)
+        sys.exit(1)
+    cases = dict(CORPUS)
+    documents = args.document + ([] if args.no_report or not os.path.exists(REPORT) else [REPORT])
+    for path in documents:
+        with open(path, 'r', encoding='utf-8') as f:
+            cases[os.path.basename(path)] = f.read()
+    names = args.backend or [name for name in BACKEND_PACKAGES if name != DEFAULT_BACKEND]
+    failures = run(cases, list(available_backends(names)))
+    if failures:
+        print(f"{failures} case(s) differ from python-markdown")
+        sys.exit(1)
+    print("All backends produce equivalent HTML")
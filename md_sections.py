@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Section-level incremental Markdown conversion
+
+SectionedMarkdown splits a document before every top-level (# or ##)
+heading outside fenced code, converts each section on its own and caches the
+HTML fragment by content hash, so after an edit only the changed sections go
+through Markdown again. Document-wide state is kept correct:
+
+- reference links, abbreviations and footnote definitions are collected from
+  the whole document and appended to every section (their hash is part of
+  every section's key, so editing one re-converts everything)
+- heading ids are made unique across sections the way the toc extension does
+  it (overview, overview_1, ...) and a [TOC] marker gets the full table
+- footnote numbering follows definition order, repeated references get
+  fnref2:, fnref3: ids and the footnote list is built once at the end
+"""
+import json
+import re
+from collections import OrderedDict
+
+from build_cache import cache_key
+
+# Bump when the stitching below changes the HTML produced for a section
+SECTION_FORMAT_VERSION = "2"
+
+FENCE = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+SECTION_HEADING = re.compile(r'^#{1,2}(?:[ \t]|$)')
+REFERENCE_DEFINITION = re.compile(r'^ {0,3}(?:\[[^\]^][^\]]*\]|\*\[[^\]]+\]):')
+FOOTNOTE_DEFINITION = re.compile(r'^ {0,3}\[\^[^\]]+\]:')
+# Block-level tags whose raw HTML blocks a heading inside must not split
+HTML_BLOCK_TAG = re.compile(r'<(/?)(?:div|section|article|aside|details|table|blockquote|figure|center|'
+                            r'header|footer|nav|main|form)\b[^>]*?(/?)>', re.I)
+HEADING_ID = re.compile(r'(<h[1-6][^>]*\bid=")([^"]*)(")')
+FOOTNOTE_REF = re.compile(r'<sup id="fnref\d*:([^"]*)">')
+FOOTNOTE_DIV = re.compile(r'\n?<div class="footnote">.*\Z', re.S)
+ID_COUNT = re.compile(r'^(.*)_([0-9]+)$')
+
+TOC_PLACEHOLDER = "MDSECTIONSTOCPLACEHOLDER"
+# Heading converted after each section, standing in for the next section's:
+# the HTML before it ends the way the section does inside the whole document
+# (raw HTML and code blocks can leave a blank line)
+SECTION_END = "MDSECTIONSENDPLACEHOLDER"
+SECTION_END_HEADING = re.compile(rf'<h1[^>]*>{SECTION_END}</h1>')
+
+def _scan(text):
+    """Yield (line, kind) for every line; kind is 'definition', 'section' (starts a section) or None"""
+    fence = None
+    in_footnote = False
+    html_depth = 0
+    has_content = False
+    for line in text.split('\n'):
+        kind = None
+        if fence:
+            if line.strip().startswith(fence):
+                fence = None
+        elif in_footnote and (line.startswith(('    ', '\t')) or not line.strip()):
+            kind = 'definition'
+        else:
+            in_footnote = False
+            match = FENCE.match(line)
+            if match:
+                fence = match.group(1)[0] * len(match.group(1))
+            elif FOOTNOTE_DEFINITION.match(line):
+                in_footnote = True
+                kind = 'definition'
+            elif REFERENCE_DEFINITION.match(line):
+                kind = 'definition'
+            elif line.lstrip().startswith('<'):
+                for closing, self_closing in HTML_BLOCK_TAG.findall(line):
+                    if not self_closing:
+                        html_depth = max(html_depth + (-1 if closing else 1), 0)
+            elif SECTION_HEADING.match(line) and not html_depth and has_content:
+                kind = 'section'
+                has_content = False
+        if kind != 'definition' and line.strip():
+            has_content = True
+        yield line, kind
+
+def split_document(text):
+    """Return (sections, definitions): section sources and the document-wide definitions.
+
+    Definition lines are blanked out of the sections (a blank line ends the
+    surrounding paragraph, just as the definition did).
+    """
+    sections = [[]]
+    definitions = []
+    for line, kind in _scan(text):
+        if kind == 'definition':
+            definitions.append(line)
+            line = ''
+        elif kind == 'section':
+            sections.append([])
+        sections[-1].append(line)
+    return ['\n'.join(section) for section in sections], '\n'.join(definitions)
+
+def mark_sections(text, marker):
+    """Put marker, a raw HTML line such as a comment, before every section split_document starts"""
+    lines = []
+    for line, kind in _scan(text):
+        if kind == 'section':
+            lines.extend(['', marker, ''])
+        lines.append(line)
+    return '\n'.join(lines)
+
+def _unique(id, used):
+    """markdown.extensions.toc.unique: overview, overview_1, overview_2, ..."""
+    while id in used or not id:
+        match = ID_COUNT.match(id)
+        id = f"{match.group(1)}_{int(match.group(2)) + 1}" if match else f"{id}_1"
+    used.add(id)
+    return id
+
+def _flatten(tokens):
+    for token in tokens:
+        yield {key: value for key, value in token.items() if key != 'children'}
+        yield from _flatten(token['children'])
+
+class SectionedMarkdown:
+    """Wraps a markdown.Markdown instance; convert() re-uses unchanged sections.
+
+    Fragments are kept in memory (max_entries, least recently used dropped
+    first) and, when cache is a BuildCache, on disk so new processes start warm.
+    key_parts identify the Markdown configuration (extensions, versions).
+    """
+
+    def __init__(self, md, key_parts=(), cache=None, max_entries=4096):
+        self.md = md
+        self.key_parts = [str(part) for part in key_parts]
+        self.cache = cache
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.converted = self.reused = 0
+        toc = md.treeprocessors['toc'] if 'toc' in md.treeprocessors else None
+        self.toc_marker = toc.marker if toc else None
+
+    def reset(self):
+        return self
+
+    def _convert_section(self, source, definitions):
+        """Return (html, flat toc tokens) for one section, from cache when possible"""
+        key = cache_key(source, definitions, self.key_parts, f"md-section-{SECTION_FORMAT_VERSION}")
+        entry = self.memory.pop(key, None)
+        if entry is None and self.cache:
+            path = self.cache.get(key, '.section.json')
+            if path:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+        if entry is None:
+            self.md.reset()
+            html = self.md.convert(f"{source}\n# {SECTION_END}\n\n{definitions}")
+            end = SECTION_END_HEADING.search(html)
+            if end:
+                html = html[:end.start()]
+            else:
+                # Swallowed, e.g. by an unclosed HTML block: assume the usual single newline
+                self.md.reset()
+                html = FOOTNOTE_DIV.sub('', self.md.convert(f"{source}\n\n{definitions}")) + '\n'
+            entry = {'html': html,
+                     'toc': [token for token in _flatten(getattr(self.md, 'toc_tokens', []))
+                             if token['name'] != SECTION_END]}
+            self.converted += 1
+            if self.cache:
+                self.cache.put(key, '.section.json', data=json.dumps(entry).encode('utf-8'))
+        else:
+            self.reused += 1
+        self.memory[key] = entry
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+        return entry['html'], entry['toc']
+
+    def convert(self, text):
+        """Convert a whole document, re-converting only sections not seen before"""
+        sections, definitions = split_document(text)
+        toc_marker = self.toc_marker
+        parts = []
+        toc_tokens = []
+        used_ids = set()
+        has_toc = False
+        for source in sections:
+            if toc_marker and toc_marker in source:
+                # The marker needs every heading; it is filled in after all sections
+                source = re.sub(rf'(?m)^[ \t]*{re.escape(toc_marker)}[ \t]*$', TOC_PLACEHOLDER, source)
+                has_toc = TOC_PLACEHOLDER in source or has_toc
+            html, tokens = self._convert_section(source, definitions)
+            # Heading ids only had to be unique within their section
+            renamed = [(token['id'], _unique(token['id'], used_ids)) for token in tokens]
+            toc_tokens.extend({**token, 'id': new} for token, (_, new) in zip(tokens, renamed))
+            if any(old != new for old, new in renamed):
+                html = self._rename_headings(html, renamed)
+            parts.append(html)
+        # Every part ends with the newline(s) that separate it from the next block
+        html = ''.join(parts)
+
+        if has_toc:
+            html = html.replace(f"<p>{TOC_PLACEHOLDER}</p>", self._toc_html(toc_tokens))
+        if definitions and '[^' in definitions:
+            html = self._number_footnote_refs(html) + self._footnotes_html(html, definitions)
+        return html.strip()
+
+    def _rename_headings(self, html, renamed):
+        """Apply [(old id, new id)] to the section's headings, which are in toc token order"""
+        pending = iter(renamed)
+        expected = next(pending, None)
+
+        def rename(match):
+            nonlocal expected
+            if expected is None or match.group(2) != expected[0]:
+                return match.group(0)
+            new = expected[1]
+            expected = next(pending, None)
+            return match.group(1) + new + match.group(3)
+        return HEADING_ID.sub(rename, html)
+
+    def _toc_html(self, tokens):
+        """Build the [TOC] div from every section's headings with the toc extension itself"""
+        from markdown.extensions.toc import nest_toc_tokens
+
+        toc = self.md.treeprocessors['toc']
+        div = toc.build_toc_div(nest_toc_tokens([dict(token) for token in tokens]))
+        html = self.md.serializer(div)
+        for postprocessor in self.md.postprocessors:
+            html = postprocessor.run(html)
+        return html.strip('\n')
+
+    def _number_footnote_refs(self, html):
+        """Give repeated references to one footnote fnref:, fnref2:, fnref3: ids in document order"""
+        counts = {}
+
+        def renumber(match):
+            id = match.group(1)
+            counts[id] = counts.get(id, 0) + 1
+            prefix = 'fnref' if counts[id] == 1 else f"fnref{counts[id]}"
+            return f'<sup id="{prefix}:{id}">'
+        return FOOTNOTE_REF.sub(renumber, html)
+
+    def _footnotes_html(self, html, definitions):
+        """Render the footnote list once, with a back-link for every reference"""
+        counts = {}
+        for id in FOOTNOTE_REF.findall(html):
+            counts[id] = counts.get(id, 0) + 1
+        if not counts:
+            return ''
+        # A throwaway paragraph referencing each footnote as often as the document does
+        references = ''.join(f"[^{id}]" * count for id, count in counts.items())
+        key = cache_key(references, definitions, self.key_parts, f"md-footnotes-{SECTION_FORMAT_VERSION}")
+        if key not in self.memory:
+            self.md.reset()
+            rendered = self.md.convert(f"{references}\n\n{definitions}")
+            match = FOOTNOTE_DIV.search(rendered)
+            self.memory[key] = {'html': match.group(0).lstrip('\n') if match else '', 'toc': []}
+        return self.memory[key]['html']
@@ -0,0 +1,667 @@
+#!/usr/bin/env python3
+"""
+Render the Mermaid subset used by the reports straight to SVG
+
+Supports graph/flowchart (LR, RL, TD, TB, BT) with subgraphs and style lines,
+pie charts and gantt charts, plus %%{init}%% theme and themeVariables.
+Pure Python, no browser or node process.
+"""
+import ast
+import math
+import re
+import sys
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape
+
+# Bump whenever rendering output changes so cached diagrams are invalidated
+RENDERER_VERSION = "1"
+
+class MermaidError(ValueError):
+    """Raised for Mermaid source outside the supported subset"""
+
+THEMES = {
+    'default': {
+        'background': '#ffffff',
+        'primaryColor': '#ECECFF',
+        'primaryBorderColor': '#9370DB',
+        'primaryTextColor': '#333333',
+        'lineColor': '#333333',
+        'textColor': '#333333',
+        'clusterBkg': '#ffffde',
+        'clusterBorder': '#aaaa33',
+        'edgeLabelBackground': '#e8e8e8',
+        'taskBkgColor': '#8a90dd',
+        'taskBorderColor': '#534fbc',
+        'doneTaskBkgColor': '#d3d3d3',
+        'doneTaskBorderColor': '#808080',
+        'activeTaskBkgColor': '#bfc7ff',
+        'critBkgColor': '#ff8888',
+        'critBorderColor': '#ff0000',
+        'sectionBkgColor': '#f4f4f9',
+        'gridColor': '#d3d3d3',
+        'fontFamily': 'Arial',
+        'fontSize': 14,
+    },
+    'base': {
+        'primaryColor': '#fff4dd',
+        'primaryBorderColor': '#b3a07a',
+        'clusterBkg': '#fffaf0',
+        'clusterBorder': '#b3a07a',
+        'taskBkgColor': '#fff4dd',
+        'taskBorderColor': '#b3a07a',
+    },
+    'neutral': {
+        'primaryColor': '#eeeeee',
+        'primaryBorderColor': '#999999',
+        'clusterBkg': '#f7f7f7',
+        'clusterBorder': '#bbbbbb',
+        'taskBkgColor': '#bbbbbb',
+        'taskBorderColor': '#888888',
+    },
+    'forest': {
+        'primaryColor': '#cde498',
+        'primaryBorderColor': '#13540c',
+        'lineColor': '#008000',
+        'clusterBkg': '#cdffb2',
+        'clusterBorder': '#6eaa49',
+        'taskBkgColor': '#487e3a',
+        'taskBorderColor': '#13540c',
+    },
+}
+
+PIE_COLORS = ['#3b82f6', '#ef4444', '#f59e0b', '#10b981', '#8b5cf6', '#ec4899',
+              '#14b8a6', '#f97316', '#6366f1', '#84cc16', '#06b6d4', '#a855f7']
+
+INIT_DIRECTIVE = re.compile(r'%%\{\s*init\s*:\s*(.*?)\}%%', re.DOTALL)
+# One alternative per shape so a ")" inside a [...] label does not end it early
+# Ids may contain single hyphens, but "A-->B" is A, an edge and B
+NODE_REF = re.compile(r'\s*(\w+(?:-(?![-.>])\w+)*)\s*(?:\(\((?P<circle>"[^"]*"|.*?)\)\)|\[(?P<rect>"[^"]*"|[^\]]*)\]'
+                      r'|\((?P<round>"[^"]*"|[^)]*)\)|\{(?P<diamond>"[^"]*"|[^}]*)\})?')
+EDGE = re.compile(r'\s*(-\.->|-\.-|-->|---|==>|===)\s*(?:\|(.*?)\|)?')
+LINE_BREAK = re.compile(r'<br\s*/?>', re.IGNORECASE)
+
+# Approximate glyph metrics, good enough for box sizing without a font engine
+CHAR_WIDTH = 0.6
+LINE_HEIGHT = 1.3
+
+def fmt(value):
+    """Format a coordinate compactly"""
+    return f"{value:.1f}".rstrip('0').rstrip('.')
+
+def text_width(text, font_size):
+    """Estimated width of a line of text"""
+    return len(text) * font_size * CHAR_WIDTH
+
+def _label_lines(label):
+    return [line.strip() for line in LINE_BREAK.split(label)]
+
+def _unquote(text):
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] == '"':
+        return text[1:-1]
+    return text
+
+def parse_init(source):
+    """Return (source without init directives, theme dict) for a Mermaid block"""
+    config = {}
+    for match in INIT_DIRECTIVE.finditer(source):
+        raw = match.group(1)
+        try:
+            parsed = ast.literal_eval(raw)
+        except (ValueError, SyntaxError):
+            # Mermaid also accepts bare keys: {theme: 'base'}
+            try:
+                parsed = ast.literal_eval(re.sub(r'([{,]\s*)(\w+)\s*:', r"\1'\2':", raw))
+            except (ValueError, SyntaxError):
+                raise MermaidError(f"Unreadable init directive: {match.group(0)}")
+        if isinstance(parsed, dict):
+            config.update(parsed)
+    theme = dict(THEMES['default'])
+    theme.update(THEMES.get(config.get('theme', 'default'), {}))
+    variables = config.get('themeVariables', {})
+    if not isinstance(variables, dict):
+        raise MermaidError(f"themeVariables must be a mapping, not {variables!r}")
+    theme.update(variables)
+    try:
+        theme['fontSize'] = float(str(theme['fontSize']).strip().rstrip('px'))
+    except ValueError:
+        raise MermaidError(f"fontSize must be a number of pixels, not {theme['fontSize']!r}")
+    return INIT_DIRECTIVE.sub('', source), theme
+
+def _statements(source):
+    """Yield (line number, statement) pairs, skipping blanks and comments"""
+    for number, raw in enumerate(source.splitlines(), 1):
+        stripped = raw.strip().rstrip(';')
+        if stripped and not stripped.startswith('%%'):
+            yield number, stripped
+
+def svg_open(width, height, theme):
+    """Open an SVG document of the given size with the theme's font and background"""
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{fmt(width)}" height="{fmt(height)}" '
+            f'viewBox="0 0 {fmt(width)} {fmt(height)}" font-family="{escape(str(theme["fontFamily"]))}" '
+            f'font-size="{fmt(theme["fontSize"])}">\n'
+            f'<rect width="{fmt(width)}" height="{fmt(height)}" fill="{theme["background"]}"/>')
+
+def svg_text(x, y, lines, fill, font_size, anchor='middle', weight=None, sized=False):
+    """Emit a (possibly multi-line) text element vertically centred on y.
+
+    sized writes font_size on the element; otherwise it inherits the SVG default.
+    """
+    step = font_size * LINE_HEIGHT
+    top = y - step * (len(lines) - 1) / 2
+    attrs = f' font-size="{fmt(font_size)}"' if sized else ''
+    if weight:
+        attrs += f' font-weight="{weight}"'
+    spans = ''.join(f'<tspan x="{fmt(x)}" y="{fmt(top + i * step)}">{escape(line)}</tspan>'
+                    for i, line in enumerate(lines))
+    return (f'<text text-anchor="{anchor}" dominant-baseline="central" fill="{fill}"'
+            f'{attrs}>{spans}</text>')
+
+# Flowcharts
+
+def parse_graph(source):
+    """Parse a graph/flowchart block into a dict of direction, nodes, edges, subgraphs, styles"""
+    graph = {'direction': 'TB', 'nodes': {}, 'edges': [], 'subgraphs': [], 'styles': {}}
+    stack = []
+    header_seen = False
+
+    def add_node(match):
+        node_id = match.group(1)
+        nodes = graph['nodes']
+        if node_id not in nodes:
+            nodes[node_id] = {'label': node_id, 'shape': 'rect', 'subgraph': stack[-1] if stack else None}
+            if stack:
+                graph['subgraphs'][stack[-1]]['nodes'].append(node_id)
+        for shape in ('circle', 'rect', 'round', 'diamond'):
+            if match.group(shape) is not None:
+                nodes[node_id]['label'] = _unquote(match.group(shape))
+                nodes[node_id]['shape'] = shape
+
+    for number, line in _statements(source):
+        if not header_seen:
+            parts = line.split()
+            if parts[0] not in ('graph', 'flowchart'):
+                raise MermaidError(f"line {number}: expected graph header, got {line!r}")
+            graph['direction'] = parts[1].upper() if len(parts) > 1 else 'TB'
+            if graph['direction'] == 'TD':
+                graph['direction'] = 'TB'
+            header_seen = True
+            continue
+        if line.startswith('subgraph'):
+            title = line[len('subgraph'):].strip()
+            bracketed = re.match(r'[\w-]+\s*\[(.*)\]$', title)
+            if bracketed:
+                title = bracketed.group(1)
+            graph['subgraphs'].append({'title': _unquote(title), 'nodes': []})
+            stack.append(len(graph['subgraphs']) - 1)
+            continue
+        if line == 'end':
+            if not stack:
+                raise MermaidError(f"line {number}: 'end' without subgraph")
+            stack.pop()
+            continue
+        if line.startswith('style '):
+            parts = line.split(None, 2)
+            if len(parts) < 3:
+                raise MermaidError(f"line {number}: style needs a node id and properties: {line!r}")
+            _, node_id, props = parts
+            style = graph['styles'].setdefault(node_id, {})
+            for prop in props.split(','):
+                if ':' in prop:
+                    key, value = prop.split(':', 1)
+                    style[key.strip()] = value.strip()
+            continue
+        if line.split()[0] in ('classDef', 'class', 'linkStyle', 'click', 'direction'):
+            continue
+
+        match = NODE_REF.match(line)
+        if not match:
+            raise MermaidError(f"line {number}: cannot parse {line!r}")
+        add_node(match)
+        previous, pos = match.group(1), match.end()
+        while pos < len(line):
+            edge = EDGE.match(line, pos)
+            if not edge:
+                raise MermaidError(f"line {number}: cannot parse {line[pos:]!r}")
+            target = NODE_REF.match(line, edge.end())
+            if not target or not target.group(1):
+                raise MermaidError(f"line {number}: edge without target in {line!r}")
+            add_node(target)
+            graph['edges'].append({
+                'source': previous,
+                'target': target.group(1),
+                'label': _unquote(edge.group(2) or ''),
+                'dashed': '.' in edge.group(1),
+                'thick': '=' in edge.group(1),
+                'arrow': edge.group(1).endswith('>'),
+            })
+            previous, pos = target.group(1), target.end()
+    if not header_seen:
+        raise MermaidError("empty graph")
+    if not graph['nodes']:
+        raise MermaidError("graph without nodes")
+    return graph
+
+def _rank_nodes(graph):
+    """Longest-path layering; cycles are cut after len(nodes) relaxation rounds"""
+    ranks = dict.fromkeys(graph['nodes'], 0)
+    for _ in range(len(ranks)):
+        changed = False
+        for edge in graph['edges']:
+            wanted = ranks[edge['source']] + 1
+            if edge['source'] != edge['target'] and ranks[edge['target']] < wanted:
+                ranks[edge['target']] = wanted
+                changed = True
+        if not changed:
+            break
+    layers = {}
+    for node_id in graph['nodes']:
+        layers.setdefault(ranks[node_id], []).append(node_id)
+    return [layers[rank] for rank in sorted(layers)]
+
+def _clip(cx, cy, half_w, half_h, dx, dy):
+    """Point where the ray from a box centre along (dx, dy) leaves the box"""
+    if dx == 0 and dy == 0:
+        return cx, cy
+    t = min(half_w / abs(dx) if dx else math.inf, half_h / abs(dy) if dy else math.inf)
+    return cx + dx * t, cy + dy * t
+
+def render_graph(source, theme, diagram_id='mermaid'):
+    """Lay out and render a parsed flowchart"""
+    graph = parse_graph(source)
+    font_size = theme['fontSize']
+    nodes = graph['nodes']
+    horizontal = graph['direction'] in ('LR', 'RL')
+
+    for node in nodes.values():
+        lines = _label_lines(node['label'])
+        node['lines'] = lines
+        node['w'] = max(60, max(text_width(line, font_size) for line in lines) + 30)
+        node['h'] = len(lines) * font_size * LINE_HEIGHT + 20
+        if node['shape'] == 'diamond':
+            node['w'] *= 1.4
+            node['h'] *= 1.4
+        elif node['shape'] == 'circle':
+            node['w'] = node['h'] = max(node['w'], node['h'])
+
+    label_room = max([text_width(e['label'], font_size * 0.85) for e in graph['edges'] if e['label']] or [0])
+    rank_gap = 60 + (label_room if horizontal else (font_size * 1.5 if label_room else 0))
+    node_gap = 30
+    margin = 20
+    # Subgraph titles need room above the nodes
+    title_room = font_size * LINE_HEIGHT + 10 if graph['subgraphs'] else 0
+    cluster_pad = 15 if graph['subgraphs'] else 0
+
+    layers = _rank_nodes(graph)
+    # Size of each layer along the rank axis and across it
+    depth = [max(nodes[n]['w'] if horizontal else nodes[n]['h'] for n in layer) for layer in layers]
+    breadth = [sum(nodes[n]['h'] if horizontal else nodes[n]['w'] for n in layer) + node_gap * (len(layer) - 1)
+               for layer in layers]
+    total_breadth = max(breadth)
+    offset = margin + cluster_pad
+    along = offset
+    for layer, layer_depth, layer_breadth in zip(layers, depth, breadth):
+        across = offset + (total_breadth - layer_breadth) / 2
+        for node_id in layer:
+            node = nodes[node_id]
+            size = node['h'] if horizontal else node['w']
+            centre_along = along + layer_depth / 2
+            centre_across = across + size / 2
+            if horizontal:
+                node['x'], node['y'] = centre_along, centre_across
+            else:
+                node['x'], node['y'] = centre_across, centre_along
+            across += size + node_gap
+        along += layer_depth + rank_gap
+    span_along = along - rank_gap + offset
+    span_across = total_breadth + 2 * offset
+    width, height = (span_along, span_across) if horizontal else (span_across, span_along)
+
+    for node in nodes.values():
+        if graph['direction'] == 'RL':
+            node['x'] = width - node['x']
+        elif graph['direction'] == 'BT':
+            node['y'] = height - node['y']
+        node['y'] += title_room
+    height += title_room
+
+    clusters = []
+    for subgraph in graph['subgraphs']:
+        members = [nodes[n] for n in subgraph['nodes']]
+        if not members:
+            continue
+        left = min(n['x'] - n['w'] / 2 for n in members) - cluster_pad
+        right = max(n['x'] + n['w'] / 2 for n in members) + cluster_pad
+        top = min(n['y'] - n['h'] / 2 for n in members) - cluster_pad - title_room
+        bottom = max(n['y'] + n['h'] / 2 for n in members) + cluster_pad
+        clusters.append((subgraph['title'], left, top, right, bottom))
+        width = max(width, right + margin)
+        height = max(height, bottom + margin)
+
+    arrow_id = f"{diagram_id}-arrow"
+    line_color = theme['lineColor']
+    out = [svg_open(width, height, theme),
+           f'<defs><marker id="{arrow_id}" markerWidth="10" markerHeight="7" refX="9" refY="3.5" '
+           f'orient="auto"><polygon points="0 0, 10 3.5, 0 7" fill="{line_color}"/></marker></defs>']
+
+    for title, left, top, right, bottom in clusters:
+        out.append(f'<rect x="{fmt(left)}" y="{fmt(top)}" width="{fmt(right - left)}" '
+                   f'height="{fmt(bottom - top)}" rx="5" fill="{theme["clusterBkg"]}" '
+                   f'stroke="{theme["clusterBorder"]}"/>')
+        out.append(svg_text((left + right) / 2, top + title_room / 2 + 2, [title],
+                            theme['textColor'], font_size, weight='bold'))
+
+    labels = []
+    for edge in graph['edges']:
+        src, dst = nodes[edge['source']], nodes[edge['target']]
+        dx, dy = dst['x'] - src['x'], dst['y'] - src['y']
+        x1, y1 = _clip(src['x'], src['y'], src['w'] / 2, src['h'] / 2, dx, dy)
+        x2, y2 = _clip(dst['x'], dst['y'], dst['w'] / 2, dst['h'] / 2, -dx, -dy)
+        attrs = f' stroke-width="{3 if edge["thick"] else 2}"'
+        if edge['dashed']:
+            attrs += ' stroke-dasharray="5,5"'
+        if edge['arrow']:
+            attrs += f' marker-end="url(#{arrow_id})"'
+        out.append(f'<path d="M {fmt(x1)} {fmt(y1)} L {fmt(x2)} {fmt(y2)}" stroke="{line_color}" '
+                   f'fill="none"{attrs}/>')
+        if edge['label']:
+            labels.append(((x1 + x2) / 2, (y1 + y2) / 2, edge['label']))
+
+    for node_id, node in nodes.items():
+        style = graph['styles'].get(node_id, {})
+        fill = style.get('fill', theme['primaryColor'])
+        stroke = style.get('stroke', theme['primaryBorderColor'])
+        stroke_width = style.get('stroke-width', '1px').rstrip('px')
+        paint = f'fill="{fill}" stroke="{stroke}" stroke-width="{stroke_width}"'
+        x, y, w, h = node['x'], node['y'], node['w'], node['h']
+        if node['shape'] == 'diamond':
+            out.append(f'<polygon points="{fmt(x)},{fmt(y - h / 2)} {fmt(x + w / 2)},{fmt(y)} '
+                       f'{fmt(x)},{fmt(y + h / 2)} {fmt(x - w / 2)},{fmt(y)}" {paint}/>')
+        elif node['shape'] == 'circle':
+            out.append(f'<circle cx="{fmt(x)}" cy="{fmt(y)}" r="{fmt(w / 2)}" {paint}/>')
+        else:
+            radius = h / 2 if node['shape'] == 'round' else 5
+            out.append(f'<rect x="{fmt(x - w / 2)}" y="{fmt(y - h / 2)}" width="{fmt(w)}" '
+                       f'height="{fmt(h)}" rx="{fmt(radius)}" {paint}/>')
+        out.append(svg_text(x, y, node['lines'], style.get('color', theme['primaryTextColor']), font_size))
+
+    label_size = font_size * 0.85
+    for x, y, label in labels:
+        lines = _label_lines(label)
+        w = max(text_width(line, label_size) for line in lines) + 8
+        h = len(lines) * label_size * LINE_HEIGHT + 4
+        out.append(f'<rect x="{fmt(x - w / 2)}" y="{fmt(y - h / 2)}" width="{fmt(w)}" '
+                   f'height="{fmt(h)}" fill="{theme["edgeLabelBackground"]}"/>')
+        out.append(svg_text(x, y, lines, theme['textColor'], label_size, sized=True))
+
+    out.append('</svg>')
+    return '\n'.join(out)
+
+# Pie charts
+
+def parse_pie(source):
+    """Parse a pie block into (title, [(label, value), ...])"""
+    title = ''
+    slices = []
+    for number, line in _statements(source):
+        if line.startswith('pie'):
+            rest = line[3:].strip()
+            if rest.startswith('showData'):
+                rest = rest[len('showData'):].strip()
+            if rest.startswith('title'):
+                title = _unquote(rest[5:])
+            continue
+        if line.startswith('title'):
+            title = _unquote(line[5:])
+            continue
+        match = re.match(r'"(.*)"\s*:\s*([\d.]+)$', line)
+        if not match:
+            raise MermaidError(f"line {number}: cannot parse pie slice {line!r}")
+        slices.append((match.group(1), float(match.group(2))))
+    if not slices or sum(value for _, value in slices) <= 0:
+        raise MermaidError("pie chart without positive values")
+    return title, slices
+
+def render_pie(source, theme, diagram_id='mermaid'):
+    """Render a pie chart with a legend"""
+    title, slices = parse_pie(source)
+    font_size = theme['fontSize']
+    radius = 120
+    margin = 20
+    title_room = font_size * 1.6 + 20 if title else 0
+    cx = margin + radius
+    cy = margin + title_room + radius
+    total = sum(value for _, value in slices)
+    legend_x = cx + radius + 40
+    legend_w = max(text_width(f"{label} ({value / total:.0%})", font_size) for label, value in slices) + 24
+    width = max(legend_x + legend_w + margin, text_width(title, font_size * 1.3) + 2 * margin)
+    height = max(cy + radius + margin, title_room + margin + len(slices) * 24 + margin)
+
+    colors = [theme.get(f'pie{i + 1}', PIE_COLORS[i % len(PIE_COLORS)]) for i in range(len(slices))]
+    out = [svg_open(width, height, theme)]
+    if title:
+        out.append(svg_text(width / 2, margin + font_size, [title], theme['textColor'], font_size * 1.3,
+                            weight='bold', sized=True))
+
+    angle = -math.pi / 2
+    for (label, value), color in zip(slices, colors):
+        sweep = 2 * math.pi * value / total
+        if sweep >= 2 * math.pi - 1e-9:
+            out.append(f'<circle cx="{fmt(cx)}" cy="{fmt(cy)}" r="{radius}" fill="{color}" '
+                       f'stroke="#ffffff" stroke-width="2"/>')
+        else:
+            x1, y1 = cx + radius * math.cos(angle), cy + radius * math.sin(angle)
+            x2, y2 = cx + radius * math.cos(angle + sweep), cy + radius * math.sin(angle + sweep)
+            large = 1 if sweep > math.pi else 0
+            out.append(f'<path d="M {fmt(cx)} {fmt(cy)} L {fmt(x1)} {fmt(y1)} '
+                       f'A {radius} {radius} 0 {large} 1 {fmt(x2)} {fmt(y2)} Z" fill="{color}" '
+                       f'stroke="#ffffff" stroke-width="2"/>')
+        if value / total >= 0.05:
+            mid = angle + sweep / 2
+            out.append(svg_text(cx + radius * 0.6 * math.cos(mid), cy + radius * 0.6 * math.sin(mid),
+                                [f"{value / total:.0%}"], '#ffffff', font_size, weight='bold'))
+        angle += sweep
+
+    legend_y = cy - len(slices) * 24 / 2
+    for i, ((label, value), color) in enumerate(zip(slices, colors)):
+        y = legend_y + i * 24
+        out.append(f'<rect x="{fmt(legend_x)}" y="{fmt(y)}" width="16" height="16" fill="{color}"/>')
+        out.append(svg_text(legend_x + 24, y + 8, [f"{label} ({value / total:.0%})"],
+                            theme['textColor'], font_size, anchor='start'))
+    out.append('</svg>')
+    return '\n'.join(out)
+
+# Gantt charts
+
+MOMENT_TOKENS = [('YYYY', '%Y'), ('YY', '%y'), ('MM', '%m'), ('DD', '%d'),
+                 ('HH', '%H'), ('mm', '%M'), ('ss', '%S')]
+DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h|d|w)')
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+TICK_STEPS = [60, 300, 900, 1800, 3600, 7200, 10800, 21600, 43200, 86400, 172800, 604800,
+              1209600, 2592000, 7776000, 31536000]
+
+def _strptime_format(date_format):
+    for token, directive in MOMENT_TOKENS:
+        date_format = date_format.replace(token, directive)
+    return date_format
+
+def _parse_duration(text):
+    text = text.strip()
+    parts = DURATION_PART.findall(text)
+    if not parts or ''.join(n + u for n, u in parts) != text:
+        return None
+    return timedelta(seconds=sum(float(n) * DURATION_UNITS[u] for n, u in parts))
+
+def parse_gantt(source):
+    """Parse a gantt block into (title, axis format, [task dict, ...])"""
+    title = ''
+    date_format = '%Y-%m-%d'
+    axis_format = None
+    section = ''
+    tasks = []
+    by_id = {}
+    for number, line in _statements(source):
+        keyword = line.split()[0]
+        if keyword == 'gantt':
+            continue
+        if keyword == 'title':
+            title = line[5:].strip()
+        elif keyword == 'dateFormat':
+            date_format = _strptime_format(line.split(None, 1)[1])
+        elif keyword == 'axisFormat':
+            axis_format = line.split(None, 1)[1]
+        elif keyword in ('excludes', 'todayMarker', 'tickInterval', 'weekday', 'includes'):
+            continue
+        elif keyword == 'section':
+            section = line[7:].strip()
+        elif ':' in line:
+            name, meta = line.split(':', 1)
+            fields = [field.strip() for field in meta.split(',')]
+            tags = set()
+            while fields and fields[0] in ('done', 'active', 'crit', 'milestone'):
+                tags.add(fields.pop(0))
+            task_id = fields.pop(0) if len(fields) == 3 else None
+            start_text = fields[0] if len(fields) == 2 else None
+            end_text = fields[-1] if fields else ''
+            if start_text is None:
+                start = tasks[-1]['end'] if tasks else None
+            elif start_text.startswith('after '):
+                refs = start_text.split()[1:]
+                missing = [ref for ref in refs if ref not in by_id]
+                if missing:
+                    raise MermaidError(f"line {number}: unknown task {missing[0]!r}")
+                start = max(by_id[ref]['end'] for ref in refs)
+            else:
+                try:
+                    start = datetime.strptime(start_text, date_format)
+                except ValueError:
+                    raise MermaidError(f"line {number}: bad start {start_text!r} for {date_format!r}")
+            if start is None:
+                raise MermaidError(f"line {number}: first task needs a start")
+            duration = _parse_duration(end_text)
+            if duration is not None:
+                end = start + duration
+            else:
+                try:
+                    end = datetime.strptime(end_text, date_format)
+                except ValueError:
+                    raise MermaidError(f"line {number}: bad duration or end {end_text!r}")
+            task = {'name': name.strip(), 'section': section, 'tags': tags, 'start': start, 'end': end}
+            tasks.append(task)
+            if task_id:
+                by_id[task_id] = task
+        else:
+            raise MermaidError(f"line {number}: cannot parse {line!r}")
+    if not tasks:
+        raise MermaidError("gantt chart without tasks")
+    if axis_format is None:
+        axis_format = '%H:%M' if '%H' in date_format and '%d' not in date_format else '%Y-%m-%d'
+    return title, axis_format, tasks
+
+def render_gantt(source, theme, diagram_id='mermaid'):
+    """Render a gantt chart with task labels on the left and a time axis below"""
+    title, axis_format, tasks = parse_gantt(source)
+    font_size = theme['fontSize']
+    margin = 20
+    bar_h = 22
+    row_h = bar_h + 8
+    chart_w = 600
+    label_w = max(text_width(t['name'], font_size) for t in tasks) + 20
+    title_room = font_size * 1.6 + 20 if title else 0
+    origin_x = margin + label_w
+    origin_y = margin + title_room
+    start = min(t['start'] for t in tasks)
+    end = max(t['end'] for t in tasks)
+    span = max((end - start).total_seconds(), 1)
+    scale = chart_w / span
+    width = origin_x + chart_w + margin
+    height = origin_y + len(tasks) * row_h + font_size * 2 + margin
+
+    out = [svg_open(width, height, theme)]
+    if title:
+        out.append(svg_text(width / 2, margin + font_size, [title], theme['textColor'], font_size * 1.3,
+                            weight='bold', sized=True))
+
+    # Alternate section bands
+    sections = []
+    for i, task in enumerate(tasks):
+        if not sections or sections[-1][0] != task['section']:
+            sections.append([task['section'], i, i])
+        sections[-1][2] = i
+    for n, (_, first, last) in enumerate(sections):
+        if n % 2 == 0:
+            out.append(f'<rect x="{fmt(margin)}" y="{fmt(origin_y + first * row_h)}" '
+                       f'width="{fmt(label_w + chart_w)}" height="{fmt((last - first + 1) * row_h)}" '
+                       f'fill="{theme["sectionBkgColor"]}"/>')
+
+    step = next((s for s in TICK_STEPS if span / s <= 10), TICK_STEPS[-1])
+    axis_y = origin_y + len(tasks) * row_h
+    tick = 0
+    while tick <= span:
+        x = origin_x + tick * scale
+        out.append(f'<line x1="{fmt(x)}" y1="{fmt(origin_y)}" x2="{fmt(x)}" y2="{fmt(axis_y)}" '
+                   f'stroke="{theme["gridColor"]}"/>')
+        out.append(svg_text(x, axis_y + font_size, [(start + timedelta(seconds=tick)).strftime(axis_format)],
+                            theme['textColor'], font_size * 0.85, sized=True))
+        tick += step
+
+    for i, task in enumerate(tasks):
+        y = origin_y + i * row_h + (row_h - bar_h) / 2
+        x = origin_x + (task['start'] - start).total_seconds() * scale
+        w = max((task['end'] - task['start']).total_seconds() * scale, 2)
+        if 'crit' in task['tags']:
+            fill, stroke = theme['critBkgColor'], theme['critBorderColor']
+        elif 'done' in task['tags']:
+            fill, stroke = theme['doneTaskBkgColor'], theme['doneTaskBorderColor']
+        elif 'active' in task['tags']:
+            fill, stroke = theme['activeTaskBkgColor'], theme['taskBorderColor']
+        else:
+            fill, stroke = theme['taskBkgColor'], theme['taskBorderColor']
+        if 'milestone' in task['tags']:
+            cy = y + bar_h / 2
+            out.append(f'<polygon points="{fmt(x)},{fmt(y)} {fmt(x + bar_h / 2)},{fmt(cy)} '
+                       f'{fmt(x)},{fmt(y + bar_h)} {fmt(x - bar_h / 2)},{fmt(cy)}" '
+                       f'fill="{fill}" stroke="{stroke}"/>')
+        else:
+            out.append(f'<rect x="{fmt(x)}" y="{fmt(y)}" width="{fmt(w)}" height="{bar_h}" rx="3" '
+                       f'fill="{fill}" stroke="{stroke}"/>')
+        out.append(svg_text(origin_x - 10, y + bar_h / 2, [task['name']], theme['textColor'], font_size,
+                            anchor='end'))
+    out.append('</svg>')
+    return '\n'.join(out)
+
+RENDERERS = {
+    'graph': render_graph,
+    'flowchart': render_graph,
+    'pie': render_pie,
+    'gantt': render_gantt,
+}
+
+def render_mermaid(source, diagram_id='mermaid'):
+    """Render one Mermaid block (without the ``` fence) to an SVG string.
+
+    diagram_id prefixes the ids the SVG defines so several diagrams can share a page.
+    """
+    body, theme = parse_init(source)
+    for _, line in _statements(body):
+        kind = line.split()[0]
+        break
+    else:
+        raise MermaidError("empty diagram")
+    renderer = RENDERERS.get(kind)
+    if renderer is None:
+        raise MermaidError(f"unsupported diagram type {kind!r}")
+    try:
+        return renderer(body, theme, diagram_id)
+    except MermaidError:
+        raise
+    except (ValueError, TypeError, KeyError, IndexError, ZeroDivisionError) as e:
+        # Malformed input the parsers do not check for must not fail the whole document
+        raise MermaidError(f"cannot render {kind} diagram: {e}") from e
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print(f"Usage: {sys.argv[0]} DIAGRAM.mmd > DIAGRAM.svg")
+        sys.exit(2)
+    with open(sys.argv[1], 'r', encoding='utf-8') as f:
+        print(render_mermaid(f.read()))
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Write-if-changed, atomic output for generated artifacts
+
+Every SVG, Markdown, HTML, PDF and PNG the scripts produce goes through here.
+New content is compared with the file already at the destination (size, then
+SHA-256) and the write is skipped when they are identical, so unchanged
+outputs keep their mtime and downstream rsync, CDN invalidation and make rules
+stay quiet. Real writes go to a temporary file in the destination directory
+that is renamed into place, so readers see the old file or the new one, never
+half of either.
+
+Tools that insist on writing a path themselves (weasyprint, wkhtmltopdf,
+pikepdf) write into atomic_output()'s temporary path instead. counts holds the
+written/skipped totals for report_outputs().
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+counts = {'written': 0, 'skipped': 0}
+
+# Permissions for new files (mkstemp would create them 0600)
+_umask = os.umask(0)
+os.umask(_umask)
+NEW_FILE_MODE = 0o666 & ~_umask
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.digest()
+
+def _unchanged(path, size, digest):
+    """True if path exists with exactly this size and content digest"""
+    try:
+        if os.path.getsize(path) != size:
+            return False
+        return _file_digest(path) == digest
+    except OSError:
+        return False
+
+def _temporary(path, suffix='.tmp'):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=suffix)
+    os.close(fd)
+    return tmp_path
+
+def _replace(tmp_path, path):
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except OSError:
+        mode = NEW_FILE_MODE
+    os.chmod(tmp_path, mode)
+    os.replace(tmp_path, path)
+
+def _record(written):
+    counts['written' if written else 'skipped'] += 1
+    return written
+
+def write_output(path, data):
+    """Write data (str as UTF-8, or bytes) to path unless it already holds it; return True if written"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    if _unchanged(path, len(data), hashlib.sha256(data).digest()):
+        return _record(False)
+    tmp_path = _temporary(path)
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        _replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return _record(True)
+
+def publish_output(tmp_path, path):
+    """Move a finished temporary file to path, or drop it if path already has the same content"""
+    try:
+        if _unchanged(path, os.path.getsize(tmp_path), _file_digest(tmp_path)):
+            os.remove(tmp_path)
+            return _record(False)
+        _replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return _record(True)
+
+def copy_output(source, path):
+    """Copy source to path unless path already has the same content; return True if written"""
+    if _unchanged(path, os.path.getsize(source), _file_digest(source)):
+        return _record(False)
+    tmp_path = _temporary(path)
+    try:
+        shutil.copyfile(source, tmp_path)
+        _replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return _record(True)
+
+@contextmanager
+def atomic_output(path):
+    """Yield a temporary path next to path; when the block succeeds, publish it to path if changed.
+
+    The yielded file exists (empty) so callers can hand it to tools that write a path.
+    """
+    # Keep the extension: wkhtmltopdf and pikepdf look at it
+    tmp_path = _temporary(path, os.path.splitext(path)[1])
+    try:
+        yield tmp_path
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    publish_output(tmp_path, path)
+
+def add_counts(other):
+    """Add written/skipped counts reported by another process"""
+    for name in counts:
+        counts[name] += other.get(name, 0)
+
+def reset_counts():
+    counts.update(written=0, skipped=0)
+
+def report_outputs():
+    """Print how many outputs this run wrote and how many it left untouched"""
+    print(f"Outputs: {counts['written']} written, {counts['skipped']} unchanged")
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Shrink and linearize PDFs written by the converters
+
+Deduplicates identical images and embedded font programs, recompresses every
+stream, packs objects into object streams and writes linearized ("fast web
+view") output. Needs pikepdf. Fonts are not touched beyond deduplication:
+weasyprint already embeds only the glyphs a document uses (full_fonts=False
+is its default), with or without optimize.
+"""
+import hashlib
+import os
+import sys
+import tempfile
+
+# Options for weasyprint's write_pdf in optimize mode: recompress images
+WEASYPRINT_OPTIONS = {'optimize_images': True}
+
+FONT_FILE_KEYS = ('/FontFile', '/FontFile2', '/FontFile3')
+
+def _stream_digest(stream):
+    """Hash a stream's encoded bytes together with its dictionary (minus /Length)"""
+    digest = hashlib.sha256(stream.read_raw_bytes())
+    for key in sorted(stream.stream_dict.keys()):
+        if key != '/Length':
+            digest.update(f"{key}={stream.stream_dict[key]!r}".encode())
+    return digest.digest()
+
+def _font_descriptors(font):
+    descriptor = font.get('/FontDescriptor')
+    if descriptor is not None:
+        yield descriptor
+    for descendant in font.get('/DescendantFonts', []):
+        descriptor = descendant.get('/FontDescriptor')
+        if descriptor is not None:
+            yield descriptor
+
+def deduplicate(pdf):
+    """Point duplicate image XObjects and font programs at a single copy; return the count"""
+    seen = {}
+    replaced = 0
+
+    def canonical(obj):
+        nonlocal replaced
+        key = _stream_digest(obj)
+        first = seen.setdefault(key, obj)
+        if first.objgen != obj.objgen:
+            replaced += 1
+        return first
+
+    for page in pdf.pages:
+        resources = page.obj.get('/Resources')
+        if resources is None:
+            continue
+        xobjects = resources.get('/XObject', {})
+        for name in list(xobjects.keys()):
+            xobject = xobjects[name]
+            if xobject.get('/Subtype') == '/Image':
+                xobjects[name] = canonical(xobject)
+        fonts = resources.get('/Font', {})
+        for name in list(fonts.keys()):
+            for descriptor in _font_descriptors(fonts[name]):
+                for key in FONT_FILE_KEYS:
+                    if key in descriptor:
+                        descriptor[key] = canonical(descriptor[key])
+    # Unreferenced duplicates are dropped when the file is saved
+    return replaced
+
+def optimize_pdf(input_file, output_file=None, linearize=True):
+    """Optimize a PDF in place (or into output_file); return (bytes before, bytes after)"""
+    import pikepdf
+
+    output_file = output_file or input_file
+    before = os.path.getsize(input_file)
+    with pikepdf.open(input_file) as pdf:
+        deduplicate(pdf)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_file)), suffix='.pdf')
+        os.close(fd)
+        os.chmod(tmp_path, os.stat(input_file).st_mode & 0o777)
+        try:
+            pdf.save(tmp_path,
+                     compress_streams=True,
+                     recompress_flate=True,
+                     stream_decode_level=pikepdf.StreamDecodeLevel.generalized,
+                     object_stream_mode=pikepdf.ObjectStreamMode.generate,
+                     # Same input, same bytes: a time-based /ID would defeat write-if-changed
+                     deterministic_id=True,
+                     linearize=linearize)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    os.replace(tmp_path, output_file)
+    return before, os.path.getsize(output_file)
+
+def report_savings(path, before, after):
+    saved = before - after
+    percent = saved / before * 100 if before else 0
+    print(f"Optimized {path}: {before:,} -> {after:,} bytes ({saved:,} saved, {percent:.1f}%)")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(f"Usage: {sys.argv[0]} FILE.pdf [FILE.pdf ...]")
+        sys.exit(2)
+    for path in sys.argv[1:]:
+        report_savings(path, *optimize_pdf(path))
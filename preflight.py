@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Dependency preflight for the report converters
+
+Checks that the required distributions are installed using package metadata
+and import-spec lookups only: nothing is imported, nothing is installed and no
+subprocess is started. A successful check is remembered per environment
+fingerprint so later runs skip it entirely.
+"""
+import glob
+import hashlib
+import importlib.metadata
+import importlib.util
+import json
+import os
+import sys
+
+from build_cache import DEFAULT_CACHE_DIR
+
+# Distributions whose import name differs from the distribution name
+KNOWN_IMPORT_NAMES = {
+    'beautifulsoup4': 'bs4',
+    'pillow': 'PIL',
+    'pyyaml': 'yaml',
+    'markdown-it-py': 'markdown_it',
+}
+
+class MissingDependencyError(RuntimeError):
+    """Raised when required distributions are not installed"""
+
+def import_name(distribution):
+    """Resolve the top-level import name provided by an installed distribution"""
+    key = distribution.lower().replace('_', '-')
+    if key in KNOWN_IMPORT_NAMES:
+        return KNOWN_IMPORT_NAMES[key]
+    try:
+        top_level = importlib.metadata.distribution(distribution).read_text('top_level.txt')
+    except importlib.metadata.PackageNotFoundError:
+        top_level = None
+    if top_level and top_level.split():
+        return top_level.split()[0]
+    return key.replace('-', '_')
+
+def environment_fingerprint():
+    """Hash the interpreter and the modification times of its site-packages directories.
+
+    Installing, upgrading or removing a package adds or removes a .dist-info
+    directory there, which changes the fingerprint. Other sys.path entries,
+    such as the script directory the converters write into, are left out.
+    """
+    digest = hashlib.sha256(f"{sys.executable}\0{sys.version}".encode())
+    for entry in sys.path:
+        if os.path.basename(os.path.normpath(entry or '.')) not in ('site-packages', 'dist-packages'):
+            continue
+        try:
+            mtime = os.stat(entry).st_mtime_ns
+        except OSError:
+            mtime = 0
+        digest.update(f"\0{entry}\0{mtime}".encode())
+    return digest.hexdigest()
+
+def _marker_path(distributions, cache_dir):
+    """<cache>/preflight/<hash of the names>-<hash of the environment>.json"""
+    names = ",".join(sorted(d.lower() for d in distributions))
+    names_key = hashlib.sha256(names.encode()).hexdigest()[:16]
+    environment_key = hashlib.sha256(environment_fingerprint().encode()).hexdigest()[:16]
+    return os.path.join(cache_dir or DEFAULT_CACHE_DIR, 'preflight', f"{names_key}-{environment_key}.json")
+
+def _remove_old_markers(marker):
+    """Delete markers for the same distributions written for an earlier environment"""
+    names_key = os.path.basename(marker).split('-')[0]
+    for path in glob.glob(os.path.join(os.path.dirname(marker), f"{names_key}-*.json")):
+        if path != marker:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def check_requirements(distributions, cache_dir=None):
+    """Return {distribution: version}, raising MissingDependencyError if any are missing"""
+    marker = _marker_path(distributions, cache_dir)
+    try:
+        with open(marker, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    found = {}
+    missing = []
+    for distribution in distributions:
+        try:
+            version = importlib.metadata.version(distribution)
+        except importlib.metadata.PackageNotFoundError:
+            version = None
+        module = import_name(distribution)
+        if version is None or importlib.util.find_spec(module) is None:
+            missing.append(f"{distribution} (import {module})")
+        else:
+            found[distribution] = version
+
+    if missing:
+        raise MissingDependencyError(
+            "Missing required packages: " + ", ".join(missing) + "\n"
+            f"Install them with: {sys.executable} -m pip install "
+            + " ".join(d for d in distributions if d not in found))
+
+    try:
+        os.makedirs(os.path.dirname(marker), exist_ok=True)
+        tmp_path = f"{marker}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(found, f)
+        os.replace(tmp_path, marker)
+        _remove_old_markers(marker)
+    except OSError:
+        # A read-only cache only costs the next run a few metadata lookups
+        pass
+    return found
+
+if __name__ == "__main__":
+    try:
+        versions = check_requirements(sys.argv[1:] or ['markdown', 'weasyprint', 'pygments'])
+    except MissingDependencyError as e:
+        print(e)
+        sys.exit(1)
+    for name, version in versions.items():
+        print(f"{name} {version}")
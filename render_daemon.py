@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Warm rendering daemon for convert_to_pdf_weasyprint
+
+Keeps markdown, weasyprint, pygments and the font configuration loaded in a
+bounded pool of worker processes and accepts jobs over a local Unix socket.
+The protocol is one JSON object per line in each direction:
+
+    {"input": "/abs/report.md", "output": "/abs/report.pdf"}  -> {"ok": true, ...}
+    (add "optimize": true to shrink and linearize the PDF)
+    {"cmd": "ping"}                                            -> {"ok": true, "workers": 4}
+    {"cmd": "shutdown"}                                        -> {"ok": true}
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from build_cache import BuildCache
+from convert_to_pdf_weasyprint import REQUIRED_PACKAGES, _shared_converter, convert_md_to_pdf
+from preflight import MissingDependencyError, check_requirements
+
+DEFAULT_SOCKET = os.environ.get('REPORT_RENDER_SOCKET', f"/tmp/report-render-{os.getuid()}.sock")
+
+def _warm_worker(cache):
+    """Build the worker's Converter and initialise fonts before the first job"""
+    # A throwaway render loads pygments and pango/fontconfig state that later jobs reuse
+    _shared_converter(cache).convert("warm-up\n\n```python\npass\n```\n")
+
+def _render_job(input_file, output_file, cache, optimize):
+    return convert_md_to_pdf(input_file, output_file, cache, optimize)
+
+class _JobHandler(socketserver.StreamRequestHandler):
+    """Serve newline-delimited JSON requests on one client connection"""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                response = {'ok': False, 'error': "request is not valid JSON"}
+            else:
+                response = self.server.dispatch(request)
+            self.wfile.write((json.dumps(response) + "\n").encode('utf-8'))
+            self.wfile.flush()
+
+class RenderDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix-socket server that hands render jobs to a warm process pool"""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path=None, workers=None, cache=None):
+        self.socket_path = socket_path or DEFAULT_SOCKET
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = cache
+        if os.path.exists(self.socket_path):
+            # Refuse to steal the socket of a live daemon, but clear a stale one
+            if _socket_alive(self.socket_path):
+                raise RuntimeError(f"A render daemon is already listening on {self.socket_path}")
+            os.remove(self.socket_path)
+        # Created owner-only: a chmod after bind() would leave a window where others can connect
+        umask = os.umask(0o177)
+        try:
+            super().__init__(self.socket_path, _JobHandler)
+        finally:
+            os.umask(umask)
+        os.chmod(self.socket_path, 0o600)
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker,
+                                        initargs=(cache,))
+        # Connections beyond the pool size wait here instead of queueing unbounded work
+        self.slots = threading.BoundedSemaphore(self.workers)
+
+    def dispatch(self, request):
+        """Run one request and return its JSON-serialisable response"""
+        command = request.get('cmd', 'render')
+        if command == 'ping':
+            return {'ok': True, 'workers': self.workers}
+        if command == 'shutdown':
+            threading.Thread(target=self.shutdown, daemon=True).start()
+            return {'ok': True}
+        if command != 'render':
+            return {'ok': False, 'error': f"unknown command {command!r}"}
+
+        input_file = request.get('input')
+        output_file = request.get('output') or (input_file and os.path.splitext(input_file)[0] + '.pdf')
+        if not input_file or not os.path.isabs(input_file) or not os.path.isabs(output_file):
+            return {'ok': False, 'error': "input and output must be absolute paths"}
+        with self.slots:
+            try:
+                job = self.pool.submit(_render_job, input_file, output_file, self.cache,
+                                       bool(request.get('optimize')))
+                ok = job.result()
+            except Exception as e:
+                return {'ok': False, 'input': input_file, 'error': str(e)}
+        response = {'ok': ok, 'input': input_file, 'output': output_file}
+        if not ok:
+            response['error'] = "conversion failed, see daemon log"
+        return response
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+def _socket_alive(socket_path):
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+def send_request(request, socket_path=None, timeout=None):
+    """Send one request to a running daemon and return the decoded response"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(socket_path or DEFAULT_SOCKET)
+        client.sendall((json.dumps(request) + "\n").encode('utf-8'))
+        with client.makefile('rb') as reply:
+            line = reply.readline()
+    if not line:
+        raise ConnectionError("render daemon closed the connection without replying")
+    return json.loads(line)
+
+def submit(input_file, output_file=None, socket_path=None, timeout=None, optimize=False):
+    """Ask a running daemon to convert input_file; paths are resolved locally"""
+    request = {'input': os.path.abspath(input_file), 'optimize': optimize}
+    if output_file:
+        request['output'] = os.path.abspath(output_file)
+    return send_request(request, socket_path, timeout)
+
+def serve(socket_path=None, workers=None, cache=None):
+    """Run the daemon in the foreground until shut down"""
+    server = RenderDaemon(socket_path, workers, cache)
+    print(f"Render daemon listening on {server.socket_path} with {server.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print("Render daemon stopped")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm weasyprint rendering daemon and client")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help=f"Unix socket path (default: {DEFAULT_SOCKET})")
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_cmd = commands.add_parser('serve', help="start the daemon in the foreground")
+    serve_cmd.add_argument('--workers', type=int, help="worker processes (default: all cores)")
+    serve_cmd.add_argument('--cache-dir', help="shared build cache directory (default: $REPORT_BUILD_CACHE)")
+    serve_cmd.add_argument('--no-cache', action='store_true', help="always re-render, ignoring the build cache")
+    render_cmd = commands.add_parser('render', help="convert a file using a running daemon")
+    render_cmd.add_argument('input')
+    render_cmd.add_argument('output', nargs='?')
+    render_cmd.add_argument('--optimize', action='store_true', help="shrink and linearize the PDF")
+    commands.add_parser('ping', help="check that the daemon is up")
+    commands.add_parser('stop', help="shut the daemon down")
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        try:
+            check_requirements(REQUIRED_PACKAGES)
+        except MissingDependencyError as e:
+            print(e)
+            sys.exit(1)
+        serve(args.socket, args.workers, False if args.no_cache else BuildCache(args.cache_dir))
+        sys.exit(0)
+
+    try:
+        if args.command == 'render':
+            response = submit(args.input, args.output, args.socket, optimize=args.optimize)
+        elif args.command == 'ping':
+            response = send_request({'cmd': 'ping'}, args.socket)
+        else:
+            response = send_request({'cmd': 'shutdown'}, args.socket)
+    except OSError as e:
+        print(f"Cannot reach render daemon at {args.socket}: {e}")
+        sys.exit(2)
+    print(json.dumps(response))
+    sys.exit(0 if response.get('ok') else 1)
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Section-parallel weasyprint rendering for very large reports
+
+The Markdown is converted to HTML once (so toc anchors, footnotes and
+abbreviations stay globally consistent), split at the # and ## headings that
+md_sections splits the Markdown at (never inside fenced code or raw HTML),
+and each section is laid out in its own worker process. The section PDFs are
+then merged with pikepdf into one file with a single outline, one set of
+named destinations and internal links that work across sections.
+
+Every section starts on a new page, which a single layout only does where
+the stylesheet asks for a page break. When the stylesheet prints page numbers
+(counter(page)), all sections but the first are laid out a second time with
+their page offset so the numbering runs on.
+"""
+import argparse
+import io
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from convert_to_pdf_weasyprint import REQUIRED_PACKAGES, _shared_converter
+from instrument import worker_profiled
+from md_sections import mark_sections
+from output_files import atomic_output, report_outputs, write_output
+from preflight import MissingDependencyError, check_requirements
+
+# Raw HTML line marking the section boundaries in the converted document
+SECTION_BREAK = '<!-- section-render-break -->'
+INTERNAL_HREF = re.compile(r'href="#([^"]*)"')
+HEADING = re.compile(r'<h([1-6])\b')
+
+# Internal links are rendered as external URIs with this prefix so weasyprint
+# keeps links whose anchor lives in another section; the merge turns them back
+# into named destinations.
+CROSS_LINK_PREFIX = 'https://section-link.invalid/#'
+
+def split_sections(html_content):
+    """Split an HTML fragment converted from mark_sections() output at its SECTION_BREAK lines"""
+    return [section.strip('\n') for section in html_content.split(SECTION_BREAK) if section.strip()]
+
+def outline_depths(sections):
+    """Return the outline level of each section's first heading in the whole document.
+
+    Each section PDF's outline starts at level 0, so a section opening with an
+    <h2> under the report's <h1> must be nested one level down when merged.
+    """
+    levels = [HEADING.search(section) for section in sections]
+    levels = [int(match.group(1)) if match else None for match in levels]
+    top = min((level for level in levels if level), default=1)
+    return [level - top if level else 0 for level in levels]
+
+def _page_offset_css(offset):
+    """Continue the CSS page counter from the previous sections"""
+    return f"@page :first {{ counter-reset: page {offset}; }}"
+
+def _render_section(html_content, cache, page_offset=None):
+    """Lay out one section in a worker and return the PDF bytes"""
+    html_content = INTERNAL_HREF.sub(lambda m: f'href="{CROSS_LINK_PREFIX}{m.group(1)}"', html_content)
+    extra = [_page_offset_css(page_offset)] if page_offset else []
+    with worker_profiled():
+        return _shared_converter(cache).write_pdf(html_content, extra_stylesheets=extra)
+
+def _init_worker(cache):
+    _shared_converter(cache)
+
+def _named_destinations(pdf):
+    """Return [(name, destination array)] from a flat /Dests name tree"""
+    names = pdf.Root.get('/Names', {}).get('/Dests', {}).get('/Names', [])
+    return [(str(names[i]), names[i + 1]) for i in range(0, len(names), 2)]
+
+def _flatten_outline(items, depth=0):
+    for item in items:
+        yield depth, item
+        yield from _flatten_outline(item.children, depth + 1)
+
+def merge_section_pdfs(section_pdfs, output_file, section_depths=None):
+    """Merge section PDF bytes into output_file; return the merged page count.
+
+    section_depths gives the outline level each section's bookmarks start at
+    (see outline_depths); by default every section is top level.
+    """
+    import pikepdf
+
+    merged = pikepdf.new()
+    # Sources must stay open until the merged file is saved
+    sections = [pikepdf.open(io.BytesIO(data)) for data in section_pdfs]
+    destinations = []
+    outline_entries = []
+    for index, section in enumerate(sections):
+        first_page = len(merged.pages)
+        page_numbers = {page.obj.objgen: first_page + i for i, page in enumerate(section.pages)}
+        merged.pages.extend(section.pages)
+
+        def relocate(destination):
+            # [page, /XYZ, x, y, zoom] pointing into this section -> merged page
+            page = destination[0] if len(destination) else None
+            target = page_numbers.get(getattr(page, 'objgen', None))
+            if target is None:
+                return None
+            return pikepdf.Array([merged.pages[target].obj, *list(destination)[1:]])
+
+        for name, destination in _named_destinations(section):
+            relocated = relocate(destination)
+            if relocated is not None:
+                destinations.append((name, relocated))
+        with section.open_outline() as outline:
+            offset = section_depths[index] if section_depths else 0
+            for depth, item in _flatten_outline(outline.root):
+                destination = item.destination
+                if isinstance(destination, pikepdf.Array):
+                    destination = relocate(destination)
+                outline_entries.append((depth + offset, item.title, destination))
+
+    # Cross-section links become named destinations resolved through the merged name tree
+    for page in merged.pages:
+        for annotation in page.obj.get('/Annots', []):
+            uri = str(annotation.get('/A', {}).get('/URI', ''))
+            if uri.startswith(CROSS_LINK_PREFIX):
+                del annotation['/A']
+                annotation.Dest = pikepdf.String(uri[len(CROSS_LINK_PREFIX):])
+
+    if destinations:
+        names = pikepdf.Array()
+        seen = set()
+        for name, destination in sorted(destinations, key=lambda entry: entry[0]):
+            if name not in seen:
+                seen.add(name)
+                names.append(pikepdf.String(name))
+                names.append(destination)
+        merged.Root.Names = pikepdf.Dictionary(Dests=pikepdf.Dictionary(Names=names))
+
+    with merged.open_outline() as outline:
+        stack = [(-1, outline.root)]
+        for depth, title, destination in outline_entries:
+            while stack[-1][0] >= depth:
+                stack.pop()
+            item = pikepdf.OutlineItem(title, destination)
+            if isinstance(stack[-1][1], list):
+                stack[-1][1].append(item)
+            else:
+                stack[-1][1].children.append(item)
+            stack.append((depth, item))
+
+    # A content-derived /ID keeps an unchanged report byte-identical, so it is not rewritten
+    with atomic_output(output_file) as pdf_file:
+        merged.save(pdf_file, deterministic_id=True)
+    for section in sections:
+        section.close()
+    return len(merged.pages)
+
+def convert_md_to_pdf_sections(input_file, output_file, workers=None, cache=None):
+    """Convert markdown to PDF laying out each # and ## section in parallel"""
+    try:
+        import pikepdf  # noqa: F401
+        converter = _shared_converter(cache)
+        with open(input_file, 'r', encoding='utf-8') as f:
+            html_content = converter.to_html(mark_sections(f.read(), SECTION_BREAK))
+        # An empty document still gets its (blank) page
+        sections = split_sections(html_content) or ['']
+        html_content = '\n'.join(sections)
+        workers = max(1, min(workers or os.cpu_count() or 1, len(sections)))
+        print(f"Laying out {len(sections)} sections with {workers} workers...")
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cache,)) as pool:
+            section_pdfs = list(pool.map(_render_section, sections, [cache] * len(sections)))
+            if 'counter(page' in converter.stylesheet and len(sections) > 1:
+                # Printed page numbers must continue across sections, which needs
+                # each section's starting page: re-lay out the later ones with
+                # their offsets (the first starts at page 1 either way)
+                offsets = [0]
+                for data in section_pdfs[:-1]:
+                    offsets.append(offsets[-1] + _page_count(data))
+                section_pdfs[1:] = pool.map(_render_section, sections[1:], [cache] * (len(sections) - 1),
+                                            offsets[1:])
+
+        pages = merge_section_pdfs(section_pdfs, output_file, outline_depths(sections))
+        print(f"PDF successfully created: {output_file} ({pages} pages)")
+
+        html_file = output_file.replace('.pdf', '.html')
+        write_output(html_file, converter.html_document(html_content))
+        print(f"HTML version also saved: {html_file}")
+        return True
+    except ImportError as e:
+        print(f"Error: {e}")
+        print(f"Section mode needs: {sys.executable} -m pip install pikepdf " + " ".join(REQUIRED_PACKAGES))
+        return False
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+
+def _page_count(data):
+    import pikepdf
+    with pikepdf.open(io.BytesIO(data)) as pdf:
+        return len(pdf.pages)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lay out a large report section by section in parallel")
+    parser.add_argument('input')
+    parser.add_argument('output', nargs='?')
+    parser.add_argument('--workers', type=int, help="worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    try:
+        check_requirements(REQUIRED_PACKAGES + ['pikepdf'])
+    except MissingDependencyError as e:
+        print(e)
+        sys.exit(1)
+    output = args.output or os.path.splitext(args.input)[0] + '.pdf'
+    ok = convert_md_to_pdf_sections(args.input, output, args.workers)
+    report_outputs()
+    sys.exit(0 if ok else 1)
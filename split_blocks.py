@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Split oversized tables and code blocks into page-sized chunks
+
+The weasyprint stylesheet keeps every table and <pre> on one page
+(page-break-inside: avoid). A thousand-row table can never fit, so weasyprint
+retries the layout page after page and the table still overflows. Tables with
+more than table_rows body rows become consecutive tables of table_rows rows,
+each repeating the <thead>; code blocks longer than code_lines lines become
+consecutive blocks. Every chunk fits on a page, so the avoid rule is cheap
+again and layout time grows linearly with the row count.
+
+Chunks are wrapped in <div class="split-block"> so the stylesheet can join
+them visually. Row counts are rounded down to even numbers, which keeps the
+tr:nth-child(even) striping continuous across chunks.
+"""
+import re
+
+# About one A4 page at the stylesheet's 10pt table and 9pt code sizes
+DEFAULT_TABLE_ROWS = 30
+DEFAULT_CODE_LINES = 60
+
+TABLE = re.compile(r'(<table\b[^>]*>)(.*?)</table>', re.S)
+THEAD = re.compile(r'<thead>.*?</thead>', re.S)
+TBODY = re.compile(r'<tbody>(.*?)</tbody>', re.S)
+ROW = re.compile(r'<tr\b[^>]*>.*?</tr>', re.S)
+# codehilite (<div class="codehilite"><pre><span></span><code>) or plain fenced code
+CODE = re.compile(r'(<div class="codehilite">)?(<pre\b[^>]*>(?:<span></span>)?<code\b[^>]*>)(.*?)</code></pre>'
+                  r'(?(1)</div>)', re.S)
+
+def _chunks(items, size):
+    size = max(2, size - size % 2)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def split_tables(html, table_rows=DEFAULT_TABLE_ROWS):
+    """Split tables with more than table_rows body rows, repeating the header in every chunk"""
+    def split(match):
+        opening, body = match.group(1), match.group(2)
+        tbody = TBODY.search(body)
+        if '<table' in body or not tbody:
+            return match.group(0)
+        rows = ROW.findall(tbody.group(1))
+        if len(rows) <= table_rows:
+            return match.group(0)
+        thead = THEAD.search(body)
+        head = thead.group(0) + '\n' if thead else ''
+        tables = [f"{opening}\n{head}<tbody>\n" + '\n'.join(chunk) + "\n</tbody>\n</table>"
+                  for chunk in _chunks(rows, table_rows)]
+        return '<div class="split-block">\n' + '\n'.join(tables) + '\n</div>'
+    return TABLE.sub(split, html)
+
+def split_code_blocks(html, code_lines=DEFAULT_CODE_LINES):
+    """Split code blocks longer than code_lines lines (pygments closes its spans at every line end)"""
+    def split(match):
+        wrapper, opening, code = match.group(1), match.group(2), match.group(3)
+        lines = code.split('\n')
+        if lines and lines[-1] == '':
+            lines.pop()
+        if len(lines) <= code_lines:
+            return match.group(0)
+        blocks = []
+        for chunk in _chunks(lines, code_lines):
+            block = opening + '\n'.join(chunk) + '\n</code></pre>'
+            blocks.append(f"{wrapper}{block}</div>" if wrapper else block)
+        return '<div class="split-block">\n' + '\n'.join(blocks) + '\n</div>'
+    return CODE.sub(split, html)
+
+def split_large_blocks(html, table_rows=DEFAULT_TABLE_ROWS, code_lines=DEFAULT_CODE_LINES):
+    """Apply split_tables and split_code_blocks; a falsy limit leaves that kind alone"""
+    if table_rows:
+        html = split_tables(html, table_rows)
+    if code_lines:
+        html = split_code_blocks(html, code_lines)
+    return html
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Ways of embedding the diagram SVGs in the generated Markdown/HTML
+
+    raw       each diagram's own markup, unchanged (the default)
+    inline    full markup in the page; ids are namespaced per diagram and
+              identical <marker>s are hoisted into one shared <defs>
+              (browsers only: WeasyPrint does not resolve url(#...) across
+              separate <svg> elements, so the PDF converters reject it)
+    img       <img src="svg-diagrams/...svg">, cached by browsers and CDNs
+    object    <object data="svg-diagrams/...svg"> (keeps links and fonts live)
+    data-uri  <img src="data:image/svg+xml,..."> for single-file output
+"""
+import re
+import xml.etree.ElementTree as ET
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+
+from svg_optimize import SVG_NS, serialize, strip_whitespace
+
+EMBED_MODES = ('raw', 'inline', 'img', 'object', 'data-uri')
+
+# id of the hidden <svg> holding the definitions shared by inline diagrams
+SHARED_DEFS_ID = 'svg-shared-defs'
+
+# Definitions worth sharing between diagrams
+SHARED_DEF_TAGS = {'marker', 'linearGradient', 'radialGradient', 'pattern', 'filter', 'clipPath'}
+
+URL_REFERENCE = re.compile(r'url\(#([^)]+)\)')
+HREF_ATTRIBUTES = ('href', '{http://www.w3.org/1999/xlink}href')
+
+def _rewrite_references(root, rename):
+    """Point url(#id) and href="#id" references at rename(id)"""
+    for element in root.iter():
+        for name, value in element.attrib.items():
+            if name in HREF_ATTRIBUTES and value.startswith('#'):
+                element.set(name, '#' + rename(value[1:]))
+            elif 'url(#' in value:
+                element.set(name, URL_REFERENCE.sub(lambda m: f"url(#{rename(m.group(1))})", value))
+        if element.tag == f'{{{SVG_NS}}}style' and element.text and 'url(#' in element.text:
+            element.text = URL_REFERENCE.sub(lambda m: f"url(#{rename(m.group(1))})", element.text)
+
+def namespace_ids(root, prefix):
+    """Prefix every id below the root element (and references to it) with prefix"""
+    ids = {element.get('id') for element in root.iter() if element is not root and element.get('id')}
+    for element in root.iter():
+        if element is not root and element.get('id') in ids:
+            element.set('id', f"{prefix}-{element.get('id')}")
+    _rewrite_references(root, lambda name: f"{prefix}-{name}" if name in ids else name)
+
+def _definition_key(element):
+    """Serialise a definition without its id, so identical ones compare equal"""
+    copy = ET.Element(element.tag, {k: v for k, v in element.attrib.items() if k != 'id'})
+    copy[:] = list(element)
+    copy.text = element.text
+    return serialize(copy)
+
+def inline_with_shared_defs(diagrams):
+    """Namespace ids and hoist shared definitions for diagrams inlined in one page.
+
+    Returns ({name: svg markup}, shared) where shared is a hidden <svg> holding
+    the hoisted <defs>, to be placed once before the first diagram ('' if
+    nothing is shared). References across inline SVGs resolve in browsers
+    only; renderers that treat each <svg> separately (WeasyPrint) need raw.
+    """
+    roots = {}
+    for name, svg in diagrams.items():
+        root = ET.fromstring(svg)
+        # Blank lines inside inline markup would end the HTML block in Markdown
+        strip_whitespace(root)
+        namespace_ids(root, name)
+        roots[name] = root
+
+    # Every candidate definition, grouped by content
+    groups = {}
+    for root in roots.values():
+        for defs in root.iter(f'{{{SVG_NS}}}defs'):
+            for element in defs:
+                if element.tag.split('}')[-1] in SHARED_DEF_TAGS and element.get('id'):
+                    groups.setdefault(_definition_key(element), []).append((root, defs, element))
+
+    shared = []
+    renames = {}
+    for copies in groups.values():
+        if len({id(root) for root, _, _ in copies}) < 2:
+            continue
+        kept = copies[0][2]
+        shared_id = f"shared-{kept.tag.split('}')[-1]}{len(shared) + 1}"
+        for root, defs, element in copies:
+            renames.setdefault(id(root), {})[element.get('id')] = shared_id
+            defs.remove(element)
+        kept.set('id', shared_id)
+        kept.tail = None
+        shared.append(kept)
+
+    result = {}
+    for name, root in roots.items():
+        mapping = renames.get(id(root))
+        if mapping:
+            _rewrite_references(root, lambda ref: mapping.get(ref, ref))
+        for parent in list(root.iter()):
+            for defs in parent.findall(f'{{{SVG_NS}}}defs'):
+                if not len(defs):
+                    parent.remove(defs)
+        result[name] = serialize(root)
+
+    if not shared:
+        return result, ''
+    holder = ET.Element(f'{{{SVG_NS}}}svg', {'id': SHARED_DEFS_ID, 'width': '0', 'height': '0',
+                                            'aria-hidden': 'true', 'style': 'position:absolute'})
+    ET.SubElement(holder, f'{{{SVG_NS}}}defs')[:] = shared
+    return result, serialize(holder)
+
+def _attribute(value):
+    return escape(value, {'"': '&quot;'})
+
+def _size_attributes(svg):
+    root = ET.fromstring(svg)
+    return ''.join(f' {key}="{_attribute(root.get(key))}"' for key in ('width', 'height') if root.get(key))
+
+def external_reference(svg, href, alt, mode='img'):
+    """Return an <img> or <object> tag linking to a standalone SVG file"""
+    size = _size_attributes(svg)
+    href = _attribute(href)
+    alt = _attribute(alt)
+    if mode == 'object':
+        return f'<object data="{href}" type="image/svg+xml"{size}>{alt}</object>'
+    return f'<img src="{href}" alt="{alt}"{size}>'
+
+def data_uri_reference(svg, alt):
+    """Return an <img> carrying the SVG as a percent-encoded data URI.
+
+    Percent-encoding keeps most of the markup readable and is smaller than base64.
+    """
+    uri = "data:image/svg+xml," + quote(' '.join(svg.split()), safe="/:=;,'()!*-._~")
+    return f'<img src="{uri}" alt="{_attribute(alt)}"{_size_attributes(svg)}>'
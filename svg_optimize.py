@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Size optimizer for the report's SVG diagrams
+
+Strips comments and insignificant whitespace, rounds coordinates, collapses
+redundant <g> wrappers and hoists presentation attributes that repeat across
+elements into rules in a single <style>. The rendered result is unchanged
+apart from coordinates moving by at most the rounding precision.
+"""
+import re
+import sys
+import xml.etree.ElementTree as ET
+from collections import Counter
+from xml.sax.saxutils import escape
+
+from output_files import report_outputs, write_output
+
+SVG_NS = 'http://www.w3.org/2000/svg'
+NAMESPACE_PREFIXES = {
+    'http://www.w3.org/1999/xlink': 'xlink',
+    'http://www.w3.org/XML/1998/namespace': 'xml',
+}
+
+# Attributes whose numbers are geometry and can be rounded
+COORDINATE_ATTRIBUTES = {
+    'x', 'y', 'x1', 'y1', 'x2', 'y2', 'cx', 'cy', 'r', 'rx', 'ry', 'dx', 'dy',
+    'width', 'height', 'd', 'points', 'transform', 'viewBox',
+    'refX', 'refY', 'markerWidth', 'markerHeight', 'stroke-width',
+}
+
+# Presentation attributes that may be moved into CSS, with the unit CSS needs
+PRESENTATION_ATTRIBUTES = {
+    'fill': '', 'stroke': '', 'stroke-width': 'px', 'stroke-dasharray': '',
+    'stroke-linecap': '', 'stroke-linejoin': '', 'opacity': '', 'fill-opacity': '',
+    'stroke-opacity': '', 'font-family': '', 'font-size': 'px', 'font-weight': '',
+    'font-style': '', 'text-anchor': '', 'dominant-baseline': '',
+}
+
+# Elements whose character data is rendered and must keep its spaces
+TEXT_ELEMENTS = {'text', 'tspan', 'textPath', 'title', 'desc', 'style'}
+
+NUMBER = re.compile(r'-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+BARE_NUMBER = re.compile(r'-?(?:\d+\.?\d*|\.\d+)$')
+WHITESPACE = re.compile(r'\s+')
+
+def _local(name):
+    """Return 'rect' for '{svg-ns}rect' and 'xlink:href' for '{xlink-ns}href'"""
+    if name.startswith('{'):
+        namespace, local = name[1:].split('}', 1)
+        if namespace == SVG_NS:
+            return local
+        return f"{NAMESPACE_PREFIXES.get(namespace, 'ns')}:{local}"
+    return name
+
+def _round_number(match, precision):
+    value = round(float(match.group(0)), precision)
+    text = f"{value:.{precision}f}".rstrip('0').rstrip('.') if precision else str(int(value))
+    return '0' if text in ('-0', '') else text
+
+def round_coordinates(root, precision=1):
+    """Round every number in geometry attributes to precision decimals"""
+    for element in root.iter():
+        for name, value in element.attrib.items():
+            if _local(name) in COORDINATE_ATTRIBUTES:
+                element.set(name, NUMBER.sub(lambda m: _round_number(m, precision), value))
+
+def strip_whitespace(element, in_text=False):
+    """Drop whitespace-only text outside text elements, collapse runs inside them"""
+    in_text = in_text or _local(element.tag) in TEXT_ELEMENTS
+    if element.text is not None:
+        if in_text:
+            element.text = WHITESPACE.sub(' ', element.text)
+        elif not element.text.strip():
+            element.text = None
+    for child in element:
+        strip_whitespace(child, in_text)
+        if child.tail is not None:
+            if in_text:
+                child.tail = WHITESPACE.sub(' ', child.tail)
+            elif not child.tail.strip():
+                child.tail = None
+
+def collapse_groups(element):
+    """Inline <g> wrappers that carry nothing, or only settings one child can take"""
+    index = 0
+    while index < len(element):
+        child = element[index]
+        collapse_groups(child)
+        if _local(child.tag) != 'g' or (child.text and child.text.strip()):
+            index += 1
+            continue
+        attributes = {_local(name) for name in child.attrib}
+        if not len(child):
+            element.remove(child)
+            continue
+        if not attributes:
+            # A bare <g>: splice its children into the parent
+            grandchildren = list(child)
+            element.remove(child)
+            for offset, grandchild in enumerate(grandchildren):
+                element.insert(index + offset, grandchild)
+            continue
+        if len(child) == 1 and not attributes & {'id', 'class', 'style', 'opacity', 'clip-path', 'mask', 'filter'}:
+            # A single-child group: its attributes apply to that child alone
+            only = child[0]
+            for name, value in child.attrib.items():
+                if _local(name) == 'transform':
+                    inner = only.get('transform')
+                    only.set('transform', f"{value} {inner}" if inner else value)
+                elif name not in only.attrib:
+                    only.set(name, value)
+            only.tail = child.tail
+            element[index] = only
+            continue
+        index += 1
+
+def _css_value(name, value):
+    unit = PRESENTATION_ATTRIBUTES[name]
+    return f"{value}{unit}" if unit and BARE_NUMBER.match(value) else value
+
+def _class_name(index):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    name = ''
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        name = letters[rest] + name
+    return name
+
+def hoist_presentation_attributes(root, scope=None):
+    """Replace repeated presentation attribute sets with CSS rules; return the CSS.
+
+    An SVG inlined in HTML shares the page's style sheet, so with scope (the
+    root element's id) every selector is limited to this diagram.
+    """
+    prefix = f"#{scope} " if scope else ''
+    def attribute_set(element):
+        if 'class' in element.attrib or 'style' in element.attrib:
+            return None
+        pairs = tuple(sorted((name, value) for name, value in element.attrib.items()
+                             if name in PRESENTATION_ATTRIBUTES))
+        return pairs or None
+
+    rules = []
+    # Settings shared by every element of a type become a type rule, e.g. text{font-family:Arial}
+    by_tag = {}
+    for element in root.iter():
+        by_tag.setdefault(element.tag, []).append(element)
+    for tag, elements in by_tag.items():
+        sets = [attribute_set(e) for e in elements]
+        if len(elements) < 2 or None in sets:
+            continue
+        shared = sorted(set.intersection(*(set(pairs) for pairs in sets)))
+        if not shared:
+            continue
+        rule = f"{prefix}{_local(tag)}{{" + ";".join(f"{k}:{_css_value(k, v)}" for k, v in shared) + "}"
+        if len(elements) * sum(len(f' {k}="{v}"') for k, v in shared) > len(rule):
+            rules.append(rule)
+            for element in elements:
+                for key, _ in shared:
+                    del element.attrib[key]
+
+    counts = Counter(filter(None, (attribute_set(e) for e in root.iter())))
+    classes = {}
+    type_rules = len(rules)
+    for pairs, count in counts.most_common():
+        if count < 2:
+            break
+        name = _class_name(len(rules) - type_rules)
+        rule = f"{prefix}.{name}{{" + ";".join(f"{k}:{_css_value(k, v)}" for k, v in pairs) + "}"
+        inline = sum(len(f' {k}="{v}"') for k, v in pairs)
+        # Only hoist when the rule costs less than the attributes it replaces
+        if count * (inline - len(f' class="{name}"')) > len(rule):
+            classes[pairs] = name
+            rules.append(rule)
+    if not classes:
+        return ''.join(rules)
+    for element in root.iter():
+        name = classes.get(attribute_set(element))
+        if name:
+            for key, _ in attribute_set(element):
+                del element.attrib[key]
+            element.set('class', name)
+    return ''.join(rules)
+
+def serialize(element):
+    """Write an element tree as compact SVG markup"""
+    parts = []
+    namespaces = set()
+
+    def write(node):
+        tag = _local(node.tag)
+        attributes = []
+        for name, value in node.attrib.items():
+            name = _local(name)
+            if ':' in name:
+                namespaces.add(name.split(':', 1)[0])
+            attributes.append(f' {name}="{escape(value, {chr(34): "&quot;"})}"')
+        parts.append(f"<{tag}{''.join(attributes)}")
+        if node.text or len(node):
+            parts.append(">")
+            if node.text:
+                parts.append(escape(node.text))
+            for child in node:
+                write(child)
+                if child.tail:
+                    parts.append(escape(child.tail))
+            parts.append(f"</{tag}>")
+        else:
+            parts.append("/>")
+
+    write(element)
+    declarations = [f' xmlns="{SVG_NS}"']
+    for namespace, prefix in NAMESPACE_PREFIXES.items():
+        if prefix in namespaces and prefix != 'xml':
+            declarations.append(f' xmlns:{prefix}="{namespace}"')
+    parts[0] += ''.join(declarations)
+    return ''.join(parts)
+
+def optimize_svg(svg, precision=1, scope=None):
+    """Return a smaller, visually equivalent version of an SVG document string.
+
+    scope is an id for the root <svg> that keeps the hoisted CSS from leaking
+    into the rest of the page when the SVG is inlined; pass one per diagram.
+    """
+    # The default parser drops comments and processing instructions
+    root = ET.fromstring(svg)
+    if scope:
+        scope = root.attrib.setdefault('id', scope)
+    strip_whitespace(root)
+    round_coordinates(root, precision)
+    collapse_groups(root)
+    css = hoist_presentation_attributes(root, scope)
+    if css:
+        style = ET.Element(f'{{{SVG_NS}}}style')
+        style.text = css
+        root.insert(0, style)
+    return serialize(root)
+
+def report_reduction(name, before, after):
+    saved = before - after
+    percent = saved / before * 100 if before else 0
+    print(f"  {name}: {before:,} -> {after:,} bytes ({saved:,} saved, {percent:.1f}%)")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(f"Usage: {sys.argv[0]} FILE.svg [FILE.svg ...]")
+        sys.exit(2)
+    for path in sys.argv[1:]:
+        with open(path, 'r', encoding='utf-8') as f:
+            svg = f.read()
+        optimized = optimize_svg(svg)
+        write_output(path, optimized)
+        report_reduction(path, len(svg.encode('utf-8')), len(optimized.encode('utf-8')))
+    report_outputs()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Rasterize diagram SVGs to PNG for the pdfkit/wkhtmltopdf converter
+
+wkhtmltopdf draws complex inline SVG slowly and not always faithfully, so the
+diagrams are turned into PNGs in a process pool (with cairosvg) and the HTML
+references the images instead. PNGs are cached by SVG content and DPI, so
+warm builds copy them from the build cache without rasterizing anything.
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from build_cache import BuildCache, cache_key
+from generate_svgs import scan_mermaid_blocks, svg_diagrams, svg_for_mermaid
+from instrument import worker_profiled
+from mermaid_svg import MermaidError
+from output_files import write_output
+from preflight import MissingDependencyError, check_requirements
+from svg_embed import external_reference
+
+# 2x the CSS pixel density: sharp on paper without huge files
+DEFAULT_DPI = 192
+
+PNG_PLACEHOLDER = "MERMAIDPNGPLACEHOLDER"
+
+def _rasterize(svg, dpi):
+    """Render one SVG document string to PNG bytes"""
+    import cairosvg
+    # SVG user units are CSS pixels (96 per inch). Only scale: passing dpi too
+    # would also grow physical units (pt, mm) and scale them twice
+    with worker_profiled():
+        return cairosvg.svg2png(bytestring=svg.encode('utf-8'), scale=dpi / 96)
+
+def _png_key(svg, dpi):
+    import cairosvg
+    return cache_key(svg, f"dpi={dpi}", f"cairosvg-{cairosvg.__version__}")
+
+def rasterize_diagrams(diagrams, output_dir, dpi=DEFAULT_DPI, workers=None, cache=None):
+    """Write {name: svg} to output_dir/<name>.png; return {name: png path}
+
+    cache is a BuildCache (default: the shared one) or False to always rasterize.
+    """
+    if cache is None:
+        cache = BuildCache()
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {name: os.path.join(output_dir, f"{name}.png") for name in diagrams}
+    keys = {name: _png_key(svg, dpi) for name, svg in diagrams.items()} if cache else {}
+
+    missing = [name for name in diagrams
+               if not (cache and cache.restore(keys[name], '.png', paths[name]))]
+    if missing:
+        workers = min(workers or os.cpu_count() or 1, len(missing))
+        print(f"Rasterizing {len(missing)} of {len(diagrams)} diagrams at {dpi} dpi with {workers} workers...")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pngs = pool.map(_rasterize, [diagrams[name] for name in missing], [dpi] * len(missing))
+            for name, png in zip(missing, pngs):
+                write_output(paths[name], png)
+                if cache:
+                    cache.put(keys[name], '.png', data=png)
+    else:
+        print(f"All {len(diagrams)} diagrams restored from cache")
+    return paths
+
+def collect_diagrams(md_content):
+    """Return ([(start, end, name)], {name: svg}) for the Mermaid blocks in md_content"""
+    blocks = []
+    diagrams = {}
+    for start, end, line, source in scan_mermaid_blocks(md_content):
+        try:
+            name, svg = svg_for_mermaid(source)
+        except MermaidError as e:
+            print(f"Warning: Mermaid block at line {line} not rasterized: {e}")
+            continue
+        blocks.append((start, end, name))
+        diagrams[name] = svg
+    return blocks, diagrams
+
+def replace_blocks_with_pngs(md_content, blocks, diagrams, paths):
+    """Swap Mermaid blocks for placeholders; return (markdown, {placeholder html: <img> html})
+
+    Placeholders survive Markdown conversion as their own paragraph and are
+    replaced afterwards with file:// references wkhtmltopdf can load.
+    """
+    parts = []
+    images = {}
+    pos = 0
+    for index, (start, end, name) in enumerate(blocks):
+        placeholder = f"{PNG_PLACEHOLDER}{index}"
+        img = external_reference(diagrams[name], Path(paths[name]).resolve().as_uri(), name)
+        images[f"<p>{placeholder}</p>"] = f'<div class="mermaid">{img}</div>'
+        parts.append(md_content[pos:start])
+        parts.append(f"\n{placeholder}\n")
+        pos = end
+    parts.append(md_content[pos:])
+    return ''.join(parts), images
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rasterize the report diagrams to PNG")
+    parser.add_argument('svgs', nargs='*', help="SVG files (default: the diagrams in generate_svgs)")
+    parser.add_argument('--output-dir', default='png-diagrams', help="where to write the PNGs")
+    parser.add_argument('--dpi', type=int, default=DEFAULT_DPI, help=f"resolution (default: {DEFAULT_DPI})")
+    parser.add_argument('--workers', type=int, help="worker processes (default: all cores)")
+    parser.add_argument('--no-cache', action='store_true', help="always rasterize, ignoring the build cache")
+    args = parser.parse_args()
+
+    try:
+        check_requirements(['cairosvg'])
+    except MissingDependencyError as e:
+        print(e)
+        sys.exit(1)
+    if args.svgs:
+        diagrams = {}
+        for path in args.svgs:
+            with open(path, 'r', encoding='utf-8') as f:
+                diagrams[os.path.splitext(os.path.basename(path))[0]] = f.read()
+    else:
+        diagrams = svg_diagrams
+    for name, path in rasterize_diagrams(diagrams, args.output_dir, args.dpi, args.workers,
+                                         False if args.no_cache else None).items():
+        print(f"Created: {path}")
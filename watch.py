@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Watch mode for the weasyprint converter
+
+Monitors the Markdown source, svg-diagrams/ and an optional stylesheet with
+inotify (falling back to polling where inotify is unavailable), debounces
+bursts of saves into one build and re-does only the work a change requires:
+
+    stylesheet changed    re-parse the CSS, re-use the converted HTML
+    markdown changed      re-convert the Markdown (Mermaid SVGs come from the cache)
+    svg-diagrams changed  swap in the edited SVGs and re-convert
+
+The HTML is written and the browser reloaded before the PDF is laid out, so
+the preview updates without waiting for weasyprint. The preview is served at
+http://127.0.0.1:PORT/ with a small live-reload script injected; the HTML
+file on disk is unchanged.
+"""
+import argparse
+import ctypes
+import ctypes.util
+import functools
+import hashlib
+import http.server
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from build_cache import BuildCache
+from convert_to_pdf_weasyprint import REQUIRED_PACKAGES, STYLESHEET, Converter
+from generate_svgs import load_svg_overrides
+from instrument import stage
+from output_files import atomic_output, report_outputs, reset_counts, write_output
+from preflight import MissingDependencyError, check_requirements
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+# Editors save in place (close-write) or write a temp file and rename it (moved-to)
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+
+EVENT_HEADER = struct.Struct('iIII')
+
+LIVE_RELOAD_SCRIPT = ('<script>new EventSource("/events").onmessage = function () '
+                      '{ location.reload(); };</script>')
+
+class InotifyWatcher:
+    """Watch directories with Linux inotify through libc (no extra packages)"""
+
+    def __init__(self, directories):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}
+        for directory in directories:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"cannot watch {directory}")
+            self.directories[wd] = directory
+
+    def wait(self, timeout=None):
+        """Block up to timeout seconds; return the set of paths that changed"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += EVENT_HEADER.size + length
+            if wd in self.directories:
+                changed.add(os.path.join(self.directories[wd], os.fsdecode(name)))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    """Fallback watcher comparing modification times"""
+
+    def __init__(self, directories, interval=0.25):
+        self.directories = list(directories)
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for directory in self.directories:
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    snapshot[path] = os.stat(path).st_mtime_ns
+                except OSError:
+                    pass
+        return snapshot
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            current = self._scan()
+            changed = {path for path in current.keys() | self.snapshot.keys()
+                       if current.get(path) != self.snapshot.get(path)}
+            self.snapshot = current
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+            time.sleep(self.interval)
+
+    def close(self):
+        pass
+
+def make_watcher(directories):
+    """Return an inotify watcher, or a polling one where inotify is unavailable"""
+    try:
+        return InotifyWatcher(directories)
+    except (OSError, AttributeError) as e:
+        print(f"inotify unavailable ({e}), polling for changes")
+        return PollingWatcher(directories)
+
+def wait_for_changes(watcher, debounce=0.2):
+    """Block until something changes, then collect events until debounce seconds pass quietly"""
+    changed = set()
+    while not changed:
+        changed = watcher.wait()
+    while True:
+        more = watcher.wait(debounce)
+        if not more:
+            return changed
+        changed |= more
+
+def _digest(path):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).digest()
+    except OSError:
+        return None
+
+class LiveReload:
+    """Serves the generated HTML with a reload script and notifies open pages"""
+
+    def __init__(self, html_file, port=8000):
+        self.html_file = html_file
+        self.generation = 0
+        self.changed = threading.Condition()
+        handler = functools.partial(_PreviewHandler, self, directory=os.path.dirname(html_file))
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/"
+
+    def reload(self):
+        with self.changed:
+            self.generation += 1
+            self.changed.notify_all()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class _PreviewHandler(http.server.SimpleHTTPRequestHandler):
+    """'/' is the report with the reload script, '/events' the reload stream, the rest static files"""
+
+    def __init__(self, live, *args, **kwargs):
+        self.live = live
+        super().__init__(*args, **kwargs)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == '/events':
+            return self._events()
+        if self.path not in ('/', '/index.html'):
+            return super().do_GET()
+        try:
+            with open(self.live.html_file, 'r', encoding='utf-8') as f:
+                page = f.read()
+        except OSError:
+            page = "<p>Waiting for the first build...</p>"
+        body = page.replace('</body>', LIVE_RELOAD_SCRIPT + '</body>', 1)
+        if LIVE_RELOAD_SCRIPT not in body:
+            body += LIVE_RELOAD_SCRIPT
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _events(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        with self.live.changed:
+            seen = self.live.generation
+        try:
+            while True:
+                with self.live.changed:
+                    self.live.changed.wait_for(lambda: self.live.generation != seen, timeout=15)
+                    current = self.live.generation
+                # A comment line every 15s keeps proxies from closing the stream
+                self.wfile.write(b"data: reload\n\n" if current != seen else b": keep-alive\n\n")
+                self.wfile.flush()
+                seen = current
+        except OSError:
+            pass
+
+class WatchSession:
+    """Incremental rebuild state for one Markdown report"""
+
+    def __init__(self, input_file, output_file, svg_dir=None, stylesheet_file=None, cache=None, live=None):
+        self.input_file = os.path.abspath(input_file)
+        self.output_file = os.path.abspath(output_file)
+        self.html_file = os.path.splitext(self.output_file)[0] + '.html'
+        self.svg_dir = svg_dir and os.path.abspath(svg_dir)
+        self.stylesheet_file = stylesheet_file and os.path.abspath(stylesheet_file)
+        self.cache = BuildCache() if cache is None else cache
+        self.live = live
+        self.converter = None
+        self.html_content = None
+        # Content hashes as of the last build; saves that do not change a file are ignored
+        self.digests = {path: _digest(path) for path in self._input_paths()}
+
+    def _input_paths(self):
+        paths = [self.input_file] + ([self.stylesheet_file] if self.stylesheet_file else [])
+        if self.svg_dir and os.path.isdir(self.svg_dir):
+            paths += [os.path.join(self.svg_dir, name) for name in os.listdir(self.svg_dir) if name.endswith('.svg')]
+        return paths
+
+    def watched_directories(self):
+        # Directories rather than files: editors that save by renaming replace the inode
+        paths = [self.input_file] + ([self.stylesheet_file] if self.stylesheet_file else [])
+        directories = {os.path.dirname(path) for path in paths}
+        if self.svg_dir and os.path.isdir(self.svg_dir):
+            directories.add(self.svg_dir)
+        return sorted(directories)
+
+    def _svg_overrides(self):
+        return load_svg_overrides(self.svg_dir)
+
+    def _content_changed(self, path):
+        digest = _digest(path)
+        if self.digests.get(path) == digest:
+            return False
+        self.digests[path] = digest
+        return True
+
+    def classify(self, changed_paths):
+        """Return which inputs actually changed: a subset of {'markdown', 'stylesheet', 'svg'}"""
+        kinds = set()
+        for path in changed_paths:
+            path = os.path.abspath(path)
+            if path == self.input_file and self._content_changed(path):
+                kinds.add('markdown')
+            elif path == self.stylesheet_file and self._content_changed(path):
+                kinds.add('stylesheet')
+            elif (self.svg_dir and os.path.dirname(path) == self.svg_dir and path.endswith('.svg')
+                  and self._content_changed(path)):
+                kinds.add('svg')
+        return kinds
+
+    def build(self, kinds=('markdown', 'stylesheet', 'svg')):
+        """Rebuild after changes to the given kinds of input; return True on success"""
+        kinds = set(kinds)
+        started = time.perf_counter()
+        try:
+            with stage('watch_build', document=self.input_file, changed=sorted(kinds)):
+                if self.converter is None or 'stylesheet' in kinds:
+                    stylesheet = STYLESHEET
+                    if self.stylesheet_file:
+                        with open(self.stylesheet_file, 'r', encoding='utf-8') as f:
+                            stylesheet = f.read()
+                    overrides = self.converter.svg_overrides if self.converter else self._svg_overrides()
+                    self.converter = Converter(stylesheet=stylesheet, cache=self.cache)
+                    self.converter.svg_overrides = overrides
+                if 'svg' in kinds:
+                    self.converter.svg_overrides = self._svg_overrides()
+                if self.html_content is None or kinds & {'markdown', 'svg'}:
+                    with open(self.input_file, 'r', encoding='utf-8') as f:
+                        self.html_content = self.converter.to_html(f.read())
+
+                reset_counts()
+                # An unchanged page is neither rewritten nor reloaded
+                if write_output(self.html_file, self.converter.html_document(self.html_content)) and self.live:
+                    self.live.reload()
+                print(f"HTML updated in {time.perf_counter() - started:.2f}s: {self.html_file}")
+
+                with atomic_output(self.output_file) as pdf_file:
+                    self.converter.write_pdf(self.html_content, pdf_file)
+            print(f"PDF updated in {time.perf_counter() - started:.2f}s: {self.output_file}")
+            report_outputs()
+            return True
+        except Exception as e:
+            print(f"Error: {e}")
+            return False
+
+def watch(input_file, output_file=None, svg_dir=None, stylesheet_file=None, port=8000, debounce=0.2,
+          cache=None, serve=True):
+    """Build once, then rebuild on every change until interrupted"""
+    output_file = output_file or os.path.splitext(input_file)[0] + '.pdf'
+    session = WatchSession(input_file, output_file, svg_dir, stylesheet_file, cache)
+    if serve:
+        session.live = LiveReload(session.html_file, port)
+        print(f"Live preview: {session.live.url}")
+    session.build()
+
+    watcher = make_watcher(session.watched_directories())
+    print(f"Watching {', '.join(session.watched_directories())} (Ctrl-C to stop)")
+    try:
+        while True:
+            kinds = session.classify(wait_for_changes(watcher, debounce))
+            if kinds:
+                print(f"Changed: {', '.join(sorted(kinds))}")
+                session.build(kinds)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        if session.live:
+            session.live.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild a report on every change with live browser reload")
+    parser.add_argument('input')
+    parser.add_argument('output', nargs='?')
+    parser.add_argument('--svg-dir', default='svg-diagrams',
+                        help="edited diagram SVGs that replace the built-in ones (default: svg-diagrams)")
+    parser.add_argument('--stylesheet', help="CSS file to use instead of the built-in stylesheet")
+    parser.add_argument('--port', type=int, default=8000, help="live preview port (default: 8000)")
+    parser.add_argument('--no-serve', action='store_true', help="do not start the live preview server")
+    parser.add_argument('--debounce', type=float, default=0.2,
+                        help="seconds of quiet before a burst of saves triggers a build (default: 0.2)")
+    parser.add_argument('--cache-dir', help="shared build cache directory (default: $REPORT_BUILD_CACHE)")
+    args = parser.parse_args()
+
+    try:
+        check_requirements(REQUIRED_PACKAGES)
+    except MissingDependencyError as e:
+        print(e)
+        sys.exit(1)
+    watch(args.input, args.output, args.svg_dir, args.stylesheet, args.port, args.debounce,
+          BuildCache(args.cache_dir), not args.no_serve)